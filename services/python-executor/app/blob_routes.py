@@ -0,0 +1,51 @@
+# blob_routes.py
+from fastapi import APIRouter, HTTPException, Request
+
+from .blob_store import BLOB_REF_KEY, BlobStore, BlobTooLarge
+from .serialization import MsgpackRoute
+
+
+def create_blob_router(store: BlobStore) -> APIRouter:
+    """
+    Endpoints de blobs, compartidos por app.main y app.main_func:
+
+    - PUT /blobs/            sube el cuerpo (bytes en bruto) y retorna su hash.
+    - GET /blobs/{hash}      metadatos (tamaño, referencias, vencimiento).
+    - GET /blobs/            lista de blobs y estadísticas.
+    - DELETE /blobs/{hash}   elimina un blob que no esté en uso.
+
+    En los parámetros de una llamada, {"$blob": "<hash>"} se recibe en la
+    función como memoryview de sólo lectura sobre el archivo (mmap).
+    """
+    router = APIRouter(route_class=MsgpackRoute)
+
+    @router.put("/blobs/", status_code=200)
+    async def upload_blob(request: Request):
+        try:
+            blob_hash, size, created = await store.put_stream(request.stream())
+        except BlobTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        return {"hash": blob_hash, "size": size, "created": created, "ref": {BLOB_REF_KEY: blob_hash}}
+
+    @router.get("/blobs/", status_code=200)
+    async def list_blobs():
+        return {"blobs": store.list_blobs(), "stats": store.stats()}
+
+    @router.get("/blobs/{blob_hash}", status_code=200)
+    async def blob_info(blob_hash: str):
+        info = store.info(blob_hash)
+        if info is None:
+            raise HTTPException(status_code=404, detail="Blob no encontrado.")
+        return info
+
+    @router.delete("/blobs/{blob_hash}", status_code=200)
+    async def delete_blob(blob_hash: str):
+        try:
+            deleted = store.delete(blob_hash)
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Blob no encontrado.")
+        return {"status": f"Blob {blob_hash} eliminado exitosamente."}
+
+    return router
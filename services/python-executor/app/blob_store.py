@@ -0,0 +1,330 @@
+# blob_store.py
+import asyncio
+import hashlib
+import mmap
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+# Directorio donde se guardan los blobs (un archivo por hash SHA-256).
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "blobs")
+# Segundos sin uso tras los cuales un blob sin referencias se elimina.
+BLOB_TTL = float(os.environ.get("BLOB_TTL", "3600"))
+# Cada cuánto se ejecuta la recolección de blobs vencidos.
+BLOB_GC_INTERVAL = float(os.environ.get("BLOB_GC_INTERVAL", "60"))
+# Tamaño máximo de un blob en bytes (0 = sin límite).
+BLOB_MAX_BYTES = int(os.environ.get("BLOB_MAX_BYTES", "0"))
+
+# Clave de las referencias en los parámetros: {"$blob": "<hash>"}
+BLOB_REF_KEY = "$blob"
+
+_HASH_LENGTH = 64
+
+
+class BlobNotFound(KeyError):
+    """La referencia apunta a un blob que no existe (o ya fue recolectado)."""
+
+
+class BlobTooLarge(ValueError):
+    """El blob subido supera BLOB_MAX_BYTES."""
+
+
+class BlobRef:
+    """
+    Referencia ya validada a un blob. Es lo que viaja en los parámetros hasta
+    el punto de ejecución (también a otros procesos: sólo contiene la ruta),
+    donde materialize_blob_refs la sustituye por un memoryview del archivo.
+    """
+
+    __slots__ = ("hash", "path", "size")
+
+    def __init__(self, blob_hash: str, path: str, size: int):
+        self.hash = blob_hash
+        self.path = path
+        self.size = size
+
+    def __reduce__(self):
+        return (BlobRef, (self.hash, self.path, self.size))
+
+    def __repr__(self) -> str:
+        # Sin la ruta: sólo identifica el contenido.
+        return f"BlobRef({self.hash})"
+
+
+def open_blob(ref: BlobRef) -> memoryview:
+    """
+    memoryview de sólo lectura sobre el archivo mapeado en memoria. No copia
+    los datos; el mapeo se cierra cuando deja de haber referencias a la vista.
+    """
+    if ref.size == 0:
+        return memoryview(b"")
+    with open(ref.path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped)
+
+
+def materialize_blob_refs(value: Any) -> Any:
+    """
+    Sustituye los BlobRef de 'value' por memoryviews. Los contenedores sin
+    referencias se retornan tal cual (sin copiarlos).
+    """
+    if isinstance(value, BlobRef):
+        return open_blob(value)
+    if isinstance(value, dict):
+        changed = None
+        for key, item in value.items():
+            new_item = materialize_blob_refs(item)
+            if new_item is not item:
+                if changed is None:
+                    changed = dict(value)
+                changed[key] = new_item
+        return value if changed is None else changed
+    if isinstance(value, list):
+        changed = None
+        for index, item in enumerate(value):
+            new_item = materialize_blob_refs(item)
+            if new_item is not item:
+                if changed is None:
+                    changed = list(value)
+                changed[index] = new_item
+        return value if changed is None else changed
+    return value
+
+
+def _is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and BLOB_REF_KEY in value
+
+
+class _BlobEntry:
+    __slots__ = ("size", "created", "last_used", "refs")
+
+    def __init__(self, size: int, created: float):
+        self.size = size
+        self.created = created
+        self.last_used = created
+        self.refs = 0
+
+
+class BlobStore:
+    """
+    Almacén de blobs direccionados por contenido (SHA-256) en disco local.
+
+    - put_stream(): guarda el cuerpo de una subida; si el hash ya existe no
+      se duplica.
+    - resolve_refs(): valida las referencias {"$blob": hash} de unos
+      parámetros, las cambia por BlobRef y suma una referencia a cada blob.
+      release() la devuelve al terminar la llamada.
+    - collect(): borra los blobs sin referencias que no se usan desde hace
+      más de 'ttl' segundos.
+    """
+
+    def __init__(self, directory: str = BLOB_STORE_DIR, ttl: float = BLOB_TTL, max_bytes: int = BLOB_MAX_BYTES):
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._blobs: Dict[str, _BlobEntry] = {}
+        self._lock = threading.Lock()
+        self._collected = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self) -> None:
+        # Los blobs de ejecuciones anteriores siguen disponibles (con TTL desde ahora).
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif len(name) == _HASH_LENGTH:
+                self._blobs[name] = _BlobEntry(os.path.getsize(path), now)
+
+    def path_for(self, blob_hash: str) -> str:
+        return os.path.join(self.directory, blob_hash)
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int, bool]:
+        """
+        Guarda los bytes recibidos y retorna (hash, tamaño, creado). Se
+        escribe en un temporal y se renombra: nunca hay blobs a medias.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(self.directory, f"{uuid.uuid4().hex}.tmp")
+        # La E/S de disco va a hilos: el event loop sólo recibe y hashea los chunks.
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if self.max_bytes and size > self.max_bytes:
+                        raise BlobTooLarge(f"El blob supera el máximo de {self.max_bytes} bytes.")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            blob_hash = digest.hexdigest()
+            created = await asyncio.to_thread(self._commit, tmp_path, blob_hash, size)
+            return blob_hash, size, created
+        finally:
+            await asyncio.to_thread(self._remove_tmp, tmp_path)
+
+    def _commit(self, tmp_path: str, blob_hash: str, size: int) -> bool:
+        # Registra el blob recién escrito; retorna False si ya existía.
+        with self._lock:
+            entry = self._blobs.get(blob_hash)
+            if entry is not None:
+                entry.last_used = time.time()
+                return False
+            os.replace(tmp_path, self.path_for(blob_hash))
+            self._blobs[blob_hash] = _BlobEntry(size, time.time())
+            return True
+
+    @staticmethod
+    def _remove_tmp(tmp_path: str) -> None:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def info(self, blob_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._lookup(blob_hash)
+        if entry is None:
+            return None
+        return {
+            "hash": blob_hash,
+            "size": entry.size,
+            "refs": entry.refs,
+            "created": entry.created,
+            "last_used": entry.last_used,
+            "expires_in": None if entry.refs else max(0.0, entry.last_used + self.ttl - time.time()),
+        }
+
+    def list_blobs(self) -> List[Dict[str, Any]]:
+        # Copia del registro bajo el lock: otros hilos lo modifican (release, gc...).
+        with self._lock:
+            blob_hashes = list(self._blobs)
+        infos = (self.info(blob_hash) for blob_hash in blob_hashes)
+        return [info for info in infos if info is not None]
+
+    def delete(self, blob_hash: str) -> bool:
+        """
+        Elimina un blob. Retorna False si no existe; lanza RuntimeError si
+        hay llamadas usándolo.
+        """
+        with self._lock:
+            entry = self._blobs.get(blob_hash)
+            if entry is None:
+                return False
+            if entry.refs:
+                raise RuntimeError(f"El blob {blob_hash} está en uso ({entry.refs} referencias).")
+            self._remove(blob_hash)
+        return True
+
+    def _remove(self, blob_hash: str) -> None:
+        del self._blobs[blob_hash]
+        try:
+            # Los mapeos abiertos siguen siendo válidos tras borrar el archivo.
+            os.remove(self.path_for(blob_hash))
+        except FileNotFoundError:
+            pass
+
+    # ---------- Referencias ----------
+
+    def resolve_refs(self, params: Any) -> Tuple[Any, List[str]]:
+        """
+        Cambia cada {"$blob": hash} por un BlobRef y adquiere una referencia.
+        Retorna (parámetros, hashes adquiridos). Lanza BlobNotFound si alguno
+        no existe (sin dejar referencias adquiridas).
+        """
+        acquired: List[str] = []
+        try:
+            resolved = self._resolve(params, acquired)
+        except BlobNotFound:
+            self.release(acquired)
+            raise
+        return resolved, acquired
+
+    def _resolve(self, value: Any, acquired: List[str]) -> Any:
+        if isinstance(value, dict):
+            if _is_ref(value):
+                return self._acquire(value[BLOB_REF_KEY], acquired)
+            changed = None
+            for key, item in value.items():
+                new_item = self._resolve(item, acquired)
+                if new_item is not item:
+                    if changed is None:
+                        changed = dict(value)
+                    changed[key] = new_item
+            return value if changed is None else changed
+        if isinstance(value, list):
+            changed = None
+            for index, item in enumerate(value):
+                new_item = self._resolve(item, acquired)
+                if new_item is not item:
+                    if changed is None:
+                        changed = list(value)
+                    changed[index] = new_item
+            return value if changed is None else changed
+        return value
+
+    def _lookup(self, blob_hash: Any) -> Optional[_BlobEntry]:
+        # El directorio puede compartirse entre procesos (modo scale-out): los
+        # blobs subidos por otro proceso se descubren al referenciarlos y los
+        # que otro proceso borró se olvidan.
+        if not isinstance(blob_hash, str) or len(blob_hash) != _HASH_LENGTH or not blob_hash.isalnum():
+            return None
+        entry = self._blobs.get(blob_hash)
+        try:
+            size = os.path.getsize(self.path_for(blob_hash))
+        except OSError:
+            if entry is not None and not entry.refs:
+                del self._blobs[blob_hash]
+            return None
+        if entry is None:
+            entry = self._blobs[blob_hash] = _BlobEntry(size, time.time())
+        return entry
+
+    def _acquire(self, blob_hash: Any, acquired: List[str]) -> BlobRef:
+        with self._lock:
+            entry = self._lookup(blob_hash)
+            if entry is None:
+                raise BlobNotFound(blob_hash)
+            entry.refs += 1
+            entry.last_used = time.time()
+        acquired.append(blob_hash)
+        return BlobRef(blob_hash, self.path_for(blob_hash), entry.size)
+
+    def release(self, hashes: Iterable[str]) -> None:
+        with self._lock:
+            now = time.time()
+            for blob_hash in hashes:
+                entry = self._blobs.get(blob_hash)
+                if entry is not None:
+                    entry.refs -= 1
+                    entry.last_used = now
+
+    # ---------- Recolección ----------
+
+    def collect(self) -> List[str]:
+        """
+        Borra los blobs sin referencias vencidos. Retorna sus hashes.
+        """
+        deadline = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                blob_hash for blob_hash, entry in self._blobs.items()
+                if entry.refs == 0 and entry.last_used < deadline
+            ]
+            for blob_hash in expired:
+                self._remove(blob_hash)
+            self._collected += len(expired)
+        return expired
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "blobs": len(self._blobs),
+                "bytes": sum(entry.size for entry in self._blobs.values()),
+                "referenced": sum(1 for entry in self._blobs.values() if entry.refs),
+                "collected": self._collected,
+            }
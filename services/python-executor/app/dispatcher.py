@@ -0,0 +1,286 @@
+# dispatcher.py
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .timeouts import SCRIPT_TIMEOUT_GRACE, CallTimeout, clear_interrupt, interrupt_thread
+
+# Hilos disponibles para funciones síncronas de usuario.
+DISPATCH_MAX_WORKERS = int(os.environ.get("DISPATCH_MAX_WORKERS", "32"))
+# Llamadas síncronas simultáneas permitidas por script (o por módulo de sesión).
+DISPATCH_PER_SCRIPT_LIMIT = int(os.environ.get("DISPATCH_PER_SCRIPT_LIMIT", "4"))
+# Máximo de llamadas en cola antes de rechazar con 503 (0 = sin límite).
+DISPATCH_MAX_QUEUE = int(os.environ.get("DISPATCH_MAX_QUEUE", "0"))
+# Llamadas máximas en una petición de /call-script-batch/ o /execute-batch/ (0 = sin límite).
+BATCH_MAX_CALLS = int(os.environ.get("BATCH_MAX_CALLS", "256"))
+
+
+# Tipos de llamada (ver call_kind).
+CALL_ASYNC = "async"
+CALL_STREAM = "stream"
+CALL_SYNC = "sync"
+
+
+def call_kind(fn: Callable) -> str:
+    """
+    Clasifica una función según cómo la ejecuta el dispatcher. Se puede
+    calcular una vez y pasar a dispatch(kind=...) para no inspeccionarla
+    en cada llamada.
+    """
+    if inspect.iscoroutinefunction(fn):
+        return CALL_ASYNC
+    if inspect.isgeneratorfunction(fn) or inspect.isasyncgenfunction(fn):
+        return CALL_STREAM
+    return CALL_SYNC
+
+
+class DispatcherOverloaded(Exception):
+    """
+    La cola del dispatcher está llena; la llamada se rechaza sin ejecutarse.
+    """
+    pass
+
+
+class CallDispatcher:
+    """
+    Despacha funciones de usuario sin bloquear el event loop:
+    - las funciones async se esperan directamente,
+    - las síncronas se ejecutan en un pool de hilos acotado, con un límite
+      de concurrencia por clave (script o módulo),
+    opcionalmente con un timeout por llamada (ver dispatch).
+    Lleva estadísticas de profundidad de cola y tiempo de espera.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DISPATCH_MAX_WORKERS,
+        per_script_limit: int = DISPATCH_PER_SCRIPT_LIMIT,
+        max_queue: int = DISPATCH_MAX_QUEUE,
+    ):
+        self.max_workers = max_workers
+        self.per_script_limit = per_script_limit
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="script-call")
+        # clave -> [semáforo, llamadas que lo usan, límite]
+        self._semaphores: Dict[str, List[Any]] = {}
+
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # Hilos que siguieron ejecutando tras vencer el timeout y el margen.
+        self.abandoned = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _acquire_semaphore(self, key: str, limit: Optional[int]) -> asyncio.Semaphore:
+        limit = limit or self.per_script_limit
+        entry = self._semaphores.get(key)
+        if entry is None:
+            entry = [asyncio.Semaphore(limit), 0, limit]
+            self._semaphores[key] = entry
+        elif entry[2] != limit:
+            # El semáforo lo dimensiona la primera llamada: todas las de una
+            # clave deben pasar el mismo límite.
+            raise ValueError(f"Límite {limit} distinto del de las llamadas en curso de '{key}' ({entry[2]}).")
+        entry[1] += 1
+        return entry[0]
+
+    def _release_semaphore(self, key: str) -> None:
+        entry = self._semaphores[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._semaphores[key]
+
+    def _run(self, call_state: Dict[str, Any], fn: Callable, params: Dict[str, Any]) -> Any:
+        wait = time.perf_counter() - call_state["enqueued_at"]
+        with self._stats_lock:
+            if call_state["dequeued"]:
+                # La llamada se canceló antes de arrancar.
+                raise asyncio.CancelledError()
+            call_state["dequeued"] = True
+            call_state["thread"] = threading.get_ident()
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+        try:
+            try:
+                return fn(**params)
+            finally:
+                # Se sale de la región interrumpible: bajo el lock ya no se
+                # lanzan interrupciones y se descarta el CallTimeout que haya
+                # quedado pendiente si fn terminó antes de recibirlo.
+                self._leave_interruptible(call_state)
+        finally:
+            # Sólo hay una interrupción por llamada: si llegó en el bloque
+            # anterior ya se consumió, así que este bloque siempre se completa.
+            self._leave_interruptible(call_state)
+            with self._stats_lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _leave_interruptible(self, call_state: Dict[str, Any]) -> None:
+        with self._stats_lock:
+            call_state["finished"] = True
+            if call_state["interrupted"]:
+                clear_interrupt(call_state["thread"])
+
+    async def _await_async(self, awaitable: Any, timeout: Optional[float]) -> Any:
+        if not timeout:
+            return await awaitable
+        task = asyncio.ensure_future(awaitable)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if done:
+            return task.result()
+        # Cancelación limpia: la corrutina recibe CancelledError y ejecuta sus finally.
+        task.cancel()
+        await asyncio.wait({task}, timeout=SCRIPT_TIMEOUT_GRACE)
+        with self._stats_lock:
+            self.timeouts += 1
+        raise CallTimeout(timeout)
+
+    async def _expire(self, call_state: Dict[str, Any], future: asyncio.Future, timeout: float) -> None:
+        """
+        Vence el timeout de una llamada síncrona: si aún no arrancó no se
+        ejecutará; si está en curso se interrumpe su hilo (ver
+        interrupt_thread) y se espera SCRIPT_TIMEOUT_GRACE a que termine.
+        """
+        with self._stats_lock:
+            self.timeouts += 1
+            if not call_state["dequeued"]:
+                call_state["dequeued"] = True
+                self.queued -= 1
+            elif not call_state["finished"]:
+                call_state["interrupted"] = True
+                interrupt_thread(call_state["thread"])
+        done, _ = await asyncio.wait({future}, timeout=SCRIPT_TIMEOUT_GRACE)
+        if done:
+            if not future.cancelled():
+                future.exception()
+        else:
+            with self._stats_lock:
+                self.abandoned += 1
+        raise CallTimeout(timeout)
+
+    async def dispatch(
+        self,
+        key: str,
+        fn: Callable,
+        params: Dict[str, Any],
+        limit: Optional[int] = None,
+        kind: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Ejecuta fn(**params) y retorna su resultado.
+        'key' agrupa las llamadas que comparten el límite de concurrencia;
+        todas las de una clave deben pasar el mismo 'limit' (ValueError si no).
+        'kind' es el call_kind(fn) ya calculado, si se conoce.
+        'timeout' (segundos, incluye la espera en cola) lanza CallTimeout al
+        vencer: las async se cancelan y las síncronas se interrumpen. No
+        aplica a los generadores (ver streaming).
+        """
+        if kind is None:
+            kind = call_kind(fn)
+        if kind == CALL_ASYNC:
+            return await self._await_async(fn(**params), timeout)
+        if kind == CALL_STREAM:
+            # Crear el generador no ejecuta código de usuario; se itera después.
+            return fn(**params)
+
+        semaphore = self._acquire_semaphore(key, limit)
+        with self._stats_lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.rejected += 1
+                self._release_semaphore(key)
+                raise DispatcherOverloaded(f"Cola de ejecución llena ({self.queued} llamadas en espera).")
+            self.queued += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        call_state = {
+            "enqueued_at": time.perf_counter(),
+            "dequeued": False,
+            "thread": None,
+            "finished": False,
+            "interrupted": False,
+        }
+        future = None
+        try:
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                with self._stats_lock:
+                    self.timeouts += 1
+                raise CallTimeout(timeout) from None
+            ctx = contextvars.copy_context()
+            future = loop.run_in_executor(
+                self._executor, functools.partial(ctx.run, self._run, call_state, fn, params)
+            )
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                done, _ = await asyncio.wait({future}, timeout=remaining)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            if not done:
+                await self._expire(call_state, future, timeout)
+            result = future.result()
+        finally:
+            if future is None:
+                self._release_semaphore(key)
+            else:
+                # El hilo ocupa su lugar del límite por script hasta que termina
+                # de verdad (aunque la llamada ya haya vencido).
+                def release(done_future: asyncio.Future, key: str = key) -> None:
+                    if not done_future.cancelled():
+                        done_future.exception()
+                    semaphore.release()
+                    self._release_semaphore(key)
+                future.add_done_callback(release)
+            with self._stats_lock:
+                if not call_state["dequeued"]:
+                    # Cancelada antes de llegar a ejecutarse en un hilo.
+                    call_state["dequeued"] = True
+                    self.queued -= 1
+
+        # Funciones síncronas que devuelven un awaitable (p.ej. decoradas).
+        if inspect.isawaitable(result):
+            remaining = None if deadline is None else max(0.001, deadline - loop.time())
+            result = await self._await_async(result, remaining)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            started = self.completed + self.running
+            return {
+                "max_workers": self.max_workers,
+                "per_script_limit": self.per_script_limit,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "abandoned": self.abandoned,
+                "avg_wait_ms": (self.total_wait / started * 1000) if started else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "scripts_active": len(self._semaphores),
+            }
+
+
+# Instancia compartida por los endpoints.
+dispatcher = CallDispatcher()
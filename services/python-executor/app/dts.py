@@ -0,0 +1,42 @@
+# dts.py
+import inspect
+
+from .function_table import is_exposed_name
+from .signatures import signature_for
+
+
+def generate_dts_string(module_name: str, cls: type) -> str:
+    """
+    Genera un string representando un archivo `.d.ts` basado en una clase y sus métodos.
+    """
+
+    dts_lines = [f'declare module "{module_name}" {{']
+
+    class_name = cls.__name__
+    class_doc = inspect.getdoc(cls) or ""
+    dts_lines.append(f"  /**")
+    dts_lines.append(f"   * {class_doc}")
+    dts_lines.append(f"   */")
+    dts_lines.append(f"  class {class_name} {{")
+
+    # Obtener los métodos que se pueden llamar (los de la tabla de despacho)
+    for method_name, method in inspect.getmembers(cls, predicate=inspect.isfunction):
+        if not is_exposed_name(method_name):
+            # Privados y onLoad/onDestroy no se pueden llamar desde /execute.
+            continue
+        method_doc = inspect.getdoc(method) or ""
+        # Misma firma cacheada que valida las llamadas (ver signatures.py).
+        static = isinstance(inspect.getattr_static(cls, method_name, None), staticmethod)
+        signature = signature_for(method, bound=not static)
+        declaration = signature.dts(method_name) if signature is not None else f"{method_name}(args: {{  }}): any;"
+
+        dts_lines.append(f"    /**")
+        dts_lines.append(f"     * {method_doc}")
+        dts_lines.append(f"     */")
+        dts_lines.append(f"    {declaration}")
+
+    # Cerrar definición de la clase
+    dts_lines.append("  }")
+    dts_lines.append("}")
+
+    return "\n".join(dts_lines)
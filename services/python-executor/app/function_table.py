@@ -0,0 +1,97 @@
+# function_table.py
+import inspect
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .dispatcher import call_kind
+from .metrics import CallMetrics, call_metrics
+from .signatures import FunctionSignature, signature_for
+from .timeouts import declared_timeout
+
+
+class SessionFunction:
+    """
+    Entrada de la tabla de despacho de una sesión: método ya enlazado a su
+    instancia, tipo de llamada (ver dispatcher.call_kind), firma con su
+    validador precompilado (ver signatures.signature_for), timeout declarado
+    (ver timeouts.declared_timeout) y métricas ya enlazadas (etiqueta
+    script="session:<módulo>").
+    """
+
+    __slots__ = ("module_name", "method", "kind", "signature", "timeout", "metrics")
+
+    def __init__(
+        self,
+        name: str,
+        module_name: str,
+        method: Callable,
+        kind: str,
+        signature: Optional[FunctionSignature],
+        timeout: Optional[float] = None,
+    ):
+        self.module_name = module_name
+        self.method = method
+        self.kind = kind
+        self.signature = signature
+        self.timeout = timeout
+        self.metrics: CallMetrics = call_metrics(f"session:{module_name}", name)
+
+
+# Métodos del ciclo de vida del módulo: los llama el servidor, no los clientes.
+LIFECYCLE_HOOKS = frozenset({"onLoad", "onDestroy"})
+
+
+def is_exposed_name(name: str) -> bool:
+    """
+    Si un método con ese nombre se puede llamar desde /execute (y aparece
+    en el `.d.ts`): no los privados (_x), ni dunder, ni los del ciclo de vida.
+    """
+    return not name.startswith("_") and name not in LIFECYCLE_HOOKS
+
+
+def _bound_functions(instance: Any) -> Iterator[Tuple[str, Callable]]:
+    # Se inspecciona la clase con getattr_static: no se ejecutan properties ni
+    # __getattr__, y sólo se enlazan funciones, staticmethods y classmethods.
+    cls = type(instance)
+    for name in dir(cls):
+        if not is_exposed_name(name):
+            continue
+        attr = inspect.getattr_static(cls, name)
+        if isinstance(attr, (staticmethod, classmethod)) or inspect.isfunction(attr):
+            yield name, attr.__get__(instance, cls)
+
+
+def build_function_table(
+    instances: Dict[str, Any]
+) -> Tuple[Dict[str, SessionFunction], Dict[str, List[str]]]:
+    """
+    Construye la tabla nombre de función -> SessionFunction a partir de las
+    instancias de los módulos de una sesión (en orden de carga). Sólo entran
+    los métodos públicos definidos en la clase (ver is_exposed_name).
+    Si varios módulos exponen la misma función gana el primero, como en la
+    búsqueda original; las colisiones se retornan como {función: [módulos]}.
+    """
+    table: Dict[str, SessionFunction] = {}
+    owners: Dict[str, List[str]] = {}
+    for module_name, instance in instances.items():
+        for name, method in _bound_functions(instance):
+            owners.setdefault(name, []).append(module_name)
+            if name not in table:
+                table[name] = SessionFunction(
+                    name,
+                    module_name,
+                    method,
+                    call_kind(method),
+                    signature_for(method),
+                    declared_timeout(instance, name),
+                )
+
+    collisions = {name: modules for name, modules in owners.items() if len(modules) > 1}
+    return table, collisions
+
+
+def describe_functions(table: Dict[str, SessionFunction]) -> Dict[str, Dict[str, Any]]:
+    """
+    JSON Schema de parámetros y retorno de cada función de la tabla
+    (cacheado en su firma: no se recalcula).
+    """
+    return {name: entry.signature.describe() for name, entry in table.items() if entry.signature is not None}
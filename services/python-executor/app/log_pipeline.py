@@ -0,0 +1,157 @@
+# log_pipeline.py
+import copy
+import logging
+import os
+import queue
+import random
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+
+# Entradas que conserva el buffer en memoria que sirve /logs/.
+LOG_RING_BUFFER_SIZE = int(os.environ.get("LOG_RING_BUFFER_SIZE", "5000"))
+# Fracción (0..1) de los logs de llamadas exitosas que se registran.
+LOG_CALL_SAMPLE_RATE = float(os.environ.get("LOG_CALL_SAMPLE_RATE", "1.0"))
+# Longitud máxima de parámetros/resultados dentro de un mensaje de log.
+LOG_MAX_FIELD_LENGTH = int(os.environ.get("LOG_MAX_FIELD_LENGTH", "512"))
+
+# extra=SAMPLED marca un log de alto volumen sujeto a LOG_CALL_SAMPLE_RATE.
+SAMPLED = {"sampled": True}
+
+
+class Truncated:
+    """
+    Envuelve un valor para un argumento de log: el repr se calcula (y se
+    recorta) sólo si el registro pasa el nivel y el muestreo.
+
+        logger.info("Resultado: %s", Truncated(result))
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_MAX_FIELD_LENGTH):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = repr(self.value)
+        if self.limit and len(text) > self.limit:
+            return f"{text[:self.limit]}... ({len(text)} chars)"
+        return text
+
+    __repr__ = __str__
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Deja pasar sólo una fracción de los registros marcados con extra=SAMPLED.
+    Los demás registros (errores, avisos, etc.) pasan siempre.
+    """
+
+    def __init__(self, rate: float = LOG_CALL_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Guarda los últimos 'capacity' registros en memoria con un número de
+    secuencia creciente, para leerlos por cursor (ver read).
+    """
+
+    def __init__(self, capacity: int = LOG_RING_BUFFER_SIZE, level: int = logging.NOTSET):
+        super().__init__(level)
+        self._entries: deque = deque(maxlen=capacity)
+        self._next_seq = 1
+        self._buffer_lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            entry = {
+                "time": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            with self._buffer_lock:
+                entry["seq"] = self._next_seq
+                self._next_seq += 1
+                self._entries.append(entry)
+        except Exception:
+            self.handleError(record)
+
+    def read(self, cursor: int = 0, limit: int = 100, level: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retorna hasta 'limit' registros con seq > cursor, más 'next_cursor'
+        para la siguiente lectura. 'missed' indica cuántos registros
+        posteriores al cursor ya se descartaron del buffer.
+        """
+        min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(min_level, int):
+            min_level = logging.NOTSET
+
+        with self._buffer_lock:
+            if cursor >= self._next_seq:
+                # Cursor de una ejecución anterior del servidor.
+                cursor = 0
+            oldest = self._entries[0]["seq"] if self._entries else self._next_seq
+            missed = max(0, oldest - cursor - 1)
+            # Las secuencias son consecutivas: se salta directamente al cursor.
+            start = max(0, cursor - oldest + 1)
+            entries: List[Dict[str, Any]] = []
+            next_cursor = cursor
+            for index in range(start, len(self._entries)):
+                entry = self._entries[index]
+                next_cursor = entry["seq"]
+                if min_level and logging.getLevelName(entry["level"]) < min_level:
+                    continue
+                entries.append(entry)
+                if len(entries) >= limit:
+                    break
+            else:
+                next_cursor = max(next_cursor, self._next_seq - 1)
+
+        return {"entries": entries, "next_cursor": next_cursor, "missed": missed}
+
+
+class _InProcessQueueHandler(QueueHandler):
+    """
+    QueueHandler que al encolar sólo construye el mensaje (msg % args, con
+    los Truncated ya recortados): los argumentos pueden cambiar después de
+    la llamada. El formateo (fecha, nivel, traceback) queda para el hilo del
+    listener, fuera del event loop; la cola es del mismo proceso, así que
+    exc_info se conserva.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_queue_logging(logger: logging.Logger, handlers: List[logging.Handler]) -> QueueListener:
+    """
+    Sustituye los handlers de 'logger' por un QueueHandler: las llamadas a
+    logger.* sólo encolan el registro y un hilo (QueueListener) lo entrega a
+    'handlers'. El muestreo se aplica antes de encolar.
+    Retorna el listener ya iniciado (llamar a stop() al apagar).
+    """
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _InProcessQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -3,27 +3,55 @@ from pydantic import BaseModel
 import uuid  # Para generar IDs únicos de sesión
 import importlib.util
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import shutil
 import logging
 from logging.handlers import RotatingFileHandler
 import asyncio  # Importación añadida
+import time
 from datetime import datetime  # Importación añadida
 import json
-import inspect
 import hashlib
-import importlib.util
-import tempfile
-import os
+import itertools
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Any
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 import os
 from fastapi.templating import Jinja2Templates
 
+from .script_loader import load_script_module, script_content_hash
+from .dispatcher import BATCH_MAX_CALLS, DispatcherOverloaded, dispatcher
+from .function_table import build_function_table, describe_functions
+from .streaming import collect_stream, is_stream, stream_response
+from .preload import PRELOAD_PACKAGES, PRELOAD_TIMINGS, preload_packages
+from .storage_inmemory import InMemoryScriptStorage
+from .dts import generate_dts_string
+from .process_pool import ScriptWorkerError
+from .session_worker import SESSION_ISOLATION, RemoteModule, SessionWorker, load_module_class
+from .log_pipeline import SAMPLED, RingBufferHandler, Truncated, setup_queue_logging
+from .metrics import SCRIPT_CALL_TIMEOUTS, SCRIPT_CALLS_IN_FLIGHT, UNKNOWN_LABEL, call_metrics, register_gauge, register_stats, render_metrics
+from .script_loader import code_cache_stats
+from .profiling import CallProfiler, parse_profile_modes
+from .serialization import FastResponse, MsgpackRoute, SerializationMiddleware
+from .blob_store import BLOB_GC_INTERVAL, BlobNotFound, BlobStore, materialize_blob_refs
+from .blob_routes import create_blob_router
+from .timeouts import CallTimeout, declared_timeout, resolve_timeout
+from .signatures import InvalidParameters, validate_params
+from .session_reaper import (
+    SESSION_IDLE_TTL,
+    SESSION_MEMORY_LIMIT,
+    SESSION_REAPER_INTERVAL,
+    SESSION_SPILL_AFTER,
+    discard_spill,
+    estimate_size,
+    process_rss,
+    restore_instances,
+    spill_instances,
+)
+
 # Configuración de Logging
 logger = logging.getLogger("fastapi_app")
 logger.setLevel(logging.DEBUG)  # Establece el nivel mínimo de severidad
@@ -43,19 +71,26 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
-# Añadir manejadores al logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Buffer en memoria de los últimos registros
+log_buffer = RingBufferHandler()
 
-app = FastAPI()
+# Los logger.* sólo encolan; un hilo escribe en archivo, consola y buffer
+log_listener = setup_queue_logging(logger, [file_handler, console_handler, log_buffer])
 
-# Diccionario en memoria para almacenar tanto el contenido como el módulo ya importado
-# Estructura:
-# scripts_map[hash_md5] = {
-#   "content": str,   # el contenido del script
-#   "module": Module, # referencia al módulo ya importado (o None si aún no se importó)
-# }
-scripts_map = {}
+app = FastAPI(default_response_class=FastResponse)
+# Accept/Content-Type: application/msgpack (ver serialization.py)
+app.add_middleware(SerializationMiddleware)
+app.router.route_class = MsgpackRoute
+
+# Almacenamiento en memoria del contenido y del módulo ya importado de cada script.
+# Acotado por SCRIPT_STORAGE_MAX_* con desalojo LRU; los módulos desalojados se
+# recargan al volver a pedirlos.
+script_storage = InMemoryScriptStorage(loader=load_script_module)
+
+# Blobs direccionados por contenido: {"$blob": hash} en los parámetros (ver blob_routes.py)
+blob_store = BlobStore()
+blob_gc_task: Optional[asyncio.Task] = None
+app.include_router(create_blob_router(blob_store))
 logger.debug("Aplicación FastAPI inicializada.")
 
 # Directorio base para almacenar los módulos de cada sesión
@@ -64,9 +99,22 @@ BASE_MODULES_DIR = "./modules"
 # Crear el directorio base si no existe
 if not os.path.exists(BASE_MODULES_DIR):
     os.makedirs(BASE_MODULES_DIR)
-    logger.debug(f"Creado directorio base para módulos: {BASE_MODULES_DIR}")
+    logger.debug("Creado directorio base para módulos: %s", BASE_MODULES_DIR)
 else:
-    logger.debug(f"Directorio base para módulos ya existe: {BASE_MODULES_DIR}")
+    logger.debug("Directorio base para módulos ya existe: %s", BASE_MODULES_DIR)
+
+@app.on_event("startup")
+async def preload_heavy_packages():
+    """
+    Importa una sola vez los paquetes de PRELOAD_PACKAGES para que los
+    módulos de las sesiones no paguen ese tiempo en su primera carga.
+    """
+    if not PRELOAD_PACKAGES:
+        return
+    await asyncio.to_thread(preload_packages, PRELOAD_PACKAGES)
+    for name, timing in PRELOAD_TIMINGS.items():
+        logger.info("Precarga de %s: %.3fs (ok=%s)", name, timing['seconds'], timing['ok'])
+
 
 # Modelos de datos
 
@@ -91,6 +139,8 @@ class UploadModulesRequest(BaseModel):
 class ExecutionRequest(BaseModel):
     function: str
     params: Dict[str, Any]
+    # Segundos; si no se indica, el declarado por el módulo o SCRIPT_CALL_TIMEOUT.
+    timeout: Optional[float] = None
 
 
 class CloseSessionRequest(BaseModel):
@@ -99,102 +149,92 @@ class CloseSessionRequest(BaseModel):
 
 # Manejador de sesiones en memoria
 sessions = {}
+# Lock del registro de sesiones: sólo se retiene para consultar/modificar 'sessions'.
 session_lock = asyncio.Lock()
+# Versión del registro: cambia con cada alta, cierre o subida de módulos y
+# forma el ETag de "/" (junto con un id por arranque del proceso).
+sessions_version = 0
+SERVER_BOOT_ID = uuid.uuid4().hex[:8]
+# Contadores del reaper de sesiones (ver reap_sessions), expuestos en /metrics
+reaper_counts = {"reaped": 0, "evicted": 0, "spilled": 0, "restored": 0}
+session_reaper_task: Optional[asyncio.Task] = None
+# Sesiones por página en "/" cuando no se indica 'limit'.
+STATUS_PAGE_SIZE = int(os.environ.get("STATUS_PAGE_SIZE", "100"))
 
+register_gauge("active_sessions", "Sesiones abiertas.", lambda: len(sessions))
+register_stats("dispatcher", dispatcher.stats, counters=("completed", "rejected", "timeouts", "abandoned"))
+register_stats("code_cache", code_cache_stats, counters=("hits", "misses"))
+register_stats("script_storage", script_storage.stats, counters=("module_hits", "module_misses"))
+register_stats("blob_store", blob_store.stats, counters=("collected",))
+register_stats("session_reaper", lambda: dict(reaper_counts), counters=("reaped", "evicted", "spilled", "restored"))
 
-def generate_dts_string(module_name: str, cls: type) -> str:
-    """
-    Genera un string representando un archivo `.d.ts` basado en una clase y sus métodos.
-    """
-
-    def python_to_ts_type(py_type: Any) -> str:
-        """Convierte un tipo de Python a TypeScript."""
-        if py_type in [str, "str"]:
-            return "string"
-        elif py_type in [int, "int"]:
-            return "number"
-        elif py_type in [float, "float"]:
-            return "number"
-        elif py_type in [bool, "bool"]:
-            return "boolean"
-        elif py_type in [list, "list", List]:
-            return "any[]"  # Mejorado si hay subtipos
-        elif py_type in [dict, "dict", Dict]:
-            return "{ [key: string]: any }"  # Mejorado si hay subtipos
-        elif py_type in [Any, "Any", "unknown"]:
-            return "unknown"
-        else:
-            return "any"  # Por defecto
-
-    dts_lines = [f'declare module "{module_name}" {{']
-
-    class_name = cls.__name__
-    class_doc = inspect.getdoc(cls) or ""
-    dts_lines.append(f"  /**")
-    dts_lines.append(f"   * {class_doc}")
-    dts_lines.append(f"   */")
-    dts_lines.append(f"  class {class_name} {{")
-
-    # Obtener métodos de la clase
-    for method_name, method in inspect.getmembers(cls, predicate=inspect.isfunction):
-        method_doc = inspect.getdoc(method) or ""
-        signature = inspect.signature(method)
-
-        # Crear un único parámetro llamado "args"
-        args_structure = []
-        for param_name, param in signature.parameters.items():
-            if param_name == "self":  # Ignorar `self`
-                continue
-            ts_type = python_to_ts_type(param.annotation)
-            args_structure.append(f"{param_name}: {ts_type}")
-
-        # Convertir estructura de args en TypeScript
-        args_str = f"args: {{ {', '.join(args_structure)} }}"
-        return_type = python_to_ts_type(signature.return_annotation)
-
-        dts_lines.append(f"    /**")
-        dts_lines.append(f"     * {method_doc}")
-        dts_lines.append(f"     */")
-        dts_lines.append(f"    {method_name}({args_str}): {return_type};")
-
-    # Cerrar definición de la clase
-    dts_lines.append("  }")
-    dts_lines.append("}")
+# Llamadas síncronas simultáneas por módulo de sesión (las instancias guardan estado).
+SESSION_CALL_CONCURRENCY = int(os.environ.get("SESSION_CALL_CONCURRENCY", "1"))
 
-    return "\n".join(dts_lines)
 
-
-def get_module_files(session_id: str, module_name: str) -> List[str]:
-    """
-    Obtiene la lista de archivos para un módulo específico dentro de una sesión.
-    Retorna una lista con las rutas relativas de los archivos.
-    """
-    module_path = os.path.join(BASE_MODULES_DIR, session_id, module_name)
-    file_list = []
-    logger.debug(f"Buscando archivos en: {module_path}")
-    if os.path.isdir(module_path):
-        for root, dirs, files in os.walk(module_path):
-            for file in files:
-                # Obtener la ruta relativa del archivo respecto al módulo
-                rel_dir = os.path.relpath(root, module_path)
-                rel_file = os.path.join(rel_dir, file) if rel_dir != "." else file
-                file_list.append(rel_file)
-                logger.debug(f"Archivo encontrado: {rel_file}")
-    else:
-        logger.warning(f"El directorio del módulo no existe: {module_path}")
-    return file_list
+def bump_sessions_version() -> None:
+    global sessions_version
+    sessions_version += 1
 
 
 @app.post("/start-session/", response_model=StartSessionResponse)
-async def start_session(request: StartSessionRequest):
+async def start_session(request: StartSessionRequest, req: Request):
     """
     Inicia una nueva sesión y devuelve un session_id único.
+    En modo scale-out el id lo elige el dispatcher (cabecera X-Session-Id)
+    para enviar la sesión al worker que le corresponde.
     """
-    session_id = str(uuid.uuid4())
-
+    session_id = req.headers.get("x-session-id")
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+    else:
+        try:
+            session_id = str(uuid.UUID(session_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Session-Id header.")
+
+    # Cada sesión tiene su propio lock (subidas y cierre); 'session_lock'
+    # sólo protege el registro de sesiones.
+    # 'functions' es la tabla de despacho (nombre -> SessionFunction) que se
+    # reconstruye en cada subida de módulos; 'file_hashes' y 'dts' guardan el
+    # hash de cada archivo subido y el `.d.ts` de cada módulo cargado;
+    # 'manifest' es la lista de archivos de cada módulo cargado (para "/").
+    # 'last_used' y 'active_calls' los usa el reaper; 'spilled' guarda las
+    # clases de los módulos mientras el estado de las instancias está en disco.
+    session_data = {
+        "modules": {},
+        "functions": {},
+        "file_hashes": {},
+        "dts": {},
+        "manifest": {},
+        "lock": asyncio.Lock(),
+        "last_used": time.monotonic(),
+        "active_calls": 0,
+        "spilled": None,
+        "spill_failed": False,
+    }
+    # Comprobación e inserción bajo el mismo lock: dos peticiones con el
+    # mismo X-Session-Id no pueden registrar ambas la sesión.
     async with session_lock:
-        sessions[session_id] = {"modules": {}}
-    logger.info(f"Sesión iniciada: {session_id}")
+        if session_id in sessions:
+            raise HTTPException(status_code=409, detail="Session already exists.")
+        sessions[session_id] = session_data
+        bump_sessions_version()
+
+    if SESSION_ISOLATION == "process":
+        # Los módulos de la sesión vivirán en su propio proceso. Se arranca con
+        # el lock de la sesión tomado: una subida espera a que exista el worker.
+        async with session_data["lock"]:
+            try:
+                session_data["worker"] = await SessionWorker.create()
+            except Exception as e:
+                logger.error("No se pudo arrancar el worker de la sesión %s: %s", session_id, e)
+                async with session_lock:
+                    if sessions.get(session_id) is session_data:
+                        del sessions[session_id]
+                        bump_sessions_version()
+                raise HTTPException(status_code=500, detail=f"Error starting the session worker: {e}")
+    logger.info("Sesión iniciada: %s", session_id)
 
     return StartSessionResponse(session_id=session_id)
 
@@ -205,187 +245,516 @@ async def upload_modules(session_id: str, request: UploadModulesRequest, req: Re
     Uploads modules to the server associated with an existing session.
     Instantiates the class found in the module, executes an optional initialization function,
     and stores the instance for later use.
+    Only files whose content changed are rewritten, and only modules with changes are
+    reloaded; unchanged modules keep their instance and their previous `.d.ts`.
+    Each uploaded module carries its full file set: files it no longer includes are
+    deleted. A reloaded module's previous instance gets `onDestroy` once the new one loads.
     """
-    logger.debug(f"Starting upload_modules for session {session_id}.")
+    logger.debug("Starting upload_modules for session %s.", session_id)
 
     async with session_lock:
-        if session_id not in sessions:
-            logger.error(f"Session not found: {session_id}")
-            raise HTTPException(status_code=404, detail="Session not found.")
-        logger.debug(f"Session {session_id} found.")
+        session_data = sessions.get(session_id)
+    if session_data is None:
+        logger.error("Session not found: %s", session_id)
+        raise HTTPException(status_code=404, detail="Session not found.")
+    logger.debug("Session %s found.", session_id)
 
     session_path = os.path.join(BASE_MODULES_DIR, session_id)
-    os.makedirs(session_path, exist_ok=True)
-
     dts_content = []
 
-    for module in request.modules:
-        module_path = os.path.join(session_path, module.name)
-        os.makedirs(module_path, exist_ok=True)
-
-        for filename, content in module.files.items():
-            file_path = os.path.join(module_path, filename)
-            try:
-                with open(file_path, "w") as f:
-                    f.write(content)
-                logger.debug(f"Saved file: {file_path}")
-            except Exception as e:
-                logger.error(f"Error saving file {file_path}: {e}")
-                raise HTTPException(
-                    status_code=500, detail=f"Error saving file {filename}: {e}"
-                )
-
-    async with session_lock:
-        modules_loaded = sessions[session_id]["modules"]
+    # Sólo se bloquea esta sesión: las demás siguen atendiendo /execute.
+    async with session_data["lock"]:
+        # /close-session/ o el reaper pudieron destruirla mientras se esperaba
+        # el lock: no se escriben archivos ni se cargan instancias huérfanas.
+        if sessions.get(session_id) is not session_data:
+            logger.error("Session closed while waiting to upload modules: %s", session_id)
+            raise HTTPException(status_code=404, detail="Session not found.")
+        os.makedirs(session_path, exist_ok=True)
+        session_data["last_used"] = time.monotonic()
+        if session_data["spilled"] is not None:
+            # Los módulos sin cambios conservan su instancia: se restauran antes
+            await restore_session(session_id, session_data)
+        session_data["spill_failed"] = False
+        # Subida incremental: sólo se escriben los archivos cuyo hash cambió
+        # y sólo se recargan los módulos con algún archivo distinto.
+        file_hashes = session_data["file_hashes"]
+        changed_modules = []
+        new_hashes = {}
         for module in request.modules:
-            module_dir = os.path.join(session_path, module.name)
-            main_py = os.path.join(module_dir, "main.py")
-            if os.path.isfile(main_py):
+            module_path = os.path.join(session_path, module.name)
+            os.makedirs(module_path, exist_ok=True)
+
+            known = file_hashes.get(module.name, {})
+            hashes = dict(known)
+            # La subida trae el módulo completo: los archivos que ya no vienen se borran.
+            for filename in set(known) - set(module.files):
+                file_path = os.path.join(module_path, filename)
                 try:
-                    # TODO: We need to isolate this , wayme add a sub virtual env, to allow users to install other pip packages.
-                    # But allow us to comunicate with it , to execute or call functions of the instance.
-
-                    spec = importlib.util.spec_from_file_location(module.name, main_py)
-                    loaded_module = importlib.util.module_from_spec(spec)
-                    spec.loader.exec_module(loaded_module)
-                    logger.debug(f"Dynamically loaded module: {main_py}")
-
-                    # **Find and instantiate the class**
-                    module_class = None
-                    for attr_name in dir(loaded_module):
-                        attr = getattr(loaded_module, attr_name)
-                        if isinstance(attr, type):  # It's a class
-                            module_class = attr
-                            break
-
-                    if module_class is None:
-                        logger.error(f"No class found in module {module.name}")
-                        raise HTTPException(
-                            status_code=400,
-                            detail=f"No class found in module {module.name}",
-                        )
-
-                    # Instantiate the class
-                    instance = module_class()
-                    logger.debug(
-                        f"Instantiated class {module_class.__name__} from module {module.name}"
-                    )
-
-                    # Check for optional initialization function and execute it
-                    if hasattr(instance, "onLoad"):
-                        on_load_method = getattr(instance, "onLoad")
-                        if inspect.iscoroutinefunction(on_load_method):
-                            await on_load_method()
-                            logger.debug(
-                                f"Executed async 'onLoad' in instance of {module.name}"
-                            )
-                        else:
-                            on_load_method()
-                            logger.debug(
-                                f"Executed 'onLoad' in instance of {module.name}"
-                            )
-
-                    # Store the instance in the session
-                    modules_loaded[module.name] = instance
-
-                    # Generate `.d.ts` content based on the class
-                    dts_content.append(generate_dts_string(module.name, module_class))
-
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                    logger.debug("Removed file: %s", file_path)
                 except Exception as e:
-                    logger.error(
-                        f"Error loading or executing module {module.name}: {e}"
+                    logger.error("Error removing file %s: %s", file_path, e)
+                    raise HTTPException(
+                        status_code=500, detail=f"Error removing file {filename}: {e}"
                     )
+                del hashes[filename]
+            for filename, content in module.files.items():
+                content_hash = script_content_hash(content)
+                if known.get(filename) == content_hash:
+                    continue
+                file_path = os.path.join(module_path, filename)
+                try:
+                    with open(file_path, "w") as f:
+                        f.write(content)
+                    logger.debug("Saved file: %s", file_path)
+                except Exception as e:
+                    logger.error("Error saving file %s: %s", file_path, e)
                     raise HTTPException(
-                        status_code=500,
-                        detail=f"Error loading module {module.name}: {e}",
+                        status_code=500, detail=f"Error saving file {filename}: {e}"
                     )
+                hashes[filename] = content_hash
+
+            if hashes != known or module.name not in file_hashes:
+                changed_modules.append(module)
+                new_hashes[module.name] = hashes
             else:
-                logger.warning(f"main.py not found for module: {module.name}")
+                logger.debug("Module %s unchanged, skipping reload.", module.name)
+
+        # Los módulos modificados se importan e inicializan concurrentemente.
+        results = await asyncio.gather(
+            *(
+                load_session_module(session_id, session_path, module, session_data.get("worker"))
+                for module in changed_modules
+            ),
+            return_exceptions=True,
+        )
+
+        # Se registran en el orden de la petición los módulos que cargaron bien
+        modules_loaded = session_data["modules"]
+        first_error = None
+        for module, loaded in zip(changed_modules, results):
+            if isinstance(loaded, BaseException):
+                first_error = first_error or loaded
+                continue
+            # Un módulo que falló se vuelve a intentar en la siguiente subida
+            file_hashes[module.name] = new_hashes[module.name]
+            if loaded is not None:
+                previous = modules_loaded.get(module.name)
+                modules_loaded[module.name], session_data["dts"][module.name] = loaded
+                session_data["manifest"][module.name] = sorted(new_hashes[module.name])
+                if previous is not None:
+                    # Instancia reemplazada (sesión inline; las aisladas lo hacen en su worker)
+                    await destroy_replaced_instance(session_id, module.name, previous)
+        if changed_modules:
+            bump_sessions_version()
+
+        session_worker = session_data.get("worker")
+        if session_worker is not None:
+            collisions = session_worker.collisions
+        else:
+            session_data["functions"], collisions = build_function_table(modules_loaded)
+        for function_name, module_names in collisions.items():
+            logger.warning(
+                "Function '%s' is defined in several modules of session %s: %s. Calls go to '%s'.",
+                function_name, session_id, module_names, module_names[0],
+            )
+
+        if first_error is not None:
+            raise first_error
+
+        # Los `.d.ts` de los módulos sin cambios se reutilizan
+        for module in request.modules:
+            if module.name in session_data["dts"]:
+                dts_content.append(session_data["dts"][module.name])
 
+        reloaded = [module.name for module in changed_modules]
         logger.info(
-            f"Modules loaded for session {session_id}: {[module.name for module in request.modules]}"
+            "Modules uploaded for session %s: %s (reloaded: %s)",
+            session_id, [module.name for module in request.modules], reloaded,
         )
 
     # Combine the `.d.ts` content
     dts_final_content = "\n\n".join(dts_content)
 
-    logger.debug(f"Finished upload_modules for session {session_id}.")
+    logger.debug("Finished upload_modules for session %s.", session_id)
     return {
         "status": f"Modules successfully uploaded to session {session_id}",
         "dts_content": dts_final_content,
+        "collisions": collisions,
+        "reloaded": reloaded,
     }
 
 
+async def destroy_replaced_instance(session_id: str, module_name: str, instance: Any) -> None:
+    """
+    Ejecuta `onDestroy` en la instancia de un módulo que se acaba de recargar.
+    """
+    if not hasattr(instance, "onDestroy"):
+        return
+    try:
+        await dispatcher.dispatch(
+            f"{session_id}/{module_name}",
+            instance.onDestroy,
+            {},
+            limit=SESSION_CALL_CONCURRENCY,
+            timeout=resolve_timeout(None, declared_timeout(instance, "onDestroy")),
+        )
+        logger.debug("Executed 'onDestroy' in the replaced instance of %s", module_name)
+    except Exception as e:
+        logger.error("Error running 'onDestroy' on the replaced instance of %s: %s", module_name, e)
+
+
+async def load_session_module(
+    session_id: str, session_path: str, module: ModuleUpload, session_worker: Optional[SessionWorker]
+) -> Optional[Tuple[Any, str]]:
+    """
+    Importa e inicializa (onLoad) un módulo subido a la sesión.
+    Retorna (instancia, contenido .d.ts) o None si el módulo no tiene main.py.
+    """
+    main_py = os.path.join(session_path, module.name, "main.py")
+    if not os.path.isfile(main_py):
+        logger.warning("main.py not found for module: %s", module.name)
+        return None
+
+    if session_worker is not None:
+        # Sesión aislada: el módulo se importa e instancia en su proceso
+        try:
+            dts, destroy_error = await session_worker.load_module(module.name, os.path.abspath(main_py))
+            logger.debug("Module %s loaded in worker %s", module.name, session_worker.pid)
+            if destroy_error is not None:
+                logger.error(
+                    "Error running 'onDestroy' on the replaced instance of %s: %s",
+                    module.name, destroy_error,
+                )
+            return RemoteModule(module.name, session_worker.pid), dts
+        except ScriptWorkerError as e:
+            logger.error("Error loading module %s in worker: %s", module.name, e.message)
+            raise HTTPException(
+                status_code=400 if e.kind == "missing_class" else 500,
+                detail=f"Error loading module {module.name}: {e.message}",
+            )
+
+    # TODO: To allow users to install other pip packages we may still need a sub virtual env.
+    # Process isolation is available with SESSION_ISOLATION=process.
+    dispatch_key = f"{session_id}/{module.name}"
+    try:
+        # exec_module y el constructor bloquean: van al pool de hilos del dispatcher
+        try:
+            module_class = await dispatcher.dispatch(
+                dispatch_key,
+                load_module_class,
+                {"module_name": module.name, "main_py": main_py},
+                limit=SESSION_CALL_CONCURRENCY,
+            )
+            logger.debug("Dynamically loaded module: %s", main_py)
+        except LookupError:
+            logger.error("No class found in module %s", module.name)
+            raise HTTPException(
+                status_code=400,
+                detail=f"No class found in module {module.name}",
+            )
+
+        # Instantiate the class
+        instance = await dispatcher.dispatch(dispatch_key, module_class, {}, limit=SESSION_CALL_CONCURRENCY)
+        logger.debug("Instantiated class %s from module %s", module_class.__name__, module.name)
+
+        # Check for optional initialization function and execute it
+        if hasattr(instance, "onLoad"):
+            on_load_method = getattr(instance, "onLoad")
+            await dispatcher.dispatch(dispatch_key, on_load_method, {}, limit=SESSION_CALL_CONCURRENCY)
+            logger.debug("Executed 'onLoad' in instance of %s", module.name)
+
+        # Generate `.d.ts` content based on the class
+        return instance, generate_dts_string(module.name, module_class)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error loading or executing module %s: %s", module.name, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error loading module {module.name}: {e}",
+        )
+
+
 @app.post("/execute/{session_id}/", status_code=200)
-async def execute(session_id: str, request: ExecutionRequest):
+async def execute(session_id: str, request: ExecutionRequest, req: Request, profile: Optional[str] = None):
     """
     Ejecuta una función específica dentro de la sesión.
     El session_id se proporciona como parte de la ruta.
+    Las funciones generadoras se devuelven en streaming (NDJSON o SSE).
+    Con ?profile=cpu|memory|all la llamada se perfila: el informe vuelve en
+    "profile" y los tiempos en la cabecera Server-Timing.
     """
-    try:
-        logger.debug(
-            f"Recibiendo solicitud para ejecutar función en la sesión {session_id}."
+    modes = parse_profile_modes(profile)
+    if modes:
+        return await execute_profiled(session_id, request, req, CallProfiler(modes))
+
+    response = await execute_function(session_id, request)
+    if is_stream(response.get("result")):
+        logger.debug("Streaming de '%s' en sesión %s.", request.function, session_id)
+        return stream_response(
+            req, response["result"], session_dispatch_key(session_id, request.function), SESSION_CALL_CONCURRENCY
         )
+    # Se responde directamente (sin jsonable_encoder): NumPy y bytes se codifican nativamente.
+    return FastResponse(response)
 
-        async with session_lock:
-            if session_id not in sessions:
-                logger.error(f"Sesión no encontrada: {session_id}")
-                return {"error": "Session not found."}
 
-            modules_loaded = sessions[session_id]["modules"]
-            logger.debug(
-                f"Módulos cargados para sesión {session_id}: {list(modules_loaded.keys())}"
-            )
+async def execute_profiled(session_id: str, request: ExecutionRequest, req: Request, profiler: CallProfiler):
+    """
+    Variante perfilada de /execute/ (sólo se usa si se pidió ?profile=).
+    """
+    response = await execute_function(session_id, request, profiler)
+    headers = {"Server-Timing": profiler.server_timing()}
+    if is_stream(response.get("result")):
+        streaming = stream_response(
+            req, response["result"], session_dispatch_key(session_id, request.function), SESSION_CALL_CONCURRENCY
+        )
+        streaming.headers.update(headers)
+        return streaming
+    logger.info("Llamada perfilada de '%s' en sesión %s.", request.function, session_id)
+    return FastResponse({**response, "profile": profiler.report()}, headers=headers)
+
+
+@app.post("/execute-batch/{session_id}/", status_code=200)
+async def execute_batch(session_id: str, requests: List[ExecutionRequest]):
+    """
+    Ejecuta varias funciones de la sesión en una sola petición (como mucho
+    BATCH_MAX_CALLS; si no, 413). Se ejecutan una tras otra, en el orden
+    recibido, ya que comparten el estado de las instancias de la sesión; cada
+    elemento del resultado trae "result" o "error".
+    """
+    if BATCH_MAX_CALLS and len(requests) > BATCH_MAX_CALLS:
+        raise HTTPException(
+            status_code=413, detail=f"The batch has {len(requests)} calls; the maximum is {BATCH_MAX_CALLS}."
+        )
+    logger.debug("Batch de %s llamadas para la sesión %s.", len(requests), session_id)
+
+    async def run_item(item: ExecutionRequest) -> Dict[str, Any]:
+        response = await execute_function(session_id, item)
+        if is_stream(response.get("result")):
+            # En un batch los generadores se materializan completos.
+            try:
+                key = session_dispatch_key(session_id, item.function)
+                response = {"result": await collect_stream(response["result"], key, SESSION_CALL_CONCURRENCY)}
+            except Exception as e:
+                response = {"error": f"Error executing function '{item.function}': {e}"}
+        return response
+
+    return FastResponse([await run_item(r) for r in requests])
+
+
+def session_dispatch_key(session_id: str, function_name: str) -> str:
+    """
+    Clave del dispatcher para las llamadas a una función de la sesión: la del
+    módulo que la define (ver SessionFunction), la misma que usa
+    run_session_function. Así los next() de un generador comparten el límite
+    SESSION_CALL_CONCURRENCY con el resto de llamadas a esa instancia.
+    """
+    session_data = sessions.get(session_id)
+    entry = session_data["functions"].get(function_name) if session_data is not None else None
+    if entry is None:
+        # Sesión aislada (el stream es async y no pasa por el dispatcher) o ya cerrada.
+        return session_id
+    return f"{session_id}/{entry.module_name}"
+
+
+async def execute_function(
+    session_id: str, request: ExecutionRequest, profiler: Optional[CallProfiler] = None
+) -> Dict[str, Any]:
+    """
+    Busca y ejecuta la función pedida en los módulos de la sesión.
+    Retorna {"result": ...} o {"error": ...} (con "error_code": "timeout" si
+    la llamada superó su timeout o "invalid_params" si los parámetros no
+    cumplen la firma de la función). Las referencias {"$blob": hash} de los
+    parámetros quedan retenidas mientras dura la llamada.
+    """
+    session_data = sessions.get(session_id)
+    if session_data is not None and session_data["spilled"] is not None:
+        # Estado guardado en disco por inactividad: se restaura bajo demanda
+        try:
+            async with session_data["lock"]:
+                if session_data["spilled"] is not None:
+                    await restore_session(session_id, session_data)
+        except Exception as e:
+            logger.error("Error al restaurar el estado de la sesión %s: %s", session_id, e)
+            return {"error": f"Error restoring session state: {e}"}
+
+    try:
+        params, blobs = blob_store.resolve_refs(request.params)
+    except BlobNotFound as e:
+        logger.error("Blob no encontrado en la llamada a '%s': %s", request.function, e.args[0])
+        return {"error": f"Blob not found: {e.args[0]}"}
+    if session_data is not None:
+        session_data["active_calls"] += 1
+        session_data["last_used"] = time.monotonic()
+    try:
+        return await run_session_function(session_id, request, params, profiler)
+    finally:
+        blob_store.release(blobs)
+        if session_data is not None:
+            session_data["active_calls"] -= 1
+            session_data["last_used"] = time.monotonic()
 
-        # Buscar la función en los módulos cargados
-        target_module = None
-        for module_name, module_instance in modules_loaded.items():
-            if hasattr(module_instance, request.function):
-                target_module = module_instance
-                logger.debug(
-                    f"Función '{request.function}' encontrada en módulo '{module_name}'."
-                )
-                break
 
-        if not target_module:
+async def run_session_function(
+    session_id: str, request: ExecutionRequest, params: Dict[str, Any], profiler: Optional[CallProfiler] = None
+) -> Dict[str, Any]:
+    """
+    Ejecuta la llamada con los parámetros ya resueltos (ver execute_function).
+    """
+    try:
+        logger.debug("Recibiendo solicitud para ejecutar función en la sesión %s.", session_id, extra=SAMPLED)
+
+        # Una lectura del registro es atómica en el event loop: no hace falta el lock
+        session_data = sessions.get(session_id)
+        if session_data is None:
+            logger.error("Sesión no encontrada: %s", session_id)
+            return {"error": "Session not found."}
+        session_worker = session_data.get("worker")
+
+        if session_worker is not None:
+            # Sesión aislada: la llamada se reenvía a su proceso
+            if profiler is not None:
+                profiler.notes.append("Sesión aislada: sólo se mide el tiempo de pared de la llamada al worker.")
+            # Misma etiqueta que las sesiones inline (SessionFunction.metrics); una
+            # función inexistente no crea series propias.
+            owner = session_worker.function_modules.get(request.function)
+            if owner is None:
+                metrics = call_metrics(UNKNOWN_LABEL, UNKNOWN_LABEL)
+            else:
+                metrics = call_metrics(f"session:{owner}", request.function)
+            started = time.perf_counter()
+            try:
+                SCRIPT_CALLS_IN_FLIGHT.inc()
+                try:
+                    if profiler is not None:
+                        with profiler.phase("call"):
+                            result = await session_worker.execute(request.function, params, request.timeout)
+                    else:
+                        result = await session_worker.execute(request.function, params, request.timeout)
+                finally:
+                    SCRIPT_CALLS_IN_FLIGHT.dec()
+                metrics.observe_ok(time.perf_counter() - started)
+                logger.info(
+                    "Función '%s' ejecutada en el worker de la sesión %s.",
+                    request.function, session_id, extra=SAMPLED,
+                )
+                return {"result": result}
+            except ScriptWorkerError as e:
+                logger.error(
+                    "Error al ejecutar la función '%s' en sesión %s: %s",
+                    request.function, session_id, e.message,
+                )
+                if e.kind == "missing_function":
+                    return {
+                        "error": f"Function '{request.function}' not found in any module of session {session_id}"
+                    }
+                if e.kind == "invalid_params":
+                    return {
+                        "error": f"Invalid parameters for function '{request.function}': {e.message}",
+                        "error_code": "invalid_params",
+                    }
+                if e.kind == "worker_died":
+                    metrics.observe_error("error", time.perf_counter() - started)
+                    return {
+                        "error": (
+                            f"The worker of session {session_id} died while executing '{request.function}'. "
+                            "It is restarted on the next call and the modules are reloaded (their state is lost)."
+                        ),
+                        "error_code": "worker_died",
+                    }
+                if e.kind == "timeout":
+                    SCRIPT_CALL_TIMEOUTS.labels("session").inc()
+                    metrics.observe_error(504, time.perf_counter() - started)
+                    return {
+                        "error": f"Timeout executing function '{request.function}': {e.message}",
+                        "error_code": "timeout",
+                    }
+                metrics.observe_error("error", time.perf_counter() - started)
+                return {"error": f"Error executing function '{request.function}': {e.message}"}
+
+        # Tabla de despacho precalculada en upload_modules
+        entry = session_data["functions"].get(request.function)
+        if entry is None:
             logger.error(
-                f"Función '{request.function}' no encontrada en ningún módulo de la sesión {session_id}."
+                "Función '%s' no encontrada en ningún módulo de la sesión %s.",
+                request.function, session_id,
             )
             return {
                 "error": f"Function '{request.function}' not found in any module of session {session_id}"
             }
 
+        # Validador precompilado desde la firma: los parámetros inválidos no llegan al dispatcher
+        if entry.signature is not None:
+            try:
+                params = entry.signature.validate(params)
+            except InvalidParameters as invalid:
+                logger.error(
+                    "Parámetros inválidos para '%s' en sesión %s: %s",
+                    request.function, session_id, invalid,
+                )
+                return {
+                    "error": f"Invalid parameters for function '{request.function}': {invalid}",
+                    "error_code": "invalid_params",
+                }
+
         try:
-            func = getattr(target_module, request.function)
             logger.info(
-                f"Ejecutando función '{request.function}' en sesión {session_id} con parámetros: {request.params}"
+                "Ejecutando función '%s' en sesión %s con parámetros: %s",
+                request.function, session_id, Truncated(request.params), extra=SAMPLED,
             )
 
-            # Determinar si la función es asíncrona
-            if inspect.iscoroutinefunction(func):
-                logger.debug(
-                    f"La función '{request.function}' es asíncrona. Ejecutando con 'await'."
-                )
-                result = await func(**request.params)
-            else:
-                logger.debug(
-                    f"La función '{request.function}' es síncrona. Ejecutando directamente."
+            # Las funciones async se esperan; las síncronas van al pool de hilos
+            # con un límite de concurrencia por módulo de la sesión.
+            started = time.perf_counter()
+            SCRIPT_CALLS_IN_FLIGHT.inc()
+            try:
+                method = entry.method if profiler is None else profiler.wrap(entry.method, entry.kind)
+                result = await dispatcher.dispatch(
+                    f"{session_id}/{entry.module_name}",
+                    method,
+                    materialize_blob_refs(params),
+                    limit=SESSION_CALL_CONCURRENCY,
+                    kind=entry.kind,
+                    timeout=resolve_timeout(request.timeout, entry.timeout),
                 )
-                result = func(**request.params)
+            finally:
+                SCRIPT_CALLS_IN_FLIGHT.dec()
+            entry.metrics.observe_ok(time.perf_counter() - started)
 
             logger.info(
-                f"Función '{request.function}' ejecutada exitosamente en sesión {session_id}. Resultado: {result}"
+                "Función '%s' ejecutada exitosamente en sesión %s. Resultado: %s",
+                request.function, session_id, Truncated(result), extra=SAMPLED,
             )
             return {"result": result}
+        except DispatcherOverloaded as overloaded:
+            entry.metrics.observe_error(503, time.perf_counter() - started)
+            logger.warning("Ejecución rechazada por sobrecarga en sesión %s: %s", session_id, overloaded)
+            return {"error": str(overloaded)}
+        except CallTimeout as timed_out:
+            entry.metrics.observe_error(504, time.perf_counter() - started)
+            SCRIPT_CALL_TIMEOUTS.labels("inline").inc()
+            logger.warning(
+                "Timeout al ejecutar la función '%s' en sesión %s: %s",
+                request.function, session_id, timed_out,
+            )
+            return {
+                "error": f"Timeout executing function '{request.function}': {timed_out}",
+                "error_code": "timeout",
+            }
         except Exception as func_exception:
+            entry.metrics.observe_error("error", time.perf_counter() - started)
             logger.error(
-                f"Error al ejecutar la función '{request.function}' en sesión {session_id}: {func_exception}"
+                "Error al ejecutar la función '%s' en sesión %s: %s",
+                request.function, session_id, func_exception,
             )
             return {
                 "error": f"Error executing function '{request.function}': {str(func_exception)}"
             }
     except Exception as e:
-        logger.error(f"Error inesperado: {e}")
+        logger.error("Error inesperado: %s", e)
         return {"error": f"Unexpected error occurred: {str(e)}"}
 
 
@@ -398,106 +767,346 @@ async def close_session(
     """
     Cierra una sesión activa, ejecutando `onDestroy` en módulos si existe, y liberando recursos en el servidor.
     """
-    logger.info(f"Solicitud recibida para cerrar la sesión {session_id}.")
+    logger.info("Solicitud recibida para cerrar la sesión %s.", session_id)
 
     # Log de encabezados
     headers = dict(req.headers)
-    logger.debug(f"Encabezados de la solicitud: {json.dumps(headers, indent=2)}")
+    logger.debug("Encabezados de la solicitud: %s", Truncated(headers))
 
     # Log de parámetros
-    logger.debug(f"Parámetros de la solicitud: {request.dict()}")
+    logger.debug("Parámetros de la solicitud: %s", Truncated(request))
+
+    if not await destroy_session(session_id):
+        logger.error("Sesión no encontrada: %s", session_id)
+        raise HTTPException(status_code=404, detail="Session not found.")
+
+    return {"status": f"Session {session_id} closed successfully."}
+
 
+async def destroy_session(session_id: str) -> bool:
+    """
+    Retira la sesión del registro, ejecuta `onDestroy` en sus módulos y borra
+    sus archivos. El lock del registro sólo se toma para retirarla.
+    Retorna False si la sesión no existe.
+    """
+    # Se retira del registro primero: las nuevas peticiones ya no la encuentran
     async with session_lock:
-        if session_id not in sessions:
-            logger.error(f"Sesión no encontrada: {session_id}")
-            raise HTTPException(status_code=404, detail="Session not found.")
+        session_data = sessions.pop(session_id, None)
+        if session_data is not None:
+            bump_sessions_version()
+    if session_data is None:
+        return False
+
+    # Espera a que termine una subida en curso de esta misma sesión
+    async with session_data["lock"]:
+        logger.info("Sesión encontrada: %s. Preparándose para ejecutar 'onDestroy' en los módulos.", session_id)
+
+        # Estado en disco: se restaura para que `onDestroy` vea las instancias
+        if session_data["spilled"] is not None:
+            try:
+                await restore_session(session_id, session_data)
+            except Exception as e:
+                logger.error("No se pudo restaurar la sesión %s para 'onDestroy': %s", session_id, e)
+                discard_spill(session_id)
 
-        logger.info(
-            f"Sesión encontrada: {session_id}. Preparándose para ejecutar 'onDestroy' en los módulos."
-        )
+        # Sesión aislada: el worker ejecuta `onDestroy` y termina
+        session_worker = session_data.get("worker")
+        if session_worker is not None:
+            for module_name, error in (await session_worker.destroy()).items():
+                logger.error("Error al ejecutar 'onDestroy' en módulo %s: %s", module_name, error)
 
         # Ejecutar `onDestroy` en cada módulo de la sesión si existe
-        modules_loaded = sessions[session_id]["modules"]
+        modules_loaded = session_data["modules"] if session_worker is None else {}
         for module_name, module_instance in modules_loaded.items():
-            logger.debug(f"Procesando módulo: {module_name}")
+            logger.debug("Procesando módulo: %s", module_name)
 
             if hasattr(module_instance, "onDestroy"):
-                on_destroy = getattr(module_instance, "onDestroy")
+                # Como las llamadas: en el dispatcher (fuera del event loop), con la
+                # clave y el límite del módulo y con timeout.
                 try:
-                    if inspect.iscoroutinefunction(on_destroy):
-                        logger.info(
-                            f"Ejecutando evento asíncrono 'onDestroy' para módulo: {module_name}"
-                        )
-                        await on_destroy()
-                    else:
-                        logger.info(
-                            f"Ejecutando evento síncrono 'onDestroy' para módulo: {module_name}"
-                        )
-                        on_destroy()
-                    logger.info(
-                        f"Evento 'onDestroy' ejecutado correctamente para módulo: {module_name}"
+                    await dispatcher.dispatch(
+                        f"{session_id}/{module_name}",
+                        module_instance.onDestroy,
+                        {},
+                        limit=SESSION_CALL_CONCURRENCY,
+                        timeout=resolve_timeout(None, declared_timeout(module_instance, "onDestroy")),
                     )
+                    logger.info("Evento 'onDestroy' ejecutado correctamente para módulo: %s", module_name)
                 except Exception as e:
-                    logger.error(
-                        f"Error al ejecutar 'onDestroy' en módulo {module_name}: {e}"
-                    )
+                    logger.error("Error al ejecutar 'onDestroy' en módulo %s: %s", module_name, e)
             else:
-                logger.debug(f"Módulo {module_name} no tiene un método 'onDestroy'.")
+                logger.debug("Módulo %s no tiene un método 'onDestroy'.", module_name)
 
-        logger.info(
-            f"Todos los módulos procesados para sesión {session_id}. Procediendo a limpiar recursos."
-        )
+        logger.info("Todos los módulos procesados para sesión %s. Procediendo a limpiar recursos.", session_id)
 
-        # Eliminar la sesión del diccionario
-        del sessions[session_id]
-        logger.info(f"Sesión {session_id} eliminada del diccionario de sesiones.")
+        logger.info("Sesión %s eliminada del diccionario de sesiones.", session_id)
 
     # Eliminar los archivos de la sesión
     session_path = os.path.join(BASE_MODULES_DIR, session_id)
     if os.path.exists(session_path):
         try:
-            shutil.rmtree(session_path)
-            logger.info(
-                f"Archivos de la sesión {session_id} eliminados del sistema de archivos."
-            )
+            await asyncio.to_thread(shutil.rmtree, session_path)
+            logger.info("Archivos de la sesión %s eliminados del sistema de archivos.", session_id)
         except Exception as e:
-            logger.error(f"Error al eliminar archivos de la sesión {session_id}: {e}")
+            logger.error("Error al eliminar archivos de la sesión %s: %s", session_id, e)
     else:
-        logger.warning(
-            f"Ruta de sesión {session_id} no encontrada para eliminar archivos."
+        logger.warning("Ruta de sesión %s no encontrada para eliminar archivos.", session_id)
+
+    logger.info("Sesión %s cerrada exitosamente.", session_id)
+    return True
+
+
+async def restore_session(session_id: str, session_data: Dict[str, Any]) -> None:
+    """
+    Recupera de disco las instancias de una sesión (sin onLoad) y reconstruye
+    su tabla de funciones. Requiere el lock de la sesión.
+    """
+    instances = await asyncio.to_thread(restore_instances, session_id, session_data["spilled"])
+    session_data["modules"] = instances
+    session_data["functions"], _ = build_function_table(instances)
+    session_data["spilled"] = None
+    reaper_counts["restored"] += 1
+    logger.info("Estado de la sesión %s restaurado desde disco.", session_id)
+
+
+async def spill_session(session_id: str, session_data: Dict[str, Any]) -> bool:
+    """
+    Guarda en disco el estado de las instancias de una sesión inline y las
+    libera de memoria. Requiere el lock de la sesión y que no haya llamadas
+    en curso. Retorna False si el estado no se pudo serializar.
+    """
+    instances = session_data["modules"]
+    # Marcada antes de esperar: una llamada que llegue ahora espera al lock y restaura
+    session_data["spilled"] = {module_name: type(instance) for module_name, instance in instances.items()}
+    try:
+        await asyncio.to_thread(spill_instances, session_id, instances)
+    except Exception as e:
+        session_data["spilled"] = None
+        session_data["spill_failed"] = True
+        logger.warning("No se pudo guardar en disco el estado de la sesión %s: %s", session_id, e)
+        return False
+    session_data["modules"] = {}
+    session_data["functions"] = {}
+    reaper_counts["spilled"] += 1
+    logger.info("Estado de la sesión %s guardado en disco por inactividad.", session_id)
+    return True
+
+
+async def session_memory(session_data: Dict[str, Any]) -> Optional[int]:
+    """
+    Memoria de la sesión: RSS del worker (aislada) o tamaño estimado del
+    estado de sus instancias (inline).
+    """
+    session_worker = session_data.get("worker")
+    if session_worker is not None:
+        return process_rss(session_worker.pid)
+    try:
+        return await asyncio.to_thread(estimate_size, session_data["modules"])
+    except RuntimeError:
+        # El estado cambió mientras se recorría: se mide en la siguiente pasada
+        return None
+
+
+async def reap_sessions() -> None:
+    """
+    Una pasada del reaper: cierra las sesiones inactivas más de
+    SESSION_IDLE_TTL, guarda en disco las inactivas más de SESSION_SPILL_AFTER
+    y aplica SESSION_MEMORY_LIMIT (guardando en disco si se puede o cerrando).
+    Las sesiones con llamadas o subidas en curso se saltan.
+    """
+    now = time.monotonic()
+    for session_id, session_data in list(sessions.items()):
+        if session_data["active_calls"] or session_data["lock"].locked():
+            continue
+        idle = now - session_data["last_used"]
+
+        if SESSION_IDLE_TTL and idle > SESSION_IDLE_TTL:
+            logger.info("Cerrando la sesión %s: inactiva durante %.0fs.", session_id, idle)
+            if await destroy_session(session_id):
+                reaper_counts["reaped"] += 1
+            continue
+
+        can_spill = (
+            "worker" not in session_data
+            and session_data["spilled"] is None
+            and not session_data["spill_failed"]
+            and session_data["modules"]
         )
+        if can_spill and SESSION_SPILL_AFTER and idle > SESSION_SPILL_AFTER:
+            async with session_data["lock"]:
+                if not session_data["active_calls"]:
+                    await spill_session(session_id, session_data)
+            continue
+
+        if SESSION_MEMORY_LIMIT and session_data["spilled"] is None:
+            used = await session_memory(session_data)
+            if used is None or used <= SESSION_MEMORY_LIMIT:
+                continue
+            logger.warning(
+                "La sesión %s supera el límite de memoria (%s > %s bytes).",
+                session_id, used, SESSION_MEMORY_LIMIT,
+            )
+            if can_spill and SESSION_SPILL_AFTER:
+                async with session_data["lock"]:
+                    if not session_data["active_calls"] and await spill_session(session_id, session_data):
+                        continue
+            if await destroy_session(session_id):
+                reaper_counts["evicted"] += 1
 
-    logger.info(f"Sesión {session_id} cerrada exitosamente.")
-    return {"status": f"Session {session_id} closed successfully."}
+
+async def reap_sessions_periodically(interval: float = SESSION_REAPER_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reap_sessions()
+        except Exception as e:
+            logger.error("Error en el reaper de sesiones: %s", e)
+
+
+@app.on_event("startup")
+async def start_session_reaper():
+    global session_reaper_task
+    if SESSION_IDLE_TTL or SESSION_SPILL_AFTER or SESSION_MEMORY_LIMIT:
+        session_reaper_task = asyncio.create_task(reap_sessions_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_session_reaper():
+    if session_reaper_task is not None:
+        session_reaper_task.cancel()
 
 
 @app.get("/", status_code=200)
-async def root():
+async def root(
+    request: Request, offset: int = 0, limit: int = STATUS_PAGE_SIZE, summary: bool = False
+):
     """
     Ruta de verificación del estado del servidor.
-    Devuelve información detallada sobre las sesiones activas, los módulos cargados y la estructura de archivos.
+    Devuelve las sesiones activas con sus módulos y archivos, paginadas con
+    'offset'/'limit' ('next_offset' es null en la última página). Con
+    summary=true sólo se devuelven los totales. Los archivos salen del
+    manifiesto que se guarda al subir los módulos (sin recorrer el disco).
+    La respuesta lleva ETag: con If-None-Match se responde 304 si nada cambió.
     """
-    logger.debug("Recibiendo solicitud para verificar estado del servidor.")
-
-    async with session_lock:
-        active_sessions = len(sessions)
-        sessions_info = []
-
-        for session_id, session_data in sessions.items():
-            modules_info = []
-            for module_name in session_data["modules"]:
-                files = get_module_files(session_id, module_name)
-                modules_info.append({"name": module_name, "files": files})
-            sessions_info.append({"session_id": session_id, "modules": modules_info})
-
-    logger.info(f"Estado del servidor solicitado. Sesiones activas: {active_sessions}")
-    logger.debug(f"Información de sesiones: {sessions_info}")
-    return {
+    offset = max(offset, 0)
+    limit = max(limit, 1)
+    etag = f'W/"{SERVER_BOOT_ID}-{sessions_version}-{offset}-{limit}-{int(summary)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Sin awaits de por medio la lectura del registro es atómica: no hace falta el lock
+    active_sessions = len(sessions)
+    response = {
         "status": "Servidor en funcionamiento",
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "active_sessions": active_sessions,
-        "sessions": sessions_info,  # Información detallada de las sesiones
+        "loaded_modules": sum(len(session_data["manifest"]) for session_data in sessions.values()),
     }
+    if not summary:
+        page = itertools.islice(sessions.items(), offset, offset + limit)
+        response["sessions"] = [
+            {
+                "session_id": session_id,
+                "modules": [
+                    {"name": module_name, "files": files}
+                    for module_name, files in session_data["manifest"].items()
+                ],
+            }
+            for session_id, session_data in page
+        ]
+        response["offset"] = offset
+        response["limit"] = limit
+        response["next_offset"] = offset + limit if offset + limit < active_sessions else None
+
+    logger.debug("Estado del servidor solicitado. Sesiones activas: %s", active_sessions)
+    return FastResponse(response, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+@app.get("/preload-stats/", status_code=200)
+async def preload_stats():
+    """
+    Tiempos de importación de los paquetes precargados.
+    """
+    return PRELOAD_TIMINGS
+
+
+@app.get("/logs/", status_code=200)
+async def get_logs(cursor: int = 0, limit: int = 100, level: Optional[str] = None):
+    """
+    Últimos registros del servidor. Pasar el 'next_cursor' recibido como
+    'cursor' para obtener sólo los registros nuevos.
+    """
+    return log_buffer.read(cursor=cursor, limit=limit, level=level)
+
+
+async def collect_blobs_periodically(interval: float = BLOB_GC_INTERVAL):
+    """
+    Elimina los blobs sin referencias que superaron BLOB_TTL.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            expired = await asyncio.to_thread(blob_store.collect)
+            if expired:
+                logger.info("%s blobs vencidos eliminados.", len(expired))
+        except Exception as e:
+            logger.error("Error al recolectar blobs: %s", e)
+
+
+@app.on_event("startup")
+async def start_blob_gc():
+    global blob_gc_task
+    blob_gc_task = asyncio.create_task(collect_blobs_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_blob_gc():
+    if blob_gc_task is not None:
+        blob_gc_task.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_logging():
+    """
+    Vacía la cola de logs antes de salir.
+    """
+    log_listener.stop()
+
+
+@app.get("/metrics", status_code=200)
+async def metrics():
+    """
+    Métricas en formato Prometheus (llamadas, latencias, sesiones activas...).
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/dispatcher-stats/", status_code=200)
+async def dispatcher_stats():
+    """
+    Profundidad de cola, llamadas en curso y tiempos de espera del dispatcher.
+    """
+    return dispatcher.stats()
+
+
+@app.get("/session-schema/{session_id}/", status_code=200)
+async def session_schema(session_id: str):
+    """
+    JSON Schema de parámetros y retorno de cada función de la sesión, el
+    mismo con el que se validan las llamadas.
+    """
+    session_data = sessions.get(session_id)
+    if session_data is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    if session_data["spilled"] is not None:
+        async with session_data["lock"]:
+            if session_data["spilled"] is not None:
+                await restore_session(session_id, session_data)
+    session_worker = session_data.get("worker")
+    if session_worker is not None:
+        return session_worker.schemas
+    return describe_functions(session_data["functions"])
 
 
 @app.get("/debug-sessions/", status_code=200)
@@ -507,7 +1116,10 @@ async def debug_sessions():
     """
     logger.debug("Recibiendo solicitud para debug de sesiones.")
     async with session_lock:
-        return sessions
+        return {
+            session_id: {"modules": data["modules"]}
+            for session_id, data in sessions.items()
+        }
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
@@ -530,96 +1142,98 @@ async def gui(request: Request):
 class RunScriptRequest(BaseModel):
     script: str             # Contenido del script
     payload: Dict[str, Any] # Parámetros para la función main(**payload)
+    timeout: Optional[float] = None  # Segundos (por defecto el declarado o SCRIPT_CALL_TIMEOUT)
 
 class RunScriptResponse(BaseModel):
     id: str       # Hash MD5 del script
     result: Any   # Resultado devuelto por la función main(...)
 
 
-@app.post("/run-script/", response_model=RunScriptResponse)
-def run_script(request: RunScriptRequest):
+def prepare_run_script(
+    script_hash: str, script_content: str, payload: Dict[str, Any]
+) -> Tuple[Any, Dict[str, Any]]:
     """
-    Endpoint único que:
-    1) Calcula el hash MD5 del script.
-    2) Lo almacena en un cache en memoria si no existe.
-    3) Carga dinámicamente el módulo (solo la primera vez).
-    4) Ejecuta la función main(**payload).
-    5) Si ocurre un error, borra la entrada del scripts_map.
-    6) Retorna (id=hash, result=...) .
+    Pasos 2) a 4) de /run-script/: alta en el storage, carga del módulo (que
+    ejecuta el código de nivel superior del script) y validación de payload.
+    Es síncrono y se ejecuta en un hilo para no bloquear el event loop.
+    Retorna (módulo, payload validado).
     """
-
-    script_content = request.script
-    payload = request.payload
-
-    # 1) Generar hash MD5
-    script_hash = hashlib.md5(script_content.encode("utf-8")).hexdigest()
-
     # 2) Verificar si ya existe en el cache
-    if script_hash not in scripts_map:
+    if not script_storage.script_exists(script_hash):
         # Crear una nueva entrada en el cache
-        scripts_map[script_hash] = {
-            "content": script_content,
-            "module": None
-        }
+        script_storage.store_script(script_hash, script_content)
 
-    # 3) Verificar si el módulo está cargado
-    if scripts_map[script_hash]["module"] is None:
-        # Intentar cargar dinámicamente el script
-        try:
+    # 3) Obtener el módulo (el storage lo carga si no está en memoria)
+    try:
+        module = script_storage.get_script_module(script_hash)
+        if module is None:
+            # Desalojado entre el alta y la carga: lo cargamos sin cachear
             module = load_script_module(script_hash, script_content)
-            scripts_map[script_hash]["module"] = module
-        except Exception as e:
-            # Si hay error al cargar el módulo, lo quitamos del cache
-            del scripts_map[script_hash]
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error al cargar el script dinámicamente: {e}"
-            )
-
-    # 4) Obtener referencia al módulo
-    module = scripts_map[script_hash]["module"]
+    except Exception as e:
+        # Si hay error al cargar el módulo, lo quitamos del cache
+        script_storage.delete_script(script_hash)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al cargar el script dinámicamente: {e}"
+        )
 
-    # 5) Ejecutar main(**payload)
     if not hasattr(module, "main"):
         # Si no define 'main', eliminar del cache y error
-        del scripts_map[script_hash]
+        script_storage.delete_script(script_hash)
         raise HTTPException(
             status_code=400,
             detail="El script no define una función 'main'."
         )
 
-    main_func = getattr(module, "main")
+    # 4) Validar payload contra la firma de main
+    try:
+        payload = validate_params(module.main, payload)
+    except InvalidParameters as e:
+        raise HTTPException(status_code=422, detail=f"Parámetros inválidos para main(): {e}")
+    return module, payload
+
+
+@app.post("/run-script/", response_model=RunScriptResponse)
+async def run_script(request: RunScriptRequest):
+    """
+    Endpoint único que:
+    1) Calcula el hash MD5 del script.
+    2) Lo almacena en un cache en memoria si no existe.
+    3) Carga dinámicamente el módulo (solo la primera vez).
+    4) Valida payload contra la firma de main (422 si no la cumple).
+    5) Ejecuta main(**payload) con timeout (504 si lo supera); si ocurre
+       un error, borra la entrada del script_storage.
+    6) Retorna (id=hash, result=...) . Si main es un generador, "result" es
+       la lista de lo que produce (esta respuesta no es streaming).
+    Los pasos 2) a 4) corren en un hilo (ver prepare_run_script) y main en
+    el dispatcher, como en /call-script/: nada de esto bloquea el event loop.
+    """
+
+    # 1) Generar hash MD5
+    script_hash = hashlib.md5(request.script.encode("utf-8")).hexdigest()
+
+    module, payload = await asyncio.to_thread(prepare_run_script, script_hash, request.script, request.payload)
+    main_func = module.main
 
+    # 5) Ejecutar main(**payload)
     try:
-        result = main_func(**payload)
+        wall = resolve_timeout(request.timeout, declared_timeout(module, "main"))
+        result = await dispatcher.dispatch(script_hash, main_func, payload, timeout=wall)
+        if is_stream(result):
+            result = await collect_stream(result, script_hash)
+    except CallTimeout as e:
+        SCRIPT_CALL_TIMEOUTS.labels("inline").inc()
+        raise HTTPException(status_code=504, detail=f"Timeout ejecutando main(): {e}")
+    except DispatcherOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         # Si hay error en la ejecución de main, eliminamos el script del cache
-        del scripts_map[script_hash]
+        script_storage.delete_script(script_hash)
         raise HTTPException(
             status_code=500,
             detail=f"Error ejecutando main(): {e}"
         )
 
     # 6) Retornar el hash y el resultado
-    return RunScriptResponse(id=script_hash, result=result)
-
-
-def load_script_module(script_hash: str, script_content: str):
-    """
-    Carga el script en un módulo Python de manera dinámica usando importlib.
-    Retorna la referencia al módulo.
-    """
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        script_path = os.path.join(tmp_dir, f"{script_hash}.py")
-        # Guardar el contenido en un archivo temporal
-        with open(script_path, "w", encoding="utf-8") as f:
-            f.write(script_content)
-
-        # Crear especificación de import
-        spec = importlib.util.spec_from_file_location(script_hash, script_path)
-        if spec is None:
-            raise RuntimeError("No se pudo crear spec de importación.")
+    return FastResponse({"id": script_hash, "result": result})
 
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)  # Ejecuta el contenido del script
-    return module
@@ -1,15 +1,31 @@
 import hashlib
-import importlib.util
-import tempfile
-import os
 import asyncio
 import logging
+import time
 from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from typing import Dict, Any, List
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from typing import Dict, Any, Optional
+
+from .script_loader import code_cache_stats
+from .process_pool import EXECUTION_MODE, ScriptProcessPool, ScriptWorkerError
+from .dispatcher import BATCH_MAX_CALLS, DispatcherOverloaded, call_kind, dispatcher
+from .storage_factory import SCRIPT_STORAGE_BACKEND, create_script_storage
+from .result_cache import ResultCache, get_cache_policy
+from .streaming import collect_stream, is_stream, stream_response
+from .preload import PRELOAD_PACKAGES, PRELOAD_TIMINGS, preload_packages
+from .log_pipeline import SAMPLED, RingBufferHandler, setup_queue_logging
+from .profiling import CallProfiler, parse_profile_modes
+from .metrics import SCRIPT_CALL_TIMEOUTS, SCRIPT_CALLS_IN_FLIGHT, UNKNOWN_LABEL, call_metrics, forget_script, register_stats, render_metrics
+from .serialization import FastResponse, MsgpackRoute, SerializationMiddleware
+from .blob_store import BLOB_GC_INTERVAL, BlobNotFound, BlobStore, materialize_blob_refs
+from .blob_routes import create_blob_router
+from .timeouts import CallTimeout, declared_timeout, resolve_timeout
+from .script_imports import ScriptImports, is_valid_alias
+from .signatures import InvalidParameters, describe_module, module_signatures, validate_params
+
 # ==========================
 # Configuración de Logging
 # ==========================
@@ -21,26 +37,146 @@ console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter(
     "[%(asctime)s] [%(name)s] [%(levelname)s] %(message)s"
 ))
-logger.addHandler(console_handler)
 
+# Buffer en memoria de los últimos registros (servido por /logs/)
+log_buffer = RingBufferHandler()
 
-# logs= []
-
-# Función auxiliar para logs asíncronos
-async def log_message(message: str):
-    """
-    Envía un mensaje al logger en un hilo aparte para no bloquear el event loop.
-    """
-    # logs.append(message)
-    await asyncio.to_thread(logger.info, message)
+# logger.* sólo encola el registro; un hilo lo formatea y lo escribe.
+log_listener = setup_queue_logging(logger, [console_handler, log_buffer])
 
 # ==========================
 #   Inicialización FastAPI
 # ==========================
-app = FastAPI()
+app = FastAPI(default_response_class=FastResponse)
+# Accept/Content-Type: application/msgpack (ver serialization.py)
+app.add_middleware(SerializationMiddleware)
+app.router.route_class = MsgpackRoute
+
+
+def load_script(script_id: str, content: str, code: Optional[Any] = None) -> Any:
+    """
+    Loader del storage: carga el módulo y precompila los validadores de
+    parámetros de sus funciones (ver signatures.py).
+    """
+    module = script_imports.load_module(script_id, content, code)
+    module_signatures(module)
+    return module
+
+
+# Almacenamiento de scripts detrás de la interfaz ScriptStorage.
+# SCRIPT_STORAGE_BACKEND=memory (LRU acotado) o sqlite (persistente, WAL).
+script_storage = create_script_storage(SCRIPT_STORAGE_BACKEND, loader=load_script)
+# Imports entre scripts almacenados (codecms_scripts.<alias> / codecms_scripts._<id>).
+# El loader del storage registra qué scripts importa cada uno; los alias se
+# guardan en el propio storage.
+script_imports = ScriptImports(script_storage)
+script_imports.install()
+storage_flush_task: Optional[asyncio.Task] = None
+
+# Cache de resultados de funciones marcadas como cacheables (@cacheable / __cacheable__)
+result_cache = ResultCache()
+
+# Pool de procesos (sólo si SCRIPT_EXECUTION_MODE=process)
+process_pool: Optional[ScriptProcessPool] = None
+
+# Blobs direccionados por contenido: {"$blob": hash} en los parámetros (ver blob_routes.py)
+blob_store = BlobStore()
+blob_gc_task: Optional[asyncio.Task] = None
+app.include_router(create_blob_router(blob_store))
+
+# Contadores que ya llevan los componentes, expuestos en /metrics
+register_stats("script_storage", script_storage.stats, counters=("module_hits", "module_misses"))
+register_stats("result_cache", result_cache.stats, counters=("hits", "misses", "evictions"))
+register_stats("code_cache", code_cache_stats, counters=("hits", "misses"))
+register_stats("dispatcher", dispatcher.stats, counters=("completed", "rejected", "timeouts", "abandoned"))
+register_stats("blob_store", blob_store.stats, counters=("collected",))
+register_stats("script_imports", script_imports.stats, counters=("invalidations",))
+
+
+@app.on_event("startup")
+async def start_process_pool():
+    global process_pool
+    if EXECUTION_MODE == "process":
+        process_pool = ScriptProcessPool()
+        process_pool.start()
+        report = await process_pool.warmup()
+        logger.info(
+            "[STARTUP] Pool de procesos iniciado con %s workers (%s)",
+            process_pool.size, process_pool.start_method,
+        )
+        for worker in report:
+            logger.info("[STARTUP] Worker %s listo en %ss", worker.get('pid'), worker['startup_seconds'])
+    elif PRELOAD_PACKAGES:
+        # Modo inline: los paquetes pesados se importan una vez al arrancar.
+        await asyncio.to_thread(preload_packages, PRELOAD_PACKAGES)
+
+    for name, timing in PRELOAD_TIMINGS.items():
+        logger.info("[STARTUP] Precarga de %s: %.3fs (ok=%s)", name, timing['seconds'], timing['ok'])
+
+
+@app.on_event("shutdown")
+async def stop_process_pool():
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown()
+        process_pool = None
+
+
+async def flush_storage_periodically(interval: float = 1.0):
+    """
+    Confirma en disco las escrituras agrupadas del storage aunque no lleguen más.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            script_storage.flush()
+        except Exception as e:
+            logger.error("[STORAGE] Error al persistir scripts: %s", e)
+
+
+@app.on_event("startup")
+async def start_storage():
+    global storage_flush_task
+    storage_flush_task = asyncio.create_task(flush_storage_periodically())
+    logger.info("[STARTUP] Almacenamiento de scripts: %s", SCRIPT_STORAGE_BACKEND)
+
+
+@app.on_event("shutdown")
+async def stop_storage():
+    if storage_flush_task is not None:
+        storage_flush_task.cancel()
+    script_storage.close()
+
+
+async def collect_blobs_periodically(interval: float = BLOB_GC_INTERVAL):
+    """
+    Elimina los blobs sin referencias que superaron BLOB_TTL.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            expired = await asyncio.to_thread(blob_store.collect)
+            if expired:
+                logger.info("[BLOBS] %s blobs vencidos eliminados", len(expired))
+        except Exception as e:
+            logger.error("[BLOBS] Error al recolectar blobs: %s", e)
 
-# Almacenamiento en memoria
-scripts_map: Dict[str, Dict[str, Any]] = {}
+
+@app.on_event("startup")
+async def start_blob_gc():
+    global blob_gc_task
+    blob_gc_task = asyncio.create_task(collect_blobs_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_blob_gc():
+    if blob_gc_task is not None:
+        blob_gc_task.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_logging():
+    log_listener.stop()
 
 
 # ========== Modelos Pydantic para Request/Response ==========
@@ -48,6 +184,8 @@ scripts_map: Dict[str, Dict[str, Any]] = {}
 class UploadScriptRequest(BaseModel):
     """Modelo para subir un nuevo script."""
     script: str
+    # Nombre con el que otros scripts lo importan: import codecms_scripts.<alias>
+    alias: Optional[str] = None
 
 
 class UploadScriptResponse(BaseModel):
@@ -59,6 +197,8 @@ class ExecuteScriptRequest(BaseModel):
     id: str
     function_name: str
     params: Optional[Dict[str, Any]] = None
+    # Segundos; si no se indica, el declarado por el script o SCRIPT_CALL_TIMEOUT.
+    timeout: Optional[float] = None
 
 
 class ExecuteScriptResponse(BaseModel):
@@ -66,6 +206,13 @@ class ExecuteScriptResponse(BaseModel):
     result: Any
 
 
+class BatchCallResult(BaseModel):
+    """Resultado de una llamada dentro de un batch (result o error)."""
+    status_code: int = 200
+    result: Any = None
+    error: Optional[str] = None
+
+
 class UpdateScriptRequest(BaseModel):
     """Modelo para actualizar (modificar) el contenido de un script."""
     new_script: str
@@ -73,89 +220,406 @@ class UpdateScriptRequest(BaseModel):
 
 # ========== Endpoints ==========
 @app.get("/logs/",)
-async def get_logs():
-    return '[]'
+async def get_logs(cursor: int = 0, limit: int = 100, level: Optional[str] = None):
+    """
+    Últimos registros del servidor. Pasar el 'next_cursor' recibido como
+    'cursor' para obtener sólo los registros nuevos.
+    """
+    return log_buffer.read(cursor=cursor, limit=limit, level=level)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas en formato Prometheus: llamadas y latencias por script/función,
+    tiempos de compilación y carga, caches, dispatcher y almacenamiento.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/dispatcher-stats/")
+async def dispatcher_stats():
+    """
+    Profundidad de cola, llamadas en curso y tiempos de espera del dispatcher.
+    """
+    return dispatcher.stats()
+
+@app.get("/preload-stats/")
+async def preload_stats():
+    """
+    Tiempos de importación de los paquetes precargados y de arranque de los workers.
+    """
+    if process_pool is not None:
+        return {"mode": "process", "workers": process_pool.startup_report()}
+    return {"mode": "inline", "preload": PRELOAD_TIMINGS}
+
+@app.get("/cache-stats/")
+async def cache_stats():
+    """
+    Aciertos, fallos y tamaño del cache de resultados.
+    """
+    return result_cache.stats()
 
 @app.post("/upload-script/", response_model=UploadScriptResponse)
 async def upload_script(request: UploadScriptRequest):
     """
     Sube un script (string Python). Calcula un hash MD5,
     lo almacena en memoria si no existe ya. Retorna el 'id' (hash).
+    Con 'alias' el script pasa a importarse como codecms_scripts.<alias>;
+    si el alias apuntaba a otro script, sus dependientes se recargan.
     """
+    if request.alias is not None and not is_valid_alias(request.alias):
+        raise HTTPException(status_code=400, detail=f"Alias no válido: '{request.alias}'.")
+
     script_content = request.script
     script_hash = hashlib.md5(script_content.encode("utf-8")).hexdigest()
 
-    if script_hash not in scripts_map:
-        scripts_map[script_hash] = {
-            "content": script_content,
-            "module": None
-        }
-        await log_message(f"[UPLOAD] Nuevo script con hash: {script_hash}")
+    if not script_storage.script_exists(script_hash):
+        script_storage.store_script(script_hash, script_content)
+        logger.info("[UPLOAD] Nuevo script con hash: %s", script_hash)
     else:
-        await log_message(f"[UPLOAD] Script repetido, hash: {script_hash} (ya existe)")
+        logger.info("[UPLOAD] Script repetido, hash: %s (ya existe)", script_hash)
+
+    if request.alias is not None:
+        forget_dependents(script_imports.set_alias(request.alias, script_hash))
+        logger.info("[UPLOAD] Alias '%s' -> %s", request.alias, script_hash)
 
     return UploadScriptResponse(id=script_hash)
 
 
+@app.get("/script-aliases/")
+async def list_script_aliases():
+    """
+    Alias de importación (codecms_scripts.<alias>) y el id al que apunta cada uno.
+    """
+    return script_imports.aliases()
+
+
+def forget_dependents(script_ids: List[str]) -> None:
+    """
+    Descarga el módulo y los resultados cacheados de los scripts que
+    importaban un script que cambió: se recargan en la próxima llamada.
+    """
+    for script_id in script_ids:
+        script_storage.set_script_module(script_id, None)
+        result_cache.invalidate_script(script_id)
+    if script_ids:
+        logger.info("[IMPORTS] Scripts dependientes invalidados: %s", script_ids)
+
+
 @app.get("/scripts/", response_model=List[str])
 async def list_scripts():
     """
     Devuelve la lista de IDs (hashes) de los scripts almacenados.
     """
-    await log_message("[LIST] Listado de scripts solicitado")
-    return list(scripts_map.keys())
+    logger.info("[LIST] Listado de scripts solicitado")
+    return script_storage.list_scripts()
+
+
+async def describe_script(script_id: str) -> Dict[str, Any]:
+    """
+    JSON Schema por función y `.d.ts` del script, desde las firmas
+    precompiladas. En modo proceso se calculan en un worker.
+    """
+    forget_dependents(script_imports.refresh())
+    content = script_storage.get_script_content(script_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Script no encontrado.")
+    try:
+        if process_pool is not None:
+            return await process_pool.describe(script_id, content, script_imports.bundle(script_id, content))
+        module = script_storage.get_script_module(script_id)
+    except ScriptWorkerError as e:
+        status_code = 504 if e.kind == "timeout" else 500
+        raise HTTPException(status_code=status_code, detail=f"Error al cargar el script dinámicamente: {e.message}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al cargar el script dinámicamente: {e}")
+    if module is None:
+        raise HTTPException(status_code=404, detail="Script no encontrado.")
+    return describe_module(module, script_id)
+
+
+@app.get("/scripts/{script_id}/schema")
+async def script_schema(script_id: str):
+    """
+    JSON Schema de parámetros y retorno de cada función pública del script
+    (el mismo con el que se validan las llamadas).
+    """
+    return (await describe_script(script_id))["functions"]
+
+
+@app.get("/scripts/{script_id}/dts")
+async def script_dts(script_id: str):
+    """
+    Declaraciones TypeScript (`.d.ts`) de las funciones públicas del script.
+    """
+    return Response(content=(await describe_script(script_id))["dts"], media_type="text/plain; charset=utf-8")
 
 
 @app.post("/call-script/", response_model=ExecuteScriptResponse)
-async def call_script(request: ExecuteScriptRequest):
+async def call_script(request: ExecuteScriptRequest, http_request: Request, profile: Optional[str] = None):
     """
     Llama la función 'function_name' en el script con id='id', pasando 'params'.
+    Si la función es un generador (sync o async), la respuesta se envía en
+    streaming como NDJSON o como Server-Sent Events (Accept: text/event-stream).
+    Con ?profile=cpu|memory|all la llamada se perfila: el informe vuelve en
+    'profile' y los tiempos en la cabecera Server-Timing.
     """
-    script_id = request.id
-    fn_name = request.function_name
-    params = request.params
+    modes = parse_profile_modes(profile)
+    if modes:
+        return await call_script_profiled(request, http_request, CallProfiler(modes))
 
-    # Verificamos que el script exista
-    if script_id not in scripts_map:
-        await log_message(f"[CALL] Script no encontrado: {script_id}")
-        raise HTTPException(status_code=404, detail="Script no encontrado.")
+    result = await run_script_function(
+        request.id, request.function_name, request.params or {}, timeout=request.timeout
+    )
+    if is_stream(result):
+        logger.info("[CALL] Streaming de resultados: %s, función: %s", request.id, request.function_name, extra=SAMPLED)
+        return stream_response(http_request, result, request.id)
+    # Se responde directamente (sin jsonable_encoder): NumPy y bytes se codifican nativamente.
+    return FastResponse({"result": result})
+
+
+async def call_script_profiled(request: ExecuteScriptRequest, http_request: Request, profiler: CallProfiler):
+    """
+    Variante perfilada de /call-script/ (sólo se usa si se pidió ?profile=).
+    """
+    result = await run_script_function(
+        request.id, request.function_name, request.params or {}, profiler, timeout=request.timeout
+    )
+    headers = {"Server-Timing": profiler.server_timing()}
+    if is_stream(result):
+        response = stream_response(http_request, result, request.id)
+        response.headers.update(headers)
+        return response
+    logger.info("[CALL] Llamada perfilada: %s, función: %s", request.id, request.function_name)
+    return FastResponse({"result": result, "profile": profiler.report()}, headers=headers)
+
+
+@app.post("/call-script-batch/", response_model=List[BatchCallResult])
+async def call_script_batch(requests: List[ExecuteScriptRequest]):
+    """
+    Ejecuta varias llamadas en una sola petición (como mucho BATCH_MAX_CALLS;
+    si no, 413). Se lanzan en paralelo (el dispatcher respeta el límite de
+    concurrencia de cada script) y los resultados vuelven en el mismo orden,
+    con errores por elemento.
+    """
+    if BATCH_MAX_CALLS and len(requests) > BATCH_MAX_CALLS:
+        raise HTTPException(
+            status_code=413, detail=f"El batch tiene {len(requests)} llamadas; el máximo es {BATCH_MAX_CALLS}."
+        )
 
-    script_info = scripts_map[script_id]
-    content = script_info["content"]
-    module = script_info["module"]
+    async def run_item(item: ExecuteScriptRequest) -> Any:
+        result = await run_script_function(item.id, item.function_name, item.params or {}, timeout=item.timeout)
+        if is_stream(result):
+            # En un batch los generadores se materializan completos.
+            result = await collect_stream(result, item.id)
+        return result
+
+    outcomes = await asyncio.gather(*(run_item(r) for r in requests), return_exceptions=True)
+
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, HTTPException):
+            results.append(BatchCallResult(status_code=outcome.status_code, error=str(outcome.detail)))
+        elif isinstance(outcome, BaseException):
+            results.append(BatchCallResult(status_code=500, error=f"Error inesperado: {outcome}"))
+        else:
+            results.append(BatchCallResult(result=outcome))
+    logger.info("[BATCH] %s llamadas ejecutadas", len(requests))
+    return FastResponse([dict(item) for item in results])
+
+
+async def run_script_function(
+    script_id: str,
+    fn_name: str,
+    params: Dict[str, Any],
+    profiler: Optional[CallProfiler] = None,
+    timeout: Optional[float] = None,
+) -> Any:
+    """
+    Ejecuta fn_name(**params) del script y retorna el resultado.
+    Lanza HTTPException con el código adecuado si algo falla (422 si los
+    parámetros no cumplen la firma de la función, 400 si la propia llamada
+    lanza TypeError, 504 si supera su timeout, ver timeouts.py).
+    Registra la llamada (resultado y latencia) en /metrics; el id y el
+    nombre de función sólo se usan como etiquetas una vez resueltos (si no,
+    UNKNOWN_LABEL), para que un cliente no pueda disparar la cardinalidad.
+    Las referencias {"$blob": hash} de 'params' quedan retenidas mientras
+    dura la llamada.
+    """
+    started = time.perf_counter()
+    SCRIPT_CALLS_IN_FLIGHT.inc()
+    blobs: List[str] = []
+    # [script, función] para las métricas; execute_script_function los fija al resolverlos.
+    labels = [UNKNOWN_LABEL, UNKNOWN_LABEL]
+    try:
+        try:
+            resolved, blobs = blob_store.resolve_refs(params)
+        except BlobNotFound as e:
+            logger.info("[CALL] Blob no encontrado: %s", e.args[0])
+            raise HTTPException(status_code=404, detail=f"Blob no encontrado: {e.args[0]}")
+        # El cache de resultados usa los parámetros recibidos: {"$blob": hash} es estable.
+        result = await execute_script_function(script_id, fn_name, resolved, profiler, timeout, labels, params)
+    except HTTPException as e:
+        call_metrics(*labels).observe_error(e.status_code, time.perf_counter() - started)
+        raise
+    finally:
+        blob_store.release(blobs)
+        SCRIPT_CALLS_IN_FLIGHT.dec()
+    call_metrics(*labels).observe_ok(time.perf_counter() - started)
+    return result
+
+
+async def execute_script_function(
+    script_id: str,
+    fn_name: str,
+    params: Dict[str, Any],
+    profiler: Optional[CallProfiler] = None,
+    timeout: Optional[float] = None,
+    labels: Optional[List[str]] = None,
+    cache_params: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Resuelve la llamada: cache de resultados, pool de procesos o ejecución
+    en este proceso a través del dispatcher. Con 'profiler' no se usa el
+    cache de resultados (se quiere medir la función).
+    'labels' ([script, función]) recibe script_id cuando el script existe
+    y fn_name cuando la función se resolvió (ver run_script_function).
+    'cache_params' son los parámetros de la clave del cache de resultados
+    (por defecto 'params').
+    """
+    if labels is None:
+        labels = [UNKNOWN_LABEL, UNKNOWN_LABEL]
+    if cache_params is None:
+        cache_params = params
+    # Scripts importados que otro worker cambió en el storage compartido
+    forget_dependents(script_imports.refresh())
+
+    # Resultado cacheado (sólo funciones ya conocidas como cacheables)
+    cache_policy = result_cache.policy_for(script_id, fn_name)
+    if cache_policy is not None and profiler is None:
+        cached = result_cache.get(script_id, fn_name, cache_params)
+        if not result_cache.is_miss(cached):
+            labels[:] = [script_id, fn_name]
+            return cached
 
-    # Si el módulo no está cargado, lo cargamos
+    # Verificamos que el script exista
+    content = script_storage.get_script_content(script_id)
+    if content is None:
+        logger.info("[CALL] Script no encontrado: %s", script_id)
+        raise HTTPException(status_code=404, detail="Script no encontrado.")
+    labels[0] = script_id
+
+    # Modo proceso: el módulo se carga y queda residente en los workers
+    if process_pool is not None:
+        if profiler is not None:
+            profiler.notes.append("Modo proceso: sólo se mide el tiempo de pared de la llamada al worker.")
+        try:
+            # Los scripts que importa viajan con él (el worker no tiene storage).
+            libraries = script_imports.bundle(script_id, content)
+            if profiler is not None:
+                with profiler.phase("call"):
+                    result, meta = await process_pool.call(script_id, content, fn_name, params, timeout, libraries)
+            else:
+                result, meta = await process_pool.call(script_id, content, fn_name, params, timeout, libraries)
+            logger.info("[CALL] Ejecución OK (proceso) en script: %s, función: %s", script_id, fn_name, extra=SAMPLED)
+            labels[1] = fn_name
+        except ScriptWorkerError as e:
+            logger.info(
+                "[CALL] Error (%s) en script: %s, función: %s, error: %s", e.kind, script_id, fn_name, e.message
+            )
+            if e.kind not in ("missing_function", "load_error", "worker_died"):
+                labels[1] = fn_name
+            if e.kind == "timeout":
+                SCRIPT_CALL_TIMEOUTS.labels("process").inc()
+                raise HTTPException(status_code=504, detail=e.message)
+            if e.kind == "missing_function":
+                raise HTTPException(status_code=400, detail=e.message)
+            if e.kind == "invalid_params":
+                raise HTTPException(status_code=422, detail=f"Parámetros inválidos: {e.message}")
+            if e.kind == "type_error":
+                raise HTTPException(status_code=400, detail=f"Error en los parámetros: {e.message}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error en la ejecución de la función: {e.message}"
+            )
+        cache_result(script_id, fn_name, cache_params, result, meta.get("cache"))
+        return result
+
+    # El storage carga el módulo si no está en memoria (o fue desalojado)
+    try:
+        if profiler is not None:
+            with profiler.phase("load"):
+                module = script_storage.get_script_module(script_id)
+        else:
+            module = script_storage.get_script_module(script_id)
+    except Exception as e:
+        logger.info("[CALL] Error al cargar el script: %s, error: %s", script_id, e)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al cargar el script dinámicamente: {e}"
+        )
     if module is None:
-        module = load_script_module(script_id, content)
-        script_info["module"] = module
-        await log_message(f"[CALL] Módulo cargado dinámicamente para script: {script_id}")
+        logger.info("[CALL] Script no encontrado: %s", script_id)
+        raise HTTPException(status_code=404, detail="Script no encontrado.")
 
     # Verificamos que la función exista
     if not hasattr(module, fn_name):
-        await log_message(f"[CALL] Función '{fn_name}' inexistente en script: {script_id}")
+        logger.info("[CALL] Función '%s' inexistente en script: %s", fn_name, script_id)
         raise HTTPException(
             status_code=400,
             detail=f"No existe la función '{fn_name}' en el script."
         )
 
     fn = getattr(module, fn_name)
+    labels[1] = fn_name
+    # Validador precompilado desde la firma: los parámetros inválidos no llegan al dispatcher.
+    # El cache de resultados sigue usando los parámetros recibidos como clave.
+    try:
+        kwargs = validate_params(fn, params)
+    except InvalidParameters as e:
+        logger.info("[CALL] Parámetros inválidos en script: %s, función: %s, error: %s", script_id, fn_name, e)
+        raise HTTPException(status_code=422, detail=f"Parámetros inválidos: {e}")
+    kind = None
+    if profiler is not None:
+        kind = call_kind(fn)
+        fn = profiler.wrap(fn, kind)
+    wall = resolve_timeout(timeout, declared_timeout(module, fn_name))
     try:
-        result = fn(**params)
-        await log_message(f"[CALL] Ejecución OK en script: {script_id}, función: {fn_name}")
+        result = await dispatcher.dispatch(script_id, fn, materialize_blob_refs(kwargs), kind=kind, timeout=wall)
+        logger.info("[CALL] Ejecución OK en script: %s, función: %s", script_id, fn_name, extra=SAMPLED)
+    except DispatcherOverloaded as e:
+        logger.info("[CALL] Rechazada por sobrecarga: %s, función: %s", script_id, fn_name)
+        raise HTTPException(status_code=503, detail=str(e))
+    except CallTimeout as e:
+        logger.info("[CALL] Timeout en script: %s, función: %s, error: %s", script_id, fn_name, e)
+        SCRIPT_CALL_TIMEOUTS.labels("inline").inc()
+        raise HTTPException(status_code=504, detail=str(e))
     except TypeError as e:
-        await log_message(f"[CALL] TypeError en script: {script_id}, función: {fn_name}, error: {e}")
+        logger.info("[CALL] TypeError en script: %s, función: %s, error: %s", script_id, fn_name, e)
         raise HTTPException(
             status_code=400,
             detail=f"Error en los parámetros: {e}"
         )
     except Exception as e:
-        await log_message(f"[CALL] Error en ejecución de script: {script_id}, función: {fn_name}, error: {e}")
+        logger.info("[CALL] Error en ejecución de script: %s, función: %s, error: %s", script_id, fn_name, e)
         raise HTTPException(
             status_code=500,
             detail=f"Error en la ejecución de la función: {e}"
         )
 
-    return ExecuteScriptResponse(result=result)
+    cache_result(script_id, fn_name, cache_params, result, get_cache_policy(module, fn_name))
+    return result
+
+
+def cache_result(script_id: str, fn_name: str, params: Dict[str, Any], result: Any, policy: Optional[Dict[str, Any]]):
+    """
+    Guarda el resultado si la función fue declarada cacheable por el script
+    (con ttl=0 no se guarda).
+    """
+    if policy is None or policy["ttl"] <= 0 or is_stream(result):
+        return
+    result_cache.remember_policy(script_id, fn_name, policy)
+    result_cache.set(script_id, fn_name, params, result, policy["ttl"])
 
 
 @app.post("/update-script/{script_id}")
@@ -166,14 +630,15 @@ async def update_script(script_id: str, request: UpdateScriptRequest):
     Resetea 'module' a None para forzar recarga en la próxima ejecución.
     Retorna el nuevo contenido.
     """
-    if script_id not in scripts_map:
-        await log_message(f"[UPDATE] Script no encontrado: {script_id}")
+    if not script_storage.script_exists(script_id):
+        logger.info("[UPDATE] Script no encontrado: %s", script_id)
         raise HTTPException(status_code=404, detail="Script no encontrado.")
 
     new_content = request.new_script
-    scripts_map[script_id]["content"] = new_content
-    scripts_map[script_id]["module"] = None
-    await log_message(f"[UPDATE] Script actualizado: {script_id}")
+    script_storage.store_script(script_id, new_content)
+    result_cache.invalidate_script(script_id)
+    forget_dependents(script_imports.invalidate(script_id))
+    logger.info("[UPDATE] Script actualizado: %s", script_id)
 
     return {
         "id": script_id,
@@ -186,40 +651,22 @@ async def delete_script(script_id: str):
     """
     Elimina completamente el script (y el módulo) del almacenamiento en memoria.
     """
-    if script_id not in scripts_map:
-        await log_message(f"[DELETE] Script no encontrado: {script_id}")
+    if not script_storage.script_exists(script_id):
+        logger.info("[DELETE] Script no encontrado: %s", script_id)
         raise HTTPException(status_code=404, detail="Script no encontrado.")
 
-    del scripts_map[script_id]
-    await log_message(f"[DELETE] Script eliminado: {script_id}")
+    script_storage.delete_script(script_id)
+    result_cache.invalidate_script(script_id)
+    forget_dependents(script_imports.invalidate(script_id, deleted=True))
+    forget_script(script_id)
+    logger.info("[DELETE] Script eliminado: %s", script_id)
     return {"status": f"Script {script_id} eliminado exitosamente."}
 
 
-# ========== Función Auxiliar para cargar el módulo ==========
-def load_script_module(script_id: str, script_content: str):
-    """
-    Carga dinámicamente 'script_content' en un módulo Python usando importlib.
-    Retorna el módulo importado.
-    """
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        script_path = os.path.join(tmp_dir, f"{script_id}.py")
-        with open(script_path, "w", encoding="utf-8") as f:
-            f.write(script_content)
-
-        spec = importlib.util.spec_from_file_location(script_id, script_path)
-        if spec is None:
-            raise RuntimeError("No se pudo crear el spec de importación.")
-
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-
-    return module
-
-
 # ========== Template para dashboard (opcional) ==========
 templates = Jinja2Templates(directory="app/templates")
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    await log_message("[DASHBOARD] Renderizando página principal")
+    logger.info("[DASHBOARD] Renderizando página principal")
     return templates.TemplateResponse("dashboard.html", {"request": request})
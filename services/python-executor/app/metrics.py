@@ -0,0 +1,198 @@
+# metrics.py
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    disable_created_metrics,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Buckets (segundos) de los histogramas de latencia de llamadas.
+METRICS_LATENCY_BUCKETS = tuple(
+    float(b) for b in os.environ.get(
+        "METRICS_LATENCY_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+    ).split(",")
+)
+
+# Sin series *_created: la mitad de líneas por scrape.
+disable_created_metrics()
+
+# Registro propio: /metrics expone sólo las métricas del servicio.
+REGISTRY = CollectorRegistry()
+
+SCRIPT_CALLS = Counter(
+    "script_calls_total",
+    "Llamadas a funciones de scripts por resultado (ok o código HTTP de error).",
+    ["script", "function", "status"],
+    registry=REGISTRY,
+)
+SCRIPT_CALL_SECONDS = Histogram(
+    "script_call_duration_seconds",
+    "Latencia de las llamadas a funciones de scripts.",
+    ["script", "function"],
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+SCRIPT_CALLS_IN_FLIGHT = Gauge(
+    "script_calls_in_flight",
+    "Llamadas a funciones en curso.",
+    registry=REGISTRY,
+)
+SCRIPT_CALL_TIMEOUTS = Counter(
+    "script_call_timeouts_total",
+    "Llamadas interrumpidas por superar su timeout, por modo de ejecución (inline, process, session).",
+    ["mode"],
+    registry=REGISTRY,
+)
+SCRIPT_COMPILE_SECONDS = Histogram(
+    "script_compile_seconds",
+    "Tiempo de compilación de scripts (sólo fallos del cache de code objects).",
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+SCRIPT_LOAD_SECONDS = Histogram(
+    "script_module_load_seconds",
+    "Tiempo de ejecución del cuerpo de un script al cargarlo como módulo.",
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=REGISTRY,
+)
+
+# Las llamadas a scripts o funciones que no se llegaron a resolver (ids o
+# nombres inexistentes) comparten etiqueta para que un cliente no pueda
+# disparar la cardinalidad.
+UNKNOWN_LABEL = "_unknown"
+
+
+class CallMetrics:
+    """
+    Hijos ya enlazados de las métricas de una (script, función): registrar
+    una llamada no construye diccionarios de etiquetas.
+    """
+
+    __slots__ = ("script", "function", "calls_ok", "latency", "_errors")
+
+    def __init__(self, script: str, function: str):
+        self.script = script
+        self.function = function
+        self.calls_ok = SCRIPT_CALLS.labels(script, function, "ok")
+        self.latency = SCRIPT_CALL_SECONDS.labels(script, function)
+        self._errors: Dict[Any, Any] = {}
+
+    def observe_ok(self, seconds: float) -> None:
+        self.calls_ok.inc()
+        self.latency.observe(seconds)
+
+    def observe_error(self, status: Any, seconds: float) -> None:
+        """
+        'status' es el código HTTP de la respuesta o "error".
+        """
+        child = self._errors.get(status)
+        if child is None:
+            child = SCRIPT_CALLS.labels(self.script, self.function, str(status))
+            self._errors[status] = child
+        child.inc()
+        self.latency.observe(seconds)
+
+
+_call_metrics: Dict[str, Dict[str, CallMetrics]] = {}
+_call_metrics_lock = threading.Lock()
+
+
+def call_metrics(script: str, function: str) -> CallMetrics:
+    """
+    Retorna (creándolos la primera vez) los hijos de métricas de la función.
+    """
+    by_function = _call_metrics.get(script)
+    if by_function is not None:
+        metrics = by_function.get(function)
+        if metrics is not None:
+            return metrics
+    with _call_metrics_lock:
+        by_function = _call_metrics.setdefault(script, {})
+        metrics = by_function.get(function)
+        if metrics is None:
+            metrics = by_function[function] = CallMetrics(script, function)
+        return metrics
+
+
+def forget_script(script: str) -> None:
+    """
+    Elimina las series de un script (llamar al borrarlo o actualizarlo).
+    """
+    with _call_metrics_lock:
+        by_function = _call_metrics.pop(script, {})
+    for function, metrics in by_function.items():
+        for status in ["ok"] + [str(code) for code in metrics._errors]:
+            try:
+                SCRIPT_CALLS.remove(script, function, status)
+            except KeyError:
+                pass
+        try:
+            SCRIPT_CALL_SECONDS.remove(script, function)
+        except KeyError:
+            pass
+
+
+class _StatsCollector:
+    """
+    Expone como métricas los stats() que ya llevan los componentes (cache de
+    resultados, dispatcher, storage...). Se leen sólo al hacer scrape.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Tuple[Callable[[], Dict[str, Any]], Tuple[str, ...]]] = {}
+
+    def add(self, prefix: str, stats: Callable[[], Dict[str, Any]], counters: Iterable[str]) -> None:
+        self._sources[prefix] = (stats, tuple(counters))
+
+    def collect(self):
+        for prefix, (stats, counters) in list(self._sources.items()):
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                if key in counters:
+                    yield CounterMetricFamily(name, f"{prefix}: {key}", value=value)
+                else:
+                    yield GaugeMetricFamily(name, f"{prefix}: {key}", value=value)
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_stats(
+    prefix: str, stats: Callable[[], Dict[str, Any]], counters: Iterable[str] = ()
+) -> None:
+    """
+    Publica los valores numéricos de stats() como '<prefix>_<clave>'.
+    Las claves de 'counters' se exponen como contadores, el resto como gauges.
+    """
+    _stats_collector.add(prefix, stats, counters)
+
+
+def register_gauge(name: str, documentation: str, value: Callable[[], float]) -> Gauge:
+    """
+    Gauge cuyo valor se calcula al hacer scrape (p.ej. sesiones activas).
+    """
+    gauge = Gauge(name, documentation, registry=REGISTRY)
+    gauge.set_function(value)
+    return gauge
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Métricas en formato de texto de Prometheus y su content type.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
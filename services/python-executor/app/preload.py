@@ -0,0 +1,36 @@
+# preload.py
+import importlib
+import os
+import time
+from typing import Any, Dict, Iterable, List
+
+# Paquetes pesados a importar una sola vez (p.ej. "bpy,langchain,langchain_openai,langgraph").
+PRELOAD_PACKAGES: List[str] = [
+    name.strip() for name in os.environ.get("PRELOAD_PACKAGES", "").split(",") if name.strip()
+]
+
+# Tiempos de importación por paquete en este proceso (heredados por los hijos tras un fork).
+PRELOAD_TIMINGS: Dict[str, Dict[str, Any]] = {}
+
+
+def preload_packages(names: Iterable[str] = PRELOAD_PACKAGES) -> Dict[str, Dict[str, Any]]:
+    """
+    Importa cada paquete (si no se importó ya) y registra cuánto tardó.
+    Un paquete que falla no impide precargar el resto.
+    """
+    for name in names:
+        if name in PRELOAD_TIMINGS:
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            error = None
+        except Exception as e:
+            error = str(e)
+        PRELOAD_TIMINGS[name] = {
+            "seconds": time.perf_counter() - start,
+            "ok": error is None,
+            "error": error,
+            "pid": os.getpid(),
+        }
+    return PRELOAD_TIMINGS
@@ -0,0 +1,632 @@
+# process_pool.py
+import asyncio
+import inspect
+import multiprocessing
+import os
+import socket
+import struct
+import time
+from collections import OrderedDict, deque
+from multiprocessing.reduction import ForkingPickler
+from types import ModuleType
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from .script_loader import load_script_module, script_content_hash
+from .result_cache import get_cache_policy
+from .preload import PRELOAD_PACKAGES, PRELOAD_TIMINGS, preload_packages
+from .blob_store import materialize_blob_refs
+from .script_imports import bundle_hash, install_worker_libraries
+from .signatures import InvalidParameters, describe_module, module_signatures, validate_params
+from .timeouts import (
+    SCRIPT_CPU_TIMEOUT,
+    CallTimeout,
+    declared_timeout,
+    preempt_after,
+    resolve_timeout,
+    worker_deadline,
+)
+
+# Modo de ejecución de /call-script/: "inline" (en el event loop) o "process" (pool de workers).
+EXECUTION_MODE = os.environ.get("SCRIPT_EXECUTION_MODE", "inline")
+PROCESS_POOL_SIZE = int(os.environ.get("PROCESS_POOL_SIZE", str(os.cpu_count() or 1)))
+# spawn, fork o forkserver. Con forkserver los paquetes de PRELOAD_PACKAGES se
+# importan una vez en el proceso zygote y los workers nacen con fork() desde él.
+PROCESS_START_METHOD = os.environ.get("PROCESS_START_METHOD", "spawn")
+# Módulos que cada worker mantiene cargados (LRU por hash de contenido).
+WORKER_MODULE_CACHE_SIZE = int(os.environ.get("WORKER_MODULE_CACHE_SIZE", "256"))
+# Los mensajes del pipe a partir de este tamaño (bytes serializados) se
+# envían y reciben en un hilo: no caben en el buffer del socket y bloquearían
+# el event loop mientras el otro extremo los lee o los escribe.
+PIPE_INLINE_BYTES = int(os.environ.get("PIPE_INLINE_BYTES", str(64 * 1024)))
+
+
+class ScriptWorkerError(Exception):
+    """
+    Error reportado por un worker. 'kind' indica el tipo de fallo:
+    load_error, missing_function, invalid_params, type_error,
+    execution_error, serialization_error, timeout o worker_died.
+    """
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+        self.message = message
+
+
+# ========== Lado del worker ==========
+
+def _load_cached(
+    modules: "OrderedDict[str, ModuleType]",
+    script_id: str,
+    content_hash: str,
+    content: Optional[str],
+    libraries: Optional[Dict[str, Tuple[str, str]]],
+) -> Any:
+    """
+    Módulo del script desde el cache del worker (cargándolo si hace falta),
+    o la respuesta de error para el padre.
+    """
+    module = modules.get(content_hash)
+    if module is None:
+        if content is None:
+            # El padre no envió el contenido porque creía que ya estaba cargado.
+            return ("missing",)
+        try:
+            if libraries:
+                install_worker_libraries(libraries)
+            module = load_script_module(script_id, content)
+        except Exception as e:
+            return ("error", "load_error", str(e))
+        # Validadores precompilados al cargar, no en la primera llamada.
+        module_signatures(module)
+        modules[content_hash] = module
+        while len(modules) > WORKER_MODULE_CACHE_SIZE:
+            modules.popitem(last=False)
+    else:
+        modules.move_to_end(content_hash)
+    return module
+
+
+def _handle_call(modules: "OrderedDict[str, ModuleType]", message: tuple) -> tuple:
+    _, script_id, content_hash, content, fn_name, params, requested_timeout, libraries = message
+
+    module = _load_cached(modules, script_id, content_hash, content, libraries)
+    if isinstance(module, tuple):
+        return module
+
+    fn = getattr(module, fn_name, None)
+    if fn is None:
+        return ("error", "missing_function", f"No existe la función '{fn_name}' en el script.")
+    try:
+        params = validate_params(fn, params)
+    except InvalidParameters as e:
+        return ("error", "invalid_params", str(e))
+
+    # El worker interrumpe la llamada él mismo (SIGALRM/SIGPROF) con el
+    # timeout efectivo; si no lo logra, el padre lo mata (ver worker_deadline).
+    wall = resolve_timeout(requested_timeout, declared_timeout(module, fn_name))
+    try:
+        with preempt_after(wall, SCRIPT_CPU_TIMEOUT or None):
+            # Los BlobRef se abren aquí: el worker mapea el archivo del blob.
+            result = fn(**materialize_blob_refs(params))
+            if inspect.iscoroutine(result):
+                result = asyncio.run(result)
+    except CallTimeout as e:
+        return ("error", "timeout", str(e))
+    except TypeError as e:
+        return ("error", "type_error", str(e))
+    except Exception as e:
+        return ("error", "execution_error", str(e))
+
+    # Metadatos para el padre (p.ej. política de cache de resultados).
+    meta = {"cache": get_cache_policy(module, fn_name)}
+    if inspect.isgenerator(result) or inspect.isasyncgen(result):
+        return ("stream", meta, result)
+    return ("ok", result, meta)
+
+
+def serve_stream(conn, generator, loop: Optional[asyncio.AbstractEventLoop] = None, encode=None) -> None:
+    """
+    Entrega los chunks de un generador bajo demanda: el padre pide cada
+    chunk con ("next",) y puede abortar con ("cancel",).
+    Si no se pasa 'loop', los generadores async usan un loop propio.
+    'encode' permite transformar cada chunk antes de enviarlo.
+    """
+    is_async = inspect.isasyncgen(generator)
+    own_loop = is_async and loop is None
+    if own_loop:
+        loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] != "next":
+                return
+            try:
+                if is_async:
+                    item = loop.run_until_complete(generator.__anext__())
+                else:
+                    item = next(generator)
+            except (StopIteration, StopAsyncIteration):
+                conn.send(("end",))
+                return
+            except Exception as e:
+                conn.send(("error", "execution_error", str(e)))
+                return
+            try:
+                conn.send(("chunk", encode(item) if encode else item))
+            except Exception as e:
+                conn.send(("error", "serialization_error", str(e)))
+                return
+    finally:
+        try:
+            if is_async:
+                loop.run_until_complete(generator.aclose())
+            else:
+                generator.close()
+        except Exception:
+            pass
+        if own_loop:
+            loop.close()
+
+
+def script_worker_main(conn) -> None:
+    """
+    Bucle principal de un worker: recibe mensajes por el pipe y responde.
+    Los módulos se mantienen residentes entre llamadas.
+    """
+    # Con forkserver ya vienen importados del zygote; con spawn/fork se importan aquí.
+    preload_packages(PRELOAD_PACKAGES)
+
+    modules: "OrderedDict[str, ModuleType]" = OrderedDict()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        op = message[0]
+        if op == "stop":
+            break
+        generator = None
+        if op == "call":
+            reply = _handle_call(modules, message)
+            if reply[0] == "stream":
+                generator = reply[2]
+                reply = reply[:2]
+        elif op == "describe":
+            _, script_id, content_hash, content, libraries = message
+            module = _load_cached(modules, script_id, content_hash, content, libraries)
+            reply = module if isinstance(module, tuple) else ("ok", describe_module(module, script_id), {})
+        elif op == "stats":
+            reply = ("ok", {
+                "pid": os.getpid(),
+                "modules_loaded": len(modules),
+                "preload": PRELOAD_TIMINGS,
+            }, {})
+        elif op in ("next", "cancel"):
+            # Restos de un stream ya terminado.
+            continue
+        else:
+            reply = ("error", "execution_error", f"Operación desconocida: {op}")
+
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # El resultado no se puede serializar (pickle) para enviarlo al padre.
+            conn.send(("error", "serialization_error", str(e)))
+            continue
+
+        if generator is not None:
+            serve_stream(conn, generator)
+
+
+# ========== Lado del padre ==========
+
+def get_worker_context(start_method: str = PROCESS_START_METHOD):
+    """
+    Contexto de multiprocessing para crear workers. Con forkserver, el
+    proceso zygote precarga los paquetes de PRELOAD_PACKAGES.
+    """
+    ctx = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        ctx.set_forkserver_preload([f"{__package__}.zygote"])
+    return ctx
+
+
+class WorkerProcess:
+    """
+    Proceso hijo con un canal Pipe dedicado. Las respuestas se esperan
+    registrando el descriptor en el event loop, sin bloquear hilos; los
+    mensajes grandes (PIPE_INLINE_BYTES) se envían y leen en un hilo.
+    """
+
+    def __init__(self, ctx, target):
+        self._conn, child_conn = ctx.Pipe()
+        # Vista del mismo socket para consultar el tamaño del siguiente mensaje (ver _next_size).
+        try:
+            self._peek: Optional[socket.socket] = socket.socket(fileno=os.dup(self._conn.fileno()))
+        except OSError:
+            self._peek = None
+        # Envío o recepción en curso en un hilo (mensajes grandes).
+        self._transfer: Optional[asyncio.Future] = None
+        self.process = ctx.Process(target=target, args=(child_conn,), daemon=True)
+        self.started_at = time.perf_counter()
+        self.process.start()
+        # Segundos desde el arranque hasta la primera respuesta (ver warmup()).
+        self.startup_seconds: Optional[float] = None
+        self.stats: Dict[str, Any] = {}
+        child_conn.close()
+        # Hashes que (según el padre) este worker tiene cargados.
+        self.loaded: set = set()
+        # Respuestas que el worker todavía debe enviar (peticiones canceladas).
+        self.pending_replies = 0
+        # El pool no reutiliza workers con una petición cancelada a mitad:
+        # podrían seguir ocupados con ella.
+        self.broken = False
+        # Se llama con cada respuesta descartada (p.ej. para liberar su memoria compartida).
+        self.on_discard: Optional[Callable[[tuple], None]] = None
+
+    def _next_size(self) -> Optional[int]:
+        """
+        Tamaño del mensaje que espera en el pipe, leído de su cabecera sin
+        consumirla, o None si no se puede saber (se tratará como grande).
+        """
+        if self._peek is None:
+            return None
+        try:
+            header = self._peek.recv(4, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except OSError:
+            return None
+        if len(header) < 4:
+            return None
+        size = struct.unpack("!i", header)[0]
+        # -1: mensaje de más de 2 GiB (el tamaño va en una segunda cabecera).
+        return None if size < 0 else size
+
+    async def _in_thread(self, fn: Callable, *args: Any) -> Any:
+        # Una cancelación no interrumpe el hilo: la transferencia termina igual
+        # y la siguiente petición espera a que acabe (ver request).
+        self._transfer = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+        return await asyncio.shield(self._transfer)
+
+    def _discard_late(self, transfer: asyncio.Future) -> None:
+        # Respuesta que se terminó de leer en un hilo tras cancelarse la espera.
+        if transfer.cancelled() or transfer.exception() is not None:
+            return
+        self.pending_replies -= 1
+        if self.on_discard is not None:
+            self.on_discard(transfer.result())
+
+    async def _receive(self) -> tuple:
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self._conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        size = self._next_size()
+        if size is not None and size < PIPE_INLINE_BYTES:
+            reply = self._conn.recv()
+        else:
+            try:
+                reply = await self._in_thread(self._conn.recv)
+            except asyncio.CancelledError:
+                self._transfer.add_done_callback(self._discard_late)
+                raise
+        self.pending_replies -= 1
+        return reply
+
+    async def _send(self, message: tuple) -> None:
+        data = ForkingPickler.dumps(message)
+        if len(data) < PIPE_INLINE_BYTES:
+            self._conn.send_bytes(data)
+        else:
+            await self._in_thread(self._conn.send_bytes, data)
+
+    async def request(self, message: tuple) -> tuple:
+        try:
+            if self._transfer is not None and not self._transfer.done():
+                await asyncio.wait({self._transfer})
+            # Descartamos respuestas de peticiones canceladas antes de tiempo.
+            while self.pending_replies:
+                reply = await self._receive()
+                if self.on_discard is not None:
+                    self.on_discard(reply)
+            # Se cuenta antes de enviar: si la espera se cancela, el envío termina
+            # igual en su hilo y la respuesta se descartará.
+            self.pending_replies += 1
+            await self._send(message)
+            return await self._receive()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            # is_alive() puede seguir siendo True un instante tras el EOF.
+            self.broken = True
+            raise ScriptWorkerError("worker_died", f"El worker terminó inesperadamente: {e}")
+
+    def send(self, message: tuple) -> None:
+        """
+        Envía un mensaje sin esperar respuesta.
+        """
+        self._conn.send(message)
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        try:
+            self._conn.send(("stop",))
+        except Exception:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self._conn.close()
+        if self._peek is not None:
+            self._peek.close()
+
+
+class WorkerStream:
+    """
+    Iterador async sobre los chunks de un generador que corre en un worker.
+    Cada chunk se pide explícitamente (backpressure). El worker queda
+    reservado hasta que el stream termina o se llama a aclose().
+    """
+
+    def __init__(
+        self,
+        worker: WorkerProcess,
+        release: Callable[[WorkerProcess], None],
+        decode: Optional[Callable[[Any], Any]] = None,
+    ):
+        self._worker = worker
+        self._release = release
+        self._decode = decode
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._done:
+            raise StopAsyncIteration
+        try:
+            reply = await self._worker.request(("next",))
+        except asyncio.CancelledError:
+            # El worker enviará el chunk en curso y luego leerá el cancel.
+            self._worker.broken = True
+            try:
+                self._worker.send(("cancel",))
+            except Exception:
+                pass
+            self._finish()
+            raise
+        except ScriptWorkerError:
+            self._finish()
+            raise
+
+        if reply[0] == "chunk":
+            return self._decode(reply[1]) if self._decode else reply[1]
+        self._finish()
+        if reply[0] == "end":
+            raise StopAsyncIteration
+        raise ScriptWorkerError(reply[1], reply[2])
+
+    async def aclose(self) -> None:
+        if self._done:
+            return
+        # El consumidor cerró el stream: el worker descarta el generador.
+        try:
+            self._worker.send(("cancel",))
+        except Exception:
+            self._worker.broken = True
+        self._finish()
+
+    def _finish(self) -> None:
+        if not self._done:
+            self._done = True
+            self._release(self._worker)
+
+
+class ScriptProcessPool:
+    """
+    Pool de workers calientes para ejecutar funciones de scripts fuera del event loop.
+    Cada worker cachea los módulos por hash de contenido; el padre prefiere
+    despachar a un worker que ya tiene el script cargado y sólo envía el
+    contenido cuando el worker no lo tiene.
+    """
+
+    def __init__(self, size: int = PROCESS_POOL_SIZE, start_method: str = PROCESS_START_METHOD):
+        self.size = max(1, size)
+        self.start_method = start_method
+        self._ctx = get_worker_context(start_method)
+        self._workers: List[WorkerProcess] = []
+        self._idle: List[WorkerProcess] = []
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Reemplazos de workers en curso (ver _release).
+        self._replacing: Set[asyncio.Task] = set()
+        self._closed = False
+
+    def _spawn_worker(self) -> WorkerProcess:
+        return WorkerProcess(self._ctx, script_worker_main)
+
+    def start(self) -> None:
+        for _ in range(self.size):
+            worker = self._spawn_worker()
+            self._workers.append(worker)
+            self._idle.append(worker)
+
+    async def warmup(self) -> List[Dict[str, Any]]:
+        """
+        Espera a que todos los workers respondan y retorna, por worker, el
+        tiempo de arranque y los tiempos de importación de cada paquete precargado.
+        """
+        workers = list(self._idle)
+        self._idle.clear()
+        try:
+            replies = await asyncio.gather(
+                *(worker.request(("stats",)) for worker in workers), return_exceptions=True
+            )
+        finally:
+            for worker in workers:
+                self._release(worker)
+
+        for worker, reply in zip(workers, replies):
+            if isinstance(reply, tuple) and reply[0] == "ok":
+                worker.startup_seconds = time.perf_counter() - worker.started_at
+                worker.stats = reply[1]
+        return self.startup_report()
+
+    def startup_report(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "start_method": self.start_method,
+                "startup_seconds": worker.startup_seconds,
+                **worker.stats,
+            }
+            for worker in self._workers
+        ]
+
+    def shutdown(self) -> None:
+        self._closed = True
+        for worker in self._workers:
+            worker.stop()
+        self._workers.clear()
+        self._idle.clear()
+
+    async def _acquire(self, content_hash: str) -> WorkerProcess:
+        if self._idle:
+            # Afinidad: preferimos un worker que ya tenga el módulo residente.
+            for index, worker in enumerate(self._idle):
+                if content_hash in worker.loaded:
+                    return self._idle.pop(index)
+            return self._idle.pop()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            raise
+
+    def _release(self, worker: WorkerProcess) -> None:
+        if worker.broken or not worker.is_alive():
+            # Parar el proceso y arrancar otro bloquea: se hace fuera del event
+            # loop y el worker nuevo se entrega al terminar.
+            task = asyncio.get_running_loop().create_task(self._replace(worker))
+            self._replacing.add(task)
+            task.add_done_callback(self._replacing.discard)
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(worker)
+                return
+        self._idle.append(worker)
+
+    async def _replace(self, worker: WorkerProcess) -> None:
+        await asyncio.to_thread(worker.stop, 0.1)
+        new_worker = await asyncio.to_thread(self._spawn_worker)
+        if self._closed:
+            await asyncio.to_thread(new_worker.stop, 0.1)
+            return
+        self._workers[self._workers.index(worker)] = new_worker
+        self._release(new_worker)
+
+    async def _request_within(self, worker: WorkerProcess, message: tuple, deadline: Optional[float]) -> tuple:
+        if deadline is None:
+            return await worker.request(message)
+        try:
+            return await asyncio.wait_for(worker.request(message), deadline)
+        except asyncio.TimeoutError:
+            # El worker no logró interrumpir la llamada: se mata y se reemplaza.
+            worker.broken = True
+            raise ScriptWorkerError(
+                "timeout", f"La llamada superó su tiempo máximo; el worker fue reiniciado ({deadline:g}s)."
+            ) from None
+
+    async def call(
+        self,
+        script_id: str,
+        content: str,
+        fn_name: str,
+        params: Dict[str, Any],
+        timeout: Optional[float] = None,
+        libraries: Optional[Dict[str, Tuple[str, str]]] = None,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Ejecuta fn_name(**params) del script en un worker.
+        Retorna (resultado, metadatos). Si la función es un generador, el
+        resultado es un WorkerStream con los chunks del worker.
+        'timeout' es el pedido por la petición; el worker lo combina con el
+        declarado por el script (ver timeouts.resolve_timeout).
+        'libraries' son los scripts que importa (ver ScriptImports.bundle):
+        se envían junto con el contenido y forman parte de la clave del
+        módulo en el worker, así que un cambio en ellos lo recarga.
+        Lanza ScriptWorkerError si el worker reporta un fallo (kind "timeout"
+        si la llamada venció).
+        """
+        content_hash = bundle_hash(script_content_hash(content), libraries or {})
+        worker = await self._acquire(content_hash)
+        streaming = False
+        deadline = worker_deadline(timeout)
+        try:
+            if content_hash in worker.loaded:
+                message = ("call", script_id, content_hash, None, fn_name, params, timeout, None)
+            else:
+                message = ("call", script_id, content_hash, content, fn_name, params, timeout, libraries)
+            reply = await self._request_within(worker, message, deadline)
+            if reply[0] == "missing":
+                message = ("call", script_id, content_hash, content, fn_name, params, timeout, libraries)
+                reply = await self._request_within(worker, message, deadline)
+
+            if reply[0] == "ok":
+                worker.loaded.add(content_hash)
+                return reply[1], reply[2]
+            if reply[0] == "stream":
+                worker.loaded.add(content_hash)
+                streaming = True
+                return WorkerStream(worker, self._release), reply[1]
+
+            _, kind, message = reply
+            if kind == "load_error":
+                worker.loaded.discard(content_hash)
+            else:
+                worker.loaded.add(content_hash)
+            raise ScriptWorkerError(kind, message)
+        except asyncio.CancelledError:
+            worker.broken = True
+            raise
+        finally:
+            if not streaming:
+                self._release(worker)
+
+    async def describe(
+        self, script_id: str, content: str, libraries: Optional[Dict[str, Tuple[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        JSON Schema por función y `.d.ts` del script (ver
+        signatures.describe_module), calculados en un worker: el código del
+        script no se ejecuta en el proceso del servidor.
+        """
+        content_hash = bundle_hash(script_content_hash(content), libraries or {})
+        worker = await self._acquire(content_hash)
+        try:
+            # Cargar el script ejecuta su código: con el mismo límite que una llamada.
+            message = ("describe", script_id, content_hash, content, libraries)
+            reply = await self._request_within(worker, message, worker_deadline(None))
+            if reply[0] == "error":
+                raise ScriptWorkerError(reply[1], reply[2])
+            worker.loaded.add(content_hash)
+            return reply[1]
+        except asyncio.CancelledError:
+            worker.broken = True
+            raise
+        finally:
+            self._release(worker)
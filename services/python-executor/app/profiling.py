@@ -0,0 +1,218 @@
+# profiling.py
+import contextlib
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from .dispatcher import CALL_ASYNC, CALL_SYNC
+
+# Entradas que se devuelven por defecto en cada sección del perfil.
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "20"))
+# Frames que guarda tracemalloc por asignación.
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1"))
+
+PROFILE_MODES = {"cpu", "memory"}
+
+# tracemalloc es global al proceso: se arranca con la primera llamada
+# perfilada y se detiene con la última.
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+
+
+def parse_profile_modes(value: Optional[str]) -> Set[str]:
+    """
+    Interpreta el parámetro ?profile=: "cpu", "memory", "cpu,memory" o
+    "all"/"1"/"true" (ambos). Valores desconocidos se ignoran.
+    """
+    if not value:
+        return set()
+    modes = {part.strip().lower() for part in value.split(",")}
+    if modes & {"all", "1", "true", "yes"}:
+        return set(PROFILE_MODES)
+    return modes & PROFILE_MODES
+
+
+def _acquire_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc() -> None:
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+class CallProfiler:
+    """
+    Perfil de una única llamada. Sólo se crea cuando el cliente lo pide,
+    de modo que las llamadas normales no pagan nada.
+
+    - phase(nombre): mide el tiempo de pared de una fase (p.ej. "load").
+    - wrap(fn, kind): retorna fn envuelta para ejecutarse bajo cProfile y
+      medir su tiempo de CPU en el hilo donde corre. En funciones async el
+      perfil incluye lo que el event loop ejecute mientras tanto.
+    - report() / server_timing(): resultados para el cuerpo y la cabecera.
+    """
+
+    def __init__(self, modes: Set[str], top: int = PROFILE_TOP_N):
+        self.modes = modes
+        self.top = top
+        self.timings: Dict[str, float] = {}
+        self.notes: List[str] = []
+        self._profile = cProfile.Profile() if "cpu" in modes else None
+        self._snapshot_before: Optional[tracemalloc.Snapshot] = None
+        self._memory: List[Dict[str, Any]] = []
+        self._peak_bytes = 0
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    # ---------- Ejecución perfilada ----------
+
+    def _start_memory(self) -> None:
+        if "memory" in self.modes:
+            _acquire_tracemalloc()
+            tracemalloc.reset_peak()
+            self._snapshot_before = tracemalloc.take_snapshot()
+
+    def _stop_memory(self) -> None:
+        if self._snapshot_before is None:
+            return
+        try:
+            _, self._peak_bytes = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            stats = after.compare_to(self._snapshot_before, "lineno")
+            self._memory = [
+                {
+                    "site": str(stat.traceback[0]) if stat.traceback else "?",
+                    "size_diff_kb": round(stat.size_diff / 1024, 3),
+                    "count_diff": stat.count_diff,
+                    "size_kb": round(stat.size / 1024, 3),
+                }
+                for stat in stats[: self.top]
+            ]
+        finally:
+            self._snapshot_before = None
+            _release_tracemalloc()
+
+    def _enable_cpu(self) -> bool:
+        if self._profile is None:
+            return False
+        try:
+            self._profile.enable()
+            return True
+        except ValueError:
+            # Otro perfilador activo (sys.monitoring es global desde 3.12).
+            self.notes.append("cProfile no disponible: hay otra llamada perfilándose.")
+            self._profile = None
+            return False
+
+    def _run_sync(self, fn: Callable, kwargs: Dict[str, Any]) -> Any:
+        cpu_started = time.thread_time()
+        started = time.perf_counter()
+        self._start_memory()
+        profiling = self._enable_cpu()
+        try:
+            return fn(**kwargs)
+        finally:
+            if profiling:
+                self._profile.disable()
+            self.timings["call"] = time.perf_counter() - started
+            self.timings["cpu"] = time.thread_time() - cpu_started
+            self._stop_memory()
+
+    async def _run_async(self, fn: Callable, kwargs: Dict[str, Any]) -> Any:
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        self._start_memory()
+        profiling = self._enable_cpu()
+        try:
+            return await fn(**kwargs)
+        finally:
+            if profiling:
+                self._profile.disable()
+            self.timings["call"] = time.perf_counter() - started
+            self.timings["cpu"] = time.process_time() - cpu_started
+            self._stop_memory()
+
+    def wrap(self, fn: Callable, kind: str) -> Callable:
+        """
+        Envuelve fn conservando su tipo de llamada (ver dispatcher.call_kind).
+        Los generadores no se perfilan (se ejecutan al consumir el stream).
+        """
+        if kind == CALL_SYNC:
+            @functools.wraps(fn)
+            def profiled(**kwargs):
+                return self._run_sync(fn, kwargs)
+            return profiled
+        if kind == CALL_ASYNC:
+            @functools.wraps(fn)
+            async def profiled_async(**kwargs):
+                return await self._run_async(fn, kwargs)
+            return profiled_async
+        self.notes.append("Las funciones generadoras no se perfilan: el trabajo ocurre al consumir el stream.")
+        return fn
+
+    # ---------- Resultados ----------
+
+    def _hot_functions(self) -> List[Dict[str, Any]]:
+        if self._profile is None:
+            return []
+        try:
+            stats = pstats.Stats(self._profile)
+        except TypeError:
+            # La función no llegó a ejecutarse bajo el perfilador.
+            return []
+        rows = []
+        for (filename, line, name), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": nc,
+                "primitive_calls": cc,
+                "total_ms": round(tottime * 1000, 3),
+                "cumulative_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+        return rows[: self.top]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Tiempos por fase (ms), funciones más costosas y sitios de asignación.
+        """
+        report: Dict[str, Any] = {
+            "timings_ms": {name: round(value * 1000, 3) for name, value in self.timings.items()},
+        }
+        if "cpu" in self.modes:
+            report["hot_functions"] = self._hot_functions()
+        if "memory" in self.modes:
+            report["allocations"] = self._memory
+            report["peak_kb"] = round(self._peak_bytes / 1024, 3)
+        if self.notes:
+            report["notes"] = self.notes
+        return report
+
+    def server_timing(self) -> str:
+        """
+        Valor de la cabecera Server-Timing (duraciones en ms).
+        """
+        total = time.perf_counter() - self._started
+        parts = [f"{name};dur={value * 1000:.3f}" for name, value in self.timings.items()]
+        parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
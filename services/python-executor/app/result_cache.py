@@ -0,0 +1,158 @@
+# result_cache.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+# Entradas máximas y TTL por defecto (segundos) del cache de resultados.
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_DEFAULT_TTL = float(os.environ.get("RESULT_CACHE_DEFAULT_TTL", "60"))
+
+_MISSING = object()
+
+
+def cacheable(fn: Optional[Callable] = None, *, ttl: Optional[float] = None):
+    """
+    Marca una función de script como pura: su resultado puede cachearse
+    según (script, función, parámetros). Uso dentro de un script:
+
+        from app.result_cache import cacheable
+
+        @cacheable(ttl=300)
+        def formatear(valor: str): ...
+
+    Alternativa sin importar nada: declarar en el módulo
+        __cacheable__ = {"formatear": 300}   # o ["formatear"]
+    """
+    def decorate(func: Callable) -> Callable:
+        func.__cacheable__ = {"ttl": ttl}
+        return func
+
+    if fn is not None:
+        return decorate(fn)
+    return decorate
+
+
+def get_cache_policy(module: Any, fn_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Retorna la política de cache ({"ttl": segundos}) de la función, o None
+    si la función no fue marcada como cacheable.
+    """
+    fn = getattr(module, fn_name, None)
+    policy = getattr(fn, "__cacheable__", None)
+    if isinstance(policy, dict):
+        ttl = policy.get("ttl")
+        return {"ttl": RESULT_CACHE_DEFAULT_TTL if ttl is None else float(ttl)}
+
+    declared = getattr(module, "__cacheable__", None)
+    if isinstance(declared, dict) and fn_name in declared:
+        ttl = declared[fn_name]
+        if isinstance(ttl, dict):
+            ttl = ttl.get("ttl")
+        if ttl is False:
+            return None
+        if ttl is True or ttl is None:
+            ttl = RESULT_CACHE_DEFAULT_TTL
+        return {"ttl": float(ttl)}
+    if isinstance(declared, (list, tuple, set)) and fn_name in declared:
+        return {"ttl": RESULT_CACHE_DEFAULT_TTL}
+    return None
+
+
+def canonical_params(params: Dict[str, Any]) -> str:
+    """
+    Representación canónica de los parámetros (independiente del orden de claves).
+    """
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=repr)
+
+
+class ResultCache:
+    """
+    Cache TTL acotado (LRU) de resultados de funciones puras.
+    Las claves son (script_id, function_name, parámetros canónicos). Las
+    políticas de cada función se aprenden al cargar/ejecutar el script, de
+    modo que las funciones no cacheables no pagan ningún coste.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_script: Dict[str, Set[Tuple[str, str, str]]] = {}
+        self._policies: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def policy_for(self, script_id: str, fn_name: str) -> Optional[Dict[str, Any]]:
+        return self._policies.get((script_id, fn_name))
+
+    def remember_policy(self, script_id: str, fn_name: str, policy: Optional[Dict[str, Any]]) -> None:
+        if policy is not None:
+            self._policies[(script_id, fn_name)] = policy
+
+    def get(self, script_id: str, fn_name: str, params: Dict[str, Any]) -> Any:
+        """
+        Retorna el resultado cacheado o _MISSING (ver is_miss).
+        """
+        key = (script_id, fn_name, canonical_params(params))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return _MISSING
+
+    @staticmethod
+    def is_miss(value: Any) -> bool:
+        return value is _MISSING
+
+    def set(self, script_id: str, fn_name: str, params: Dict[str, Any], value: Any, ttl: float) -> None:
+        key = (script_id, fn_name, canonical_params(params))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            self._keys_by_script.setdefault(script_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str, str]) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_script.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_script[key[0]]
+
+    def invalidate_script(self, script_id: str) -> None:
+        """
+        Elimina los resultados y las políticas aprendidas de un script
+        (llamar cuando se actualiza o se borra).
+        """
+        with self._lock:
+            for key in self._keys_by_script.pop(script_id, set()):
+                self._entries.pop(key, None)
+            for policy_key in [k for k in self._policies if k[0] == script_id]:
+                del self._policies[policy_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "cacheable_functions": len(self._policies),
+            }
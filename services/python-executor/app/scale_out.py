@@ -0,0 +1,436 @@
+# scale_out.py
+"""
+Modo scale-out: N procesos uvicorn de la app (workers) detrás de un
+dispatcher frontal que reparte las peticiones con hashing consistente.
+
+    python -m app.scale_out --app func --workers 8 --port 8000
+    python -m app.scale_out --app session --workers 4 --front-workers 2
+
+- Las sesiones (/execute/{id}/, /upload-modules/{id}/, ...) y los scripts
+  (/call-script/ por 'id', /upload-script/ y /run-script/ por el hash del
+  contenido) siempre van al mismo worker, que conserva su estado en memoria.
+- El session_id lo genera el dispatcher en /start-session/ y se lo pasa al
+  worker elegido en la cabecera X-Session-Id.
+- Los scripts se publican en un registro SQLite compartido por los workers
+  (SCRIPT_STORAGE_BACKEND=sqlite): cualquier worker puede cargar cualquier
+  script bajo demanda.
+- Los batches de /call-script-batch/ se reparten por script y se recomponen
+  en el orden original.
+- El resto de rutas (/metrics, /logs/, /, ...) son de cada worker: van al
+  indicado en la cabecera X-Executor-Worker o, si no se indica, por turnos.
+  La respuesta trae X-Executor-Worker con el worker que la atendió.
+
+El dispatcher no guarda estado: con --front-workers > 1 uvicorn lanza varios
+procesos que comparten el puerto y calculan el mismo anillo.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .dispatcher import BATCH_MAX_CALLS
+from .script_loader import script_content_hash
+from .serialization import JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, dumps_json, loads_json
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+# Número de workers de la app (procesos uvicorn) y de procesos del dispatcher.
+SCALE_OUT_WORKERS = int(os.environ.get("SCALE_OUT_WORKERS", str(os.cpu_count() or 1)))
+SCALE_OUT_FRONT_WORKERS = int(os.environ.get("SCALE_OUT_FRONT_WORKERS", "1"))
+# Directorio de los sockets UNIX de los workers y del registro compartido.
+SCALE_OUT_DIR = os.environ.get("SCALE_OUT_DIR", os.path.join(tempfile.gettempdir(), "codecms-executor"))
+# Sockets de los workers separados por comas (lo fija el lanzador para el dispatcher).
+SCALE_OUT_BACKENDS = os.environ.get("SCALE_OUT_BACKENDS", "")
+# Nodos virtuales por worker en el anillo.
+SCALE_OUT_REPLICAS = int(os.environ.get("SCALE_OUT_REPLICAS", "64"))
+# Timeout de las peticiones del dispatcher a los workers (segundos).
+SCALE_OUT_TIMEOUT = float(os.environ.get("SCALE_OUT_TIMEOUT", "300"))
+
+WORKER_HEADER = "x-executor-worker"
+SESSION_ID_HEADER = "x-session-id"
+
+APP_PATHS = {"func": "app.main_func:app", "session": "app.main:app"}
+
+# Rutas cuya clave de reparto va en la URL.
+_PATH_KEYS = [
+    re.compile(r"^/(?:upload-modules|execute|execute-batch|close-session|session-schema)/([^/]+)/?$"),
+    re.compile(r"^/(?:update-script|delete-script)/([^/]+)/?$"),
+    re.compile(r"^/scripts/([^/]+)/(?:schema|dts)$"),
+    re.compile(r"^/blobs/([^/]+)$"),
+]
+# Rutas cuya clave de reparto va en el cuerpo JSON.
+_BODY_KEYS = {"/call-script/", "/upload-script/", "/run-script/"}
+_BATCH_PATH = "/call-script-batch/"
+_START_SESSION_PATH = "/start-session/"
+
+# Cabeceras hop-by-hop que no se reenvían (en las peticiones tampoco host ni
+# content-length: httpx las recalcula).
+_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+_REQUEST_SKIP_HEADERS = _HOP_HEADERS | {"host", "content-length"}
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Anillo de hashing consistente: cada nodo ocupa 'replicas' posiciones.
+    Al cambiar el número de nodos sólo se reasigna ~1/N de las claves.
+    """
+
+    def __init__(self, nodes: Sequence[int], replicas: int = SCALE_OUT_REPLICAS):
+        points = sorted(
+            (_ring_hash(f"{node}#{replica}"), node) for node in nodes for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> int:
+        index = bisect.bisect(self._hashes, _ring_hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def _decode_body(body: bytes, content_type: str) -> Any:
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in content_type:
+        return msgpack.unpackb(body, raw=False)
+    return loads_json(body)
+
+
+def _encode_body(value: Any, content_type: str) -> bytes:
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in content_type:
+        return msgpack.packb(value, use_bin_type=True)
+    return dumps_json(value)
+
+
+class ScaleOutDispatcher:
+    """
+    App ASGI que reenvía cada petición al worker que le corresponde.
+    """
+
+    def __init__(self, backends: List[str]):
+        if not backends:
+            raise ValueError("ScaleOutDispatcher necesita al menos un worker (SCALE_OUT_BACKENDS).")
+        self.backends = backends
+        self.ring = HashRing(range(len(backends)))
+        self._turn = itertools.count()
+        self._clients: List[httpx.AsyncClient] = []
+
+    def _client(self, worker: int) -> httpx.AsyncClient:
+        # Un cliente (pool de conexiones keep-alive) por worker, creado en el event loop
+        if not self._clients:
+            self._clients = [
+                httpx.AsyncClient(
+                    transport=httpx.AsyncHTTPTransport(uds=path),
+                    base_url="http://executor",
+                    timeout=SCALE_OUT_TIMEOUT,
+                )
+                for path in self.backends
+            ]
+        return self._clients[worker]
+
+    def worker_for(self, key: str) -> int:
+        return self.ring.node_for(key)
+
+    # ---------- ASGI ----------
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope["headers"]
+            if key.decode("latin-1") not in _REQUEST_SKIP_HEADERS
+        }
+        content_type = headers.get("content-type", JSON_MEDIA_TYPE)
+
+        try:
+            if scope["method"] == "POST" and path == _BATCH_PATH:
+                await self._batch(scope, receive, send, headers, content_type)
+                return
+            worker, body = await self._route(scope, receive, path, headers, content_type)
+        except ValueError as e:
+            await self._send_error(send, 400, f"Petición inválida: {e}")
+            return
+        await self._forward(scope, send, worker, headers, body)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self._clients:
+                    await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope, receive, path: str, headers: Dict[str, str], content_type: str):
+        """
+        Retorna (worker, cuerpo). El cuerpo sólo se lee completo si la clave
+        está en él; en otro caso se reenvía en streaming.
+        """
+        for pattern in _PATH_KEYS:
+            match = pattern.match(path)
+            if match:
+                return self.worker_for(match.group(1)), _stream_body(receive)
+
+        if scope["method"] == "POST" and path == _START_SESSION_PATH:
+            session_id = str(uuid.uuid4())
+            headers[SESSION_ID_HEADER] = session_id
+            return self.worker_for(session_id), await _read_body(receive)
+
+        if scope["method"] == "POST" and path in _BODY_KEYS:
+            body = await _read_body(receive)
+            payload = _decode_body(body, content_type)
+            if not isinstance(payload, dict):
+                raise ValueError("se esperaba un objeto")
+            if path == "/call-script/":
+                key = payload.get("id")
+            else:
+                key = payload.get("script")
+                key = script_content_hash(key) if isinstance(key, str) else None
+            if not isinstance(key, str):
+                raise ValueError("falta el script o su id")
+            return self.worker_for(key), body
+
+        requested = headers.pop(WORKER_HEADER, None)
+        if requested is not None:
+            try:
+                worker = int(requested)
+            except ValueError:
+                worker = -1
+            if not 0 <= worker < len(self.backends):
+                raise ValueError(f"worker inexistente: {requested}")
+        else:
+            worker = next(self._turn) % len(self.backends)
+        return worker, _stream_body(receive)
+
+    async def _forward(self, scope, send, worker: int, headers: Dict[str, str], body) -> None:
+        client = self._client(worker)
+        url = scope["path"]
+        if scope.get("query_string"):
+            url = f"{url}?{scope['query_string'].decode('latin-1')}"
+        request = client.build_request(scope["method"], url, headers=headers, content=body)
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            await self._send_error(send, 502, f"Worker {worker} no disponible: {e}")
+            return
+        try:
+            response_headers = [
+                (key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in response.headers.multi_items()
+                if key.lower() not in _HOP_HEADERS
+            ]
+            response_headers.append((WORKER_HEADER.encode("latin-1"), str(worker).encode("latin-1")))
+            await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+            # Streaming (NDJSON/SSE) incluido: los chunks se reenvían según llegan
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            await response.aclose()
+
+    async def _batch(self, scope, receive, send, headers: Dict[str, str], content_type: str) -> None:
+        """
+        Reparte el batch por worker (según el id de cada script), lanza los
+        sub-batches en paralelo y recompone los resultados en orden.
+        """
+        items = _decode_body(await _read_body(receive), content_type)
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError("se esperaba una lista de llamadas")
+        if BATCH_MAX_CALLS and len(items) > BATCH_MAX_CALLS:
+            # Cada worker sólo ve su parte: el límite del batch completo se aplica aquí.
+            detail = f"El batch tiene {len(items)} llamadas; el máximo es {BATCH_MAX_CALLS}."
+            await self._send_error(send, 413, detail)
+            return
+        groups: Dict[int, List[int]] = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self.worker_for(str(item.get("id"))), []).append(index)
+
+        accept = headers.get("accept", JSON_MEDIA_TYPE)
+
+        async def run_group(worker: int, indices: List[int]) -> Tuple[int, httpx.Response]:
+            body = _encode_body([items[i] for i in indices], content_type)
+            try:
+                return worker, await self._client(worker).post(_BATCH_PATH, content=body, headers=headers)
+            except httpx.HTTPError as e:
+                return worker, httpx.Response(502, json={"detail": f"Worker {worker} no disponible: {e}"})
+
+        responses = await asyncio.gather(*(run_group(worker, indices) for worker, indices in groups.items()))
+        results: List[Any] = [None] * len(items)
+        for (worker, response), indices in zip(responses, groups.values()):
+            if response.status_code != 200:
+                # Un sub-batch rechazado entero (p.ej. 422): se responde tal cual
+                await self._send_raw(send, response.status_code, response.content, response.headers.get("content-type"))
+                return
+            for index, result in zip(indices, _decode_body(response.content, response.headers.get("content-type", ""))):
+                results[index] = result
+        media_type = MSGPACK_MEDIA_TYPE if msgpack is not None and MSGPACK_MEDIA_TYPE in accept else JSON_MEDIA_TYPE
+        await self._send_raw(send, 200, _encode_body(results, media_type), media_type)
+
+    async def _send_raw(self, send, status: int, body: bytes, content_type: Optional[str]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", (content_type or JSON_MEDIA_TYPE).encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_error(self, send, status: int, detail: str) -> None:
+        await self._send_raw(send, status, dumps_json({"detail": detail}), JSON_MEDIA_TYPE)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _stream_body(receive):
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return
+        chunk = message.get("body", b"")
+        if chunk:
+            yield chunk
+        if not message.get("more_body", False):
+            return
+
+
+def create_front_app() -> ScaleOutDispatcher:
+    """
+    Factory para uvicorn (--factory): los workers vienen de SCALE_OUT_BACKENDS.
+    """
+    return ScaleOutDispatcher([path for path in SCALE_OUT_BACKENDS.split(",") if path])
+
+
+# ========== Lanzador ==========
+
+def worker_env(app_kind: str, index: int, base_dir: str) -> Dict[str, str]:
+    """
+    Entorno de un worker: registro de scripts y blobs compartidos entre todos.
+    """
+    env = dict(os.environ)
+    env["EXECUTOR_WORKER_INDEX"] = str(index)
+    env.setdefault("BLOB_STORE_DIR", os.path.join(base_dir, "blobs"))
+    if app_kind == "func":
+        env.setdefault("SCRIPT_STORAGE_BACKEND", "sqlite")
+        env.setdefault("SQLITE_STORAGE_PATH", os.path.join(base_dir, "scripts.db"))
+    return env
+
+
+def _wait_for_socket(path: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"El worker de {path} terminó al arrancar (código {process.returncode}).")
+        if os.path.exists(path):
+            try:
+                with httpx.Client(transport=httpx.HTTPTransport(uds=path), timeout=1.0) as client:
+                    client.get("http://executor/openapi.json")
+                return
+            except httpx.HTTPError:
+                pass
+        time.sleep(0.1)
+    raise RuntimeError(f"El worker de {path} no respondió en {timeout}s.")
+
+
+def start_workers(app_kind: str, workers: int, base_dir: str, log_level: str = "warning") -> Tuple[List[subprocess.Popen], List[str]]:
+    """
+    Arranca los workers (uvicorn sobre sockets UNIX) y espera a que respondan.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    processes, sockets = [], []
+    for index in range(workers):
+        path = os.path.join(base_dir, f"worker-{index}.sock")
+        if os.path.exists(path):
+            os.remove(path)
+        command = [sys.executable, "-m", "uvicorn", APP_PATHS[app_kind], "--uds", path, "--log-level", log_level]
+        processes.append(subprocess.Popen(command, env=worker_env(app_kind, index, base_dir)))
+        sockets.append(path)
+    try:
+        for path, process in zip(sockets, processes):
+            _wait_for_socket(path, process)
+    except Exception:
+        stop_workers(processes)
+        raise
+    return processes, sockets
+
+
+def stop_workers(processes: List[subprocess.Popen], timeout: float = 10.0) -> None:
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Executor en modo scale-out (workers + dispatcher)")
+    parser.add_argument("--app", choices=sorted(APP_PATHS), default="func")
+    parser.add_argument("--workers", type=int, default=SCALE_OUT_WORKERS)
+    parser.add_argument("--front-workers", type=int, default=SCALE_OUT_FRONT_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--dir", default=SCALE_OUT_DIR, help="Sockets, registro SQLite y blobs compartidos")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    processes, sockets = start_workers(args.app, args.workers, args.dir, args.log_level)
+    os.environ["SCALE_OUT_BACKENDS"] = ",".join(sockets)
+    print(f"{args.workers} workers de {APP_PATHS[args.app]} listos; dispatcher en {args.host}:{args.port}", flush=True)
+    try:
+        uvicorn.run(
+            "app.scale_out:create_front_app",
+            factory=True,
+            host=args.host,
+            port=args.port,
+            workers=args.front_workers,
+            log_level=args.log_level,
+        )
+    finally:
+        stop_workers(processes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
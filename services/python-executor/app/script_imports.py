@@ -0,0 +1,411 @@
+# script_imports.py
+import ast
+import hashlib
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from .metrics import SCRIPT_LOAD_SECONDS
+from .script_loader import compile_script, load_script_module, register_code, script_content_hash, script_filename
+
+# Paquete virtual desde el que los scripts importan otros scripts almacenados:
+#   import codecms_scripts.utils              (por alias)
+#   from codecms_scripts import _<script_id>  (por id)
+SCRIPT_PACKAGE = "codecms_scripts"
+# Entradas del cache de imports por contenido (ver imported_scripts).
+SCRIPT_IMPORTS_CACHE_SIZE = int(os.environ.get("SCRIPT_IMPORTS_CACHE_SIZE", "4096"))
+
+_PREFIX = SCRIPT_PACKAGE + "."
+
+_imports_cache: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+_imports_cache_lock = threading.Lock()
+
+
+def id_name(script_id: str) -> str:
+    """
+    Nombre bajo SCRIPT_PACKAGE con el que se importa un script por su id.
+    """
+    return f"_{script_id}"
+
+
+def is_valid_alias(alias: str) -> bool:
+    # Los nombres con "_" inicial quedan reservados para los ids.
+    return alias.isidentifier() and not alias.startswith("_")
+
+
+def imported_scripts(content: str, content_hash: Optional[str] = None) -> FrozenSet[str]:
+    """
+    Nombres (alias o _<id>) de los scripts que importa 'content', extraídos
+    del AST sin ejecutarlo. Cacheado por hash de contenido.
+    """
+    if content_hash is None:
+        content_hash = script_content_hash(content)
+    with _imports_cache_lock:
+        names = _imports_cache.get(content_hash)
+        if names is not None:
+            _imports_cache.move_to_end(content_hash)
+            return names
+
+    found: Set[str] = set()
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        # El error aparecerá al cargar el script (ValueError: bytes nulos).
+        tree = None
+    for node in ast.walk(tree) if tree is not None else ():
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.startswith(_PREFIX):
+                    found.add(alias.name[len(_PREFIX):].split(".")[0])
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            if node.module == SCRIPT_PACKAGE:
+                found.update(alias.name for alias in node.names if alias.name != "*")
+            elif node.module.startswith(_PREFIX):
+                found.add(node.module[len(_PREFIX):].split(".")[0])
+    names = frozenset(found)
+
+    with _imports_cache_lock:
+        _imports_cache[content_hash] = names
+        while len(_imports_cache) > SCRIPT_IMPORTS_CACHE_SIZE:
+            _imports_cache.popitem(last=False)
+    return names
+
+
+def bundle_hash(content_hash: str, libraries: Dict[str, Tuple[str, str]]) -> str:
+    """
+    Hash de un script junto con las versiones de los scripts que importa:
+    cambia si cambia cualquiera de ellos (clave de los módulos en los workers).
+    """
+    if not libraries:
+        return content_hash
+    digest = hashlib.md5(content_hash.encode("ascii"))
+    for name in sorted(libraries):
+        script_id, content = libraries[name]
+        digest.update(f"|{name}={script_id}:{script_content_hash(content)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StoredScriptFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Finder de sys.meta_path para SCRIPT_PACKAGE. 'resolve' traduce un nombre
+    (alias o _<id>) a (script_id, contenido) o None. Cada script se ejecuta
+    una sola vez por proceso: el módulo queda en sys.modules como
+    codecms_scripts._<id> y los alias apuntan a ese mismo módulo.
+    'on_load' se llama con (script_id, contenido) al cargar cada script.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], Optional[Tuple[str, str]]],
+        on_load: Optional[Callable[[str, str], None]] = None,
+    ):
+        self._resolve = resolve
+        self._on_load = on_load
+
+    def find_spec(self, fullname: str, path: Any = None, target: Any = None):
+        if fullname == SCRIPT_PACKAGE:
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+        if not fullname.startswith(_PREFIX) or "." in fullname[len(_PREFIX):]:
+            return None
+        name = fullname[len(_PREFIX):]
+        resolved = self._resolve(name)
+        if resolved is None:
+            return None
+        script_id, content = resolved
+        origin = script_filename(script_content_hash(content))
+        spec = importlib.machinery.ModuleSpec(fullname, self, origin=origin)
+        spec.loader_state = (script_id, content)
+        return spec
+
+    def create_module(self, spec) -> Optional[types.ModuleType]:
+        if spec.loader_state is None:
+            return None
+        script_id, _ = spec.loader_state
+        canonical = _PREFIX + id_name(script_id)
+        if spec.name != canonical:
+            # Alias: el mismo módulo que el import por id (una sola instancia).
+            return importlib.import_module(canonical)
+        return None
+
+    def exec_module(self, module: types.ModuleType) -> None:
+        spec = module.__spec__
+        if spec.loader_state is None or hasattr(module, "__script_hash__"):
+            # Paquete raíz, o alias de un módulo ya ejecutado.
+            return
+        script_id, content = spec.loader_state
+        content_hash = script_content_hash(content)
+        module.__file__ = script_filename(content_hash)
+        module.__script_id__ = script_id
+        module.__script_hash__ = content_hash
+        code = compile_script(content, content_hash)
+        started = time.perf_counter()
+        exec(code, module.__dict__)
+        SCRIPT_LOAD_SECONDS.observe(time.perf_counter() - started)
+        if self._on_load is not None:
+            self._on_load(script_id, content)
+
+    @staticmethod
+    def forget(names: Iterable[str]) -> None:
+        """
+        Descarta los módulos importados con esos nombres: el próximo import
+        vuelve a ejecutar el script.
+        """
+        package = sys.modules.get(SCRIPT_PACKAGE)
+        for name in names:
+            sys.modules.pop(_PREFIX + name, None)
+            if package is not None and name in package.__dict__:
+                delattr(package, name)
+
+
+class ScriptImports:
+    """
+    Imports entre scripts almacenados en el servidor: alias, grafo de
+    dependencias e invalidación.
+
+    - load_module(): loader del storage; registra qué scripts importa cada
+      script cargado (también los importados, vía el finder).
+    - invalidate(): al actualizar o borrar un script descarta su módulo
+      importado y retorna los scripts que dependen de él (transitivamente)
+      para que el llamador descargue sus módulos y resultados cacheados.
+    - bundle(): el script y sus dependencias, para enviarlos a un worker.
+    - refresh(): detecta los cambios hechos por otros procesos que comparten
+      el storage (alias y scripts importados) comparando hashes de contenido.
+
+    Los alias se guardan en el storage (ver ScriptStorage.set_alias).
+    """
+
+    def __init__(self, storage: Any):
+        self._storage = storage
+        self._lock = threading.RLock()
+        # script_id -> nombres que importa; nombre -> scripts que lo importan
+        self._imports: Dict[str, FrozenSet[str]] = {}
+        self._dependents: Dict[str, Set[str]] = {}
+        # nombre -> (script_id, hash del contenido) con que se resolvió
+        self._resolved: Dict[str, Tuple[str, str]] = {}
+        self._storage_version = storage.version()
+        self.finder = StoredScriptFinder(self.resolve, on_load=self.record)
+        self.invalidations = 0
+
+    def install(self) -> None:
+        if self.finder not in sys.meta_path:
+            sys.meta_path.append(self.finder)
+
+    def uninstall(self) -> None:
+        if self.finder in sys.meta_path:
+            sys.meta_path.remove(self.finder)
+
+    # ---------- Alias ----------
+
+    def set_alias(self, alias: str, script_id: str) -> List[str]:
+        """
+        Asocia el alias al script. Si ya apuntaba a otro, retorna los scripts
+        afectados (ver invalidate). Lanza ValueError si el alias no es válido.
+        """
+        if not is_valid_alias(alias):
+            raise ValueError(f"Alias no válido: '{alias}' (identificador Python sin '_' inicial).")
+        with self._lock:
+            previous = self._storage.get_alias(alias)
+            self._storage.set_alias(alias, script_id)
+        if previous is None or previous == script_id:
+            return []
+        return self._invalidate_names({alias})
+
+    def aliases(self) -> Dict[str, str]:
+        return self._storage.list_aliases()
+
+    @staticmethod
+    def _names_of(script_id: str, aliases: Dict[str, str]) -> Set[str]:
+        names = {id_name(script_id)}
+        names.update(alias for alias, target in aliases.items() if target == script_id)
+        return names
+
+    # ---------- Resolución y dependencias ----------
+
+    def _lookup(self, name: str) -> Optional[Tuple[str, str]]:
+        script_id = self._storage.get_alias(name) if not name.startswith("_") else name[1:]
+        if script_id is None:
+            return None
+        content = self._storage.get_script_content(script_id)
+        if content is None:
+            return None
+        return script_id, content
+
+    def resolve(self, name: str) -> Optional[Tuple[str, str]]:
+        resolved = self._lookup(name)
+        if resolved is not None:
+            with self._lock:
+                self._resolved[name] = (resolved[0], script_content_hash(resolved[1]))
+        return resolved
+
+    def refresh(self) -> List[str]:
+        """
+        Si otro proceso modificó el storage desde la última comprobación,
+        vuelve a resolver los scripts importados hasta ahora y descarta los
+        que cambiaron (alias que apunta a otro script o contenido con otro
+        hash). Retorna los scripts afectados (ver invalidate). Sin cambios
+        cuesta una consulta de versión.
+        """
+        version = self._storage.version()
+        with self._lock:
+            if version == self._storage_version:
+                return []
+            self._storage_version = version
+            resolved = dict(self._resolved)
+        stale: Set[str] = set()
+        for name, (script_id, content_hash) in resolved.items():
+            current = self._lookup(name)
+            if current is None or current[0] != script_id or script_content_hash(current[1]) != content_hash:
+                stale.add(name)
+        if not stale:
+            return []
+        return self._invalidate_names(stale)
+
+    def record(self, script_id: str, content: str) -> None:
+        names = imported_scripts(content)
+        with self._lock:
+            previous = self._imports.get(script_id, frozenset())
+            if previous == names:
+                return
+            for name in previous - names:
+                dependents = self._dependents.get(name)
+                if dependents is not None:
+                    dependents.discard(script_id)
+                    if not dependents:
+                        del self._dependents[name]
+            for name in names - previous:
+                self._dependents.setdefault(name, set()).add(script_id)
+            if names:
+                self._imports[script_id] = names
+            else:
+                self._imports.pop(script_id, None)
+
+    def load_module(self, script_id: str, content: str, code: Optional[types.CodeType] = None) -> types.ModuleType:
+        """
+        Loader para el storage (mismo contrato que load_script_module). El
+        módulo es el mismo que reciben los scripts que lo importan
+        (codecms_scripts._<id> en sys.modules), así que invalidate() lo
+        descarta a la vez para las llamadas directas y para los imports.
+        """
+        content_hash = script_content_hash(content)
+        if code is not None:
+            register_code(content_hash, content, code)
+        name = _PREFIX + id_name(script_id)
+        try:
+            module = importlib.import_module(name)
+        except ModuleNotFoundError as e:
+            if e.name != name:
+                raise
+            module = None
+        if module is not None and getattr(module, "__script_hash__", None) == content_hash:
+            return module
+        # El storage cambió mientras tanto (o lo cambió otro proceso y aún no
+        # se llamó a refresh): este contenido se carga aparte, sin compartirse.
+        self.record(script_id, content)
+        return load_script_module(script_id, content, code)
+
+    def dependents(self, script_id: str) -> List[str]:
+        """
+        Scripts que importan script_id, directa o transitivamente.
+        """
+        aliases = self._storage.list_aliases()
+        with self._lock:
+            return self._collect_dependents(self._names_of(script_id, aliases), aliases)
+
+    def _collect_dependents(self, names: Set[str], aliases: Dict[str, str]) -> List[str]:
+        affected: List[str] = []
+        seen: Set[str] = set()
+        pending = list(names)
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    affected.append(dependent)
+                    pending.extend(self._names_of(dependent, aliases))
+        return affected
+
+    def invalidate(self, script_id: str, deleted: bool = False) -> List[str]:
+        """
+        Llamar tras actualizar o borrar un script. Descarta su módulo y el de
+        los scripts que lo importan; retorna estos últimos.
+        """
+        with self._lock:
+            names = self._names_of(script_id, self._storage.list_aliases())
+            if deleted:
+                self._imports.pop(script_id, None)
+                for dependents in self._dependents.values():
+                    dependents.discard(script_id)
+        return self._invalidate_names(names)
+
+    def _invalidate_names(self, names: Set[str]) -> List[str]:
+        aliases = self._storage.list_aliases()
+        with self._lock:
+            affected = self._collect_dependents(names, aliases)
+            forget = set(names)
+            for dependent in affected:
+                forget.update(self._names_of(dependent, aliases))
+            for name in forget:
+                self._resolved.pop(name, None)
+            self.invalidations += 1
+        StoredScriptFinder.forget(forget)
+        return affected
+
+    def bundle(self, script_id: str, content: str) -> Dict[str, Tuple[str, str]]:
+        """
+        Scripts que importa el script (transitivamente): nombre -> (script_id,
+        contenido), incluido el nombre _<id> de los importados por alias.
+        También registra las dependencias, ya que el script se cargará en
+        otro proceso.
+        """
+        self.record(script_id, content)
+        libraries: Dict[str, Tuple[str, str]] = {}
+        pending = list(imported_scripts(content))
+        while pending:
+            name = pending.pop()
+            if name in libraries:
+                continue
+            resolved = self.resolve(name)
+            if resolved is None:
+                continue
+            libraries[name] = libraries[id_name(resolved[0])] = resolved
+            self.record(*resolved)
+            pending.extend(imported_scripts(resolved[1]))
+        return libraries
+
+    def stats(self) -> Dict[str, Any]:
+        aliases = self._storage.list_aliases()
+        with self._lock:
+            return {
+                "aliases": len(aliases),
+                "scripts_with_imports": len(self._imports),
+                "imported_loaded": sum(
+                    1 for name in sys.modules if name.startswith(_PREFIX) and name[len(_PREFIX):].startswith("_")
+                ),
+                "invalidations": self.invalidations,
+            }
+
+
+# ========== Lado del worker ==========
+
+_worker_libraries: Dict[str, Tuple[str, str]] = {}
+_worker_finder: Optional[StoredScriptFinder] = None
+
+
+def install_worker_libraries(libraries: Dict[str, Tuple[str, str]]) -> None:
+    """
+    Hace importables en un proceso worker los scripts recibidos del padre
+    (ver ScriptImports.bundle). Si alguno cambió, se descartan los módulos
+    del bundle para que se vuelvan a ejecutar con las versiones nuevas.
+    """
+    global _worker_finder
+    if _worker_finder is None:
+        _worker_finder = StoredScriptFinder(_worker_libraries.get)
+        sys.meta_path.append(_worker_finder)
+    if any(_worker_libraries.get(name) != library for name, library in libraries.items()):
+        StoredScriptFinder.forget(libraries)
+        _worker_libraries.update(libraries)
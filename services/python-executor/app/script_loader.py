@@ -0,0 +1,124 @@
+# script_loader.py
+import hashlib
+import linecache
+import os
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .metrics import SCRIPT_COMPILE_SECONDS, SCRIPT_LOAD_SECONDS
+
+# Número máximo de code objects que se mantienen compilados en memoria.
+CODE_CACHE_MAX_ENTRIES = int(os.environ.get("CODE_CACHE_MAX_ENTRIES", "2048"))
+
+# Cache LRU de code objects indexado por el hash MD5 del contenido del script.
+_code_cache: "OrderedDict[str, types.CodeType]" = OrderedDict()
+_code_cache_lock = threading.Lock()
+_code_cache_hits = 0
+_code_cache_misses = 0
+
+
+def script_content_hash(script_content: str) -> str:
+    """
+    Calcula el hash MD5 del contenido del script (mismo id que usa el servicio).
+    """
+    return hashlib.md5(script_content.encode("utf-8")).hexdigest()
+
+
+def script_filename(content_hash: str) -> str:
+    """
+    Nombre de archivo virtual con el que se compila el script (aparece en tracebacks).
+    """
+    return f"<script-{content_hash}>"
+
+
+def compile_script(script_content: str, content_hash: Optional[str] = None) -> types.CodeType:
+    """
+    Compila el script directamente desde el string y cachea el code object.
+    Si el mismo contenido ya se compiló antes, se reutiliza sin volver a parsear.
+    """
+    if content_hash is None:
+        content_hash = script_content_hash(script_content)
+
+    global _code_cache_hits, _code_cache_misses
+    with _code_cache_lock:
+        code = _code_cache.get(content_hash)
+        if code is not None:
+            _code_cache.move_to_end(content_hash)
+            _code_cache_hits += 1
+            return code
+        _code_cache_misses += 1
+
+    started = time.perf_counter()
+    code = compile(script_content, script_filename(content_hash), "exec", dont_inherit=True)
+    SCRIPT_COMPILE_SECONDS.observe(time.perf_counter() - started)
+    register_code(content_hash, script_content, code)
+    return code
+
+
+def register_code(content_hash: str, script_content: str, code: types.CodeType) -> None:
+    """
+    Registra un code object ya compilado (p.ej. bytecode persistido) en el cache.
+    """
+    filename = script_filename(content_hash)
+
+    # Registramos el fuente en linecache para que los tracebacks muestren las líneas.
+    linecache.cache[filename] = (
+        len(script_content),
+        None,
+        script_content.splitlines(True),
+        filename,
+    )
+
+    with _code_cache_lock:
+        _code_cache[content_hash] = code
+        _code_cache.move_to_end(content_hash)
+        while len(_code_cache) > CODE_CACHE_MAX_ENTRIES:
+            evicted_hash, _ = _code_cache.popitem(last=False)
+            linecache.cache.pop(script_filename(evicted_hash), None)
+
+
+def load_script_module(
+    script_id: str, script_content: str, code: Optional[types.CodeType] = None
+) -> types.ModuleType:
+    """
+    Carga 'script_content' en un módulo Python sin pasar por disco.
+    Si se pasa 'code' (bytecode ya compilado) se usa en lugar de compilar.
+    Retorna el módulo ya ejecutado.
+    """
+    content_hash = script_content_hash(script_content)
+    if code is None:
+        code = compile_script(script_content, content_hash)
+    else:
+        register_code(content_hash, script_content, code)
+
+    module = types.ModuleType(script_id)
+    module.__file__ = script_filename(content_hash)
+    started = time.perf_counter()
+    exec(code, module.__dict__)
+    SCRIPT_LOAD_SECONDS.observe(time.perf_counter() - started)
+    return module
+
+
+def clear_code_cache() -> None:
+    """
+    Vacía el cache de code objects.
+    """
+    with _code_cache_lock:
+        for content_hash in _code_cache:
+            linecache.cache.pop(script_filename(content_hash), None)
+        _code_cache.clear()
+
+
+def code_cache_stats() -> Dict[str, Any]:
+    """
+    Tamaño y aciertos/fallos del cache de code objects.
+    """
+    with _code_cache_lock:
+        return {
+            "entries": len(_code_cache),
+            "hits": _code_cache_hits,
+            "misses": _code_cache_misses,
+        }
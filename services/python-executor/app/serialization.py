@@ -0,0 +1,260 @@
+# serialization.py
+import base64
+import contextvars
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+
+# Dependencias opcionales: sin orjson se usa json de la stdlib y sin msgpack
+# no se negocia application/msgpack (se responde JSON).
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+# Formato de respuesta pedido por el cliente (Accept); lo fija el middleware.
+response_format: contextvars.ContextVar[str] = contextvars.ContextVar("response_format", default=JSON_MEDIA_TYPE)
+
+
+def _common_default(obj: Any) -> Any:
+    """
+    Conversión de tipos que ni JSON ni msgpack conocen. Los demás lanzan
+    TypeError: no se convierten a texto en silencio.
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict") and hasattr(obj, "__fields__"):
+        return obj.dict()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, datetime.timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if numpy is not None and isinstance(obj, numpy.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def _json_default(obj: Any) -> Any:
+    # JSON no tiene tipo binario: bytes y arrays (sin soporte nativo) van en base64/listas.
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        return obj.tolist()
+    return _common_default(obj)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    # Los arrays viajan como buffer binario + dtype + shape (sin pasar a listas).
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        array = numpy.ascontiguousarray(obj)
+        return {"$ndarray": {"dtype": array.dtype.str, "shape": list(array.shape), "data": array.tobytes()}}
+    if isinstance(obj, memoryview):
+        return obj.tobytes()
+    return _common_default(obj)
+
+
+def _dumps_stdlib_json(content: Any) -> bytes:
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps_json(content: Any) -> bytes:
+        """
+        Serializa a JSON (orjson; arrays NumPy nativos, bytes en base64).
+        Lo que orjson no soporta (p.ej. enteros de más de 64 bits) se
+        serializa con json de la stdlib.
+        """
+        try:
+            return orjson.dumps(content, default=_json_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            return _dumps_stdlib_json(content)
+
+    loads_json: Callable[[bytes], Any] = orjson.loads
+else:  # pragma: no cover
+    def dumps_json(content: Any) -> bytes:
+        return _dumps_stdlib_json(content)
+
+    loads_json = json.loads
+
+
+def _big_ints_to_str(value: Any) -> Any:
+    # msgpack sólo admite enteros de 64 bits: los mayores viajan como texto.
+    if isinstance(value, int) and not isinstance(value, bool) and not -2**63 <= value < 2**64:
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _big_ints_to_str(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_big_ints_to_str(item) for item in value]
+    return value
+
+
+def dumps_msgpack(content: Any) -> bytes:
+    """
+    Serializa a msgpack (bytes como binario, arrays NumPy como buffer).
+    """
+    try:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True, datetime=False)
+    except OverflowError:
+        content = _big_ints_to_str(content)
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+class FastResponse(Response):
+    """
+    Respuesta por defecto del servicio: JSON vía orjson, o msgpack si el
+    cliente envió 'Accept: application/msgpack'. Los endpoints que devuelven
+    resultados de scripts la construyen directamente para no pasar por
+    jsonable_encoder.
+    """
+
+    media_type = JSON_MEDIA_TYPE
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers: Optional[Dict[str, str]] = None, **kwargs):
+        if msgpack is not None and response_format.get() == MSGPACK_MEDIA_TYPE:
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code=status_code, headers=headers, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return dumps_msgpack(content)
+        return dumps_json(content)
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> bytes:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return b""
+
+
+# Clave del scope donde el middleware deja el cuerpo msgpack ya decodificado.
+MSGPACK_BODY_KEY = "codecms.msgpack_body"
+
+
+class SerializationMiddleware:
+    """
+    Middleware ASGI de negociación:
+    - 'Accept: application/msgpack' -> las FastResponse se codifican en msgpack.
+    - 'Content-Type: application/msgpack' -> el cuerpo se decodifica aquí
+      (400 si no es msgpack válido) y MsgpackRoute lo entrega tal cual a los
+      modelos pydantic de los endpoints: los bytes llegan como bytes.
+    """
+
+    def __init__(self, app: Callable):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or msgpack is None:
+            await self.app(scope, receive, send)
+            return
+
+        accept = _header(scope, b"accept").decode("latin-1")
+        token = None
+        if any(media_type in accept for media_type in _MSGPACK_MEDIA_TYPES):
+            token = response_format.set(MSGPACK_MEDIA_TYPE)
+
+        try:
+            content_type = _header(scope, b"content-type").split(b";")[0].strip().decode("latin-1")
+            if content_type in _MSGPACK_MEDIA_TYPES:
+                decoded = await self._decode_msgpack_body(scope, receive)
+                if decoded is None:
+                    response = Response(
+                        content=dumps_json({"detail": "Cuerpo msgpack no válido."}),
+                        status_code=400,
+                        media_type=JSON_MEDIA_TYPE,
+                    )
+                    await response(scope, receive, send)
+                    return
+                scope, receive = decoded
+            await self.app(scope, receive, send)
+        finally:
+            if token is not None:
+                response_format.reset(token)
+
+    @staticmethod
+    async def _decode_msgpack_body(scope: Dict[str, Any], receive: Callable):
+        """
+        Lee y decodifica el cuerpo. Retorna (scope, receive) para la app, o
+        None si el cuerpo no es msgpack válido.
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        try:
+            decoded = msgpack.unpackb(body, raw=False) if body else None
+        except Exception:
+            return None
+
+        # FastAPI sólo entrega el cuerpo a los modelos si el Content-Type es
+        # JSON; MsgpackRoute le pasa el valor ya decodificado en vez de parsearlo.
+        headers = [(key, value) for key, value in scope["headers"] if key != b"content-type"]
+        headers.append((b"content-type", JSON_MEDIA_TYPE.encode("latin-1")))
+        scope = {**scope, "headers": headers, MSGPACK_BODY_KEY: decoded}
+
+        sent = False
+
+        async def replay() -> Dict[str, Any]:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return scope, replay
+
+
+class MsgpackRoute(APIRoute):
+    """
+    Ruta que toma el cuerpo msgpack decodificado por SerializationMiddleware
+    en lugar de parsear el cuerpo como JSON. Se instala con
+    app.router.route_class = MsgpackRoute antes de declarar los endpoints.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            if MSGPACK_BODY_KEY in request.scope:
+                request._json = request.scope[MSGPACK_BODY_KEY]
+            return await handler(request)
+
+        return route_handler
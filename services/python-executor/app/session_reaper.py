@@ -0,0 +1,101 @@
+# session_reaper.py
+import os
+import pickle
+import sys
+from typing import Any, Dict, Optional
+
+# Segundos sin actividad tras los cuales una sesión se cierra (0 = nunca).
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))
+# Cada cuánto revisa el reaper las sesiones.
+SESSION_REAPER_INTERVAL = float(os.environ.get("SESSION_REAPER_INTERVAL", "30"))
+# Memoria máxima por sesión en bytes (0 = sin límite). En sesiones aisladas
+# es el RSS del worker; en sesiones inline, una estimación del estado de las
+# instancias (ver estimate_size).
+SESSION_MEMORY_LIMIT = int(os.environ.get("SESSION_MEMORY_LIMIT", "0"))
+# Segundos sin actividad tras los cuales el estado de las instancias se
+# guarda en disco y se libera de memoria (0 = desactivado). Sólo sesiones inline.
+SESSION_SPILL_AFTER = float(os.environ.get("SESSION_SPILL_AFTER", "0"))
+SESSION_SPILL_DIR = os.environ.get("SESSION_SPILL_DIR", "./session_state")
+
+# Límite de objetos que recorre estimate_size (acota el coste de la medición).
+_SIZE_MAX_OBJECTS = 200_000
+
+
+def spill_path(session_id: str) -> str:
+    return os.path.join(SESSION_SPILL_DIR, f"{session_id}.pkl")
+
+
+def estimate_size(obj: Any, max_objects: int = _SIZE_MAX_OBJECTS) -> int:
+    """
+    Tamaño aproximado (bytes) de obj y de lo que referencia a través de
+    atributos y contenedores. No sigue clases, módulos ni funciones.
+    """
+    seen = set()
+    pending = [obj]
+    total = 0
+    while pending and len(seen) < max_objects:
+        current = pending.pop()
+        if id(current) in seen or isinstance(current, (type, type(sys), type(estimate_size))):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif hasattr(current, "__dict__"):
+            pending.append(vars(current))
+    return total
+
+
+def process_rss(pid: int) -> Optional[int]:
+    """
+    Memoria residente del proceso en bytes (Linux, /proc); None si no se puede leer.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def spill_instances(session_id: str, instances: Dict[str, Any]) -> Dict[str, type]:
+    """
+    Guarda en disco el estado (__dict__) de las instancias de la sesión.
+    Retorna la clase de cada módulo para reconstruirlas con restore_instances.
+    Lanza excepción si algún estado no se puede serializar (nada queda escrito).
+    """
+    states = {module_name: vars(instance) for module_name, instance in instances.items()}
+    data = pickle.dumps(states, protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(SESSION_SPILL_DIR, exist_ok=True)
+    path = spill_path(session_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return {module_name: type(instance) for module_name, instance in instances.items()}
+
+
+def restore_instances(session_id: str, classes: Dict[str, type]) -> Dict[str, Any]:
+    """
+    Reconstruye las instancias guardadas por spill_instances sin ejecutar el
+    constructor ni onLoad, y borra el archivo.
+    """
+    path = spill_path(session_id)
+    with open(path, "rb") as f:
+        states = pickle.load(f)
+    instances = {}
+    for module_name, cls in classes.items():
+        instance = cls.__new__(cls)
+        instance.__dict__.update(states[module_name])
+        instances[module_name] = instance
+    os.remove(path)
+    return instances
+
+
+def discard_spill(session_id: str) -> None:
+    try:
+        os.remove(spill_path(session_id))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,335 @@
+# session_worker.py
+import asyncio
+import inspect
+import os
+import types
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dts import generate_dts_string
+from .function_table import build_function_table, describe_functions
+from .preload import PRELOAD_PACKAGES, preload_packages
+from .process_pool import (
+    ScriptWorkerError,
+    WorkerProcess,
+    WorkerStream,
+    get_worker_context,
+    serve_stream,
+)
+from .shm import (
+    decode_value,
+    discard_value,
+    encode_value,
+    forget_outstanding,
+    release_outstanding,
+    release_process_segments,
+)
+from .blob_store import materialize_blob_refs
+from .signatures import InvalidParameters
+from .timeouts import SCRIPT_CPU_TIMEOUT, SCRIPT_TIMEOUT_GRACE, CallTimeout, preempt_after, resolve_timeout
+
+# "inline": los módulos de sesión se importan en el proceso del servidor.
+# "process": cada sesión tiene su propio proceso worker.
+SESSION_ISOLATION = os.environ.get("SESSION_ISOLATION", "inline")
+
+
+def load_module_class(module_name: str, main_py: str) -> type:
+    """
+    Importa el main.py de un módulo y retorna la primera clase que define.
+    """
+    # Se compila desde el fuente (sin __pycache__): un .pyc con la misma
+    # marca de tiempo en segundos podría ocultar una edición recién subida.
+    with open(main_py, "r", encoding="utf-8") as f:
+        source = f.read()
+    loaded_module = types.ModuleType(module_name)
+    loaded_module.__file__ = main_py
+    exec(compile(source, main_py, "exec", dont_inherit=True), loaded_module.__dict__)
+
+    for attr_name in dir(loaded_module):
+        attr = getattr(loaded_module, attr_name)
+        if isinstance(attr, type):  # It's a class
+            return attr
+    raise LookupError(f"No class found in module {module_name}")
+
+
+# ========== Lado del worker ==========
+
+def _run(loop: asyncio.AbstractEventLoop, fn, *args, **kwargs) -> Any:
+    result = fn(*args, **kwargs)
+    if inspect.isawaitable(result):
+        task = asyncio.ensure_future(result, loop=loop)
+        try:
+            result = loop.run_until_complete(task)
+        except BaseException:
+            # Interrumpida (p.ej. por timeout): la tarea no debe quedar viva en el loop de la sesión.
+            if not task.done():
+                task.cancel()
+                loop.run_until_complete(asyncio.wait({task}, timeout=SCRIPT_TIMEOUT_GRACE))
+            raise
+    return result
+
+
+def session_worker_main(conn) -> None:
+    """
+    Proceso dedicado a una sesión: mantiene las instancias de sus módulos y
+    atiende load / execute / destroy. Un único event loop propio ejecuta los
+    métodos async, de modo que el estado async de las instancias persiste.
+    """
+    preload_packages(PRELOAD_PACKAGES)
+    loop = asyncio.new_event_loop()
+    try:
+        _serve_session(conn, loop)
+    finally:
+        # Resultados en memoria compartida que el padre no llegó a leer.
+        release_outstanding()
+        loop.close()
+
+
+def _serve_session(conn, loop: asyncio.AbstractEventLoop) -> None:
+    instances: Dict[str, Any] = {}
+    functions: Dict[str, Any] = {}
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        # El padre ya recibió (o descartó y liberó) todas las respuestas anteriores.
+        forget_outstanding()
+
+        op = message[0]
+        generator = None
+        if op == "load":
+            _, module_name, main_py = message
+            try:
+                module_class = load_module_class(module_name, main_py)
+                instance = module_class()
+                if hasattr(instance, "onLoad"):
+                    _run(loop, instance.onLoad)
+                previous = instances.get(module_name)
+                instances[module_name] = instance
+                functions, collisions = build_function_table(instances)
+                # La instancia reemplazada se destruye una vez cargada la nueva.
+                destroy_error = None
+                if previous is not None and hasattr(previous, "onDestroy"):
+                    try:
+                        _run(loop, previous.onDestroy)
+                    except Exception as e:
+                        destroy_error = str(e)
+                reply = (
+                    "ok",
+                    {
+                        "dts": generate_dts_string(module_name, module_class),
+                        "collisions": collisions,
+                        "schemas": describe_functions(functions),
+                        "owners": {name: entry.module_name for name, entry in functions.items()},
+                        "destroy_error": destroy_error,
+                    },
+                    {},
+                )
+            except LookupError as e:
+                reply = ("error", "missing_class", str(e))
+            except Exception as e:
+                reply = ("error", "load_error", str(e))
+
+        elif op == "execute":
+            _, function, params_payload, requested_timeout = message
+            entry = functions.get(function)
+            if entry is None:
+                reply = ("error", "missing_function", f"Function '{function}' not found in any module of the session")
+            else:
+                try:
+                    params = decode_value(params_payload)
+                    if entry.signature is not None:
+                        params = entry.signature.validate(params)
+                    wall = resolve_timeout(requested_timeout, entry.timeout)
+                    with preempt_after(wall, SCRIPT_CPU_TIMEOUT or None):
+                        result = _run(loop, entry.method, **materialize_blob_refs(params))
+                    if inspect.isgenerator(result) or inspect.isasyncgen(result):
+                        generator = result
+                        reply = ("stream", {})
+                    else:
+                        reply = ("ok", encode_value(result), {})
+                except CallTimeout as e:
+                    reply = ("error", "timeout", str(e))
+                except InvalidParameters as e:
+                    reply = ("error", "invalid_params", str(e))
+                except TypeError as e:
+                    reply = ("error", "type_error", str(e))
+                except Exception as e:
+                    reply = ("error", "execution_error", str(e))
+
+        elif op == "destroy":
+            errors = {}
+            for module_name, instance in instances.items():
+                if hasattr(instance, "onDestroy"):
+                    try:
+                        _run(loop, instance.onDestroy)
+                    except Exception as e:
+                        errors[module_name] = str(e)
+            conn.send(("ok", errors, {}))
+            break
+
+        elif op in ("next", "cancel"):
+            # Restos de un stream ya terminado.
+            continue
+        else:
+            reply = ("error", "execution_error", f"Operación desconocida: {op}")
+
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send(("error", "serialization_error", str(e)))
+            continue
+
+        if generator is not None:
+            serve_stream(conn, generator, loop=loop, encode=encode_value)
+
+
+# ========== Lado del padre ==========
+
+class RemoteModule:
+    """
+    Marcador de un módulo cargado en el proceso worker de la sesión.
+    """
+
+    def __init__(self, name: str, pid: int):
+        self.name = name
+        self.pid = pid
+
+
+class SessionWorker:
+    """
+    Proceso aislado de una sesión. Las peticiones a un mismo worker se
+    serializan; los argumentos y resultados grandes viajan por memoria
+    compartida (ver shm.py).
+    Si el proceso muere (un crash en código nativo, el OOM killer...), la
+    llamada en curso falla con worker_died y la siguiente arranca otro
+    proceso y vuelve a cargar los módulos de la sesión: onLoad se ejecuta de
+    nuevo y el estado en memoria de las instancias se pierde.
+    """
+
+    def __init__(self, worker: WorkerProcess):
+        self._worker = worker
+        self._lock = asyncio.Lock()
+        # Módulos cargados (nombre -> main.py), para recargarlos en un proceso nuevo.
+        self._modules: Dict[str, str] = {}
+        self.restarts = 0
+        # Funciones expuestas por más de un módulo: {función: [módulos]}
+        self.collisions: Dict[str, List[str]] = {}
+        # JSON Schema de cada función (ver function_table.describe_functions)
+        self.schemas: Dict[str, Dict[str, Any]] = {}
+        # Módulo que atiende cada función (etiqueta de métricas "session:<módulo>")
+        self.function_modules: Dict[str, str] = {}
+
+    @classmethod
+    async def create(cls) -> "SessionWorker":
+        """
+        Arranca el proceso en un hilo (spawn bloquea) y retorna el worker.
+        """
+        return cls(await asyncio.to_thread(cls._spawn))
+
+    @staticmethod
+    def _spawn() -> WorkerProcess:
+        worker = WorkerProcess(get_worker_context(), session_worker_main)
+        # Respuestas descartadas (llamadas canceladas): su memoria compartida se libera aquí.
+        worker.on_discard = lambda reply: discard_value(reply[1]) if reply[0] in ("ok", "chunk") else None
+        return worker
+
+    @property
+    def pid(self) -> int:
+        return self._worker.process.pid
+
+    async def _stop_worker(self, timeout: float) -> None:
+        worker = self._worker
+        await asyncio.to_thread(worker.stop, timeout)
+        # Segmentos que el proceso creó y nadie llegó a leer.
+        release_process_segments(worker.process.pid)
+
+    async def _ensure_worker(self) -> None:
+        """
+        Reemplaza el proceso si murió y recarga los módulos de la sesión.
+        Llamar con self._lock tomado.
+        """
+        if not self._worker.broken and self._worker.is_alive():
+            return
+        await self._stop_worker(timeout=0.1)
+        self._worker = await asyncio.to_thread(self._spawn)
+        self.restarts += 1
+        for module_name, main_py in self._modules.items():
+            reply = await self._worker.request(("load", module_name, main_py))
+            if reply[0] == "error":
+                self._worker.broken = True
+                message = f"El worker se reinició pero el módulo {module_name} no se pudo recargar: {reply[2]}"
+                raise ScriptWorkerError("worker_died", message)
+            self._apply_load(reply)
+
+    async def _send(self, message: tuple) -> tuple:
+        # Con self._lock tomado. Si el proceso muere, request() lo marca como
+        # broken y se reemplaza en la próxima petición.
+        await self._ensure_worker()
+        return await self._worker.request(message)
+
+    def _apply_load(self, reply: tuple) -> None:
+        self.collisions = reply[1]["collisions"]
+        self.schemas = reply[1]["schemas"]
+        self.function_modules = reply[1]["owners"]
+
+    async def load_module(self, module_name: str, main_py: str) -> Tuple[str, Optional[str]]:
+        """
+        Importa e instancia el módulo dentro del worker (ejecuta onLoad). Si
+        reemplaza a una instancia anterior, ejecuta su onDestroy.
+        Retorna el contenido `.d.ts` de su clase y el error de ese onDestroy (o None).
+        """
+        async with self._lock:
+            reply = await self._send(("load", module_name, main_py))
+            if reply[0] == "error":
+                raise ScriptWorkerError(reply[1], reply[2])
+            self._modules[module_name] = main_py
+            self._apply_load(reply)
+        return reply[1]["dts"], reply[1]["destroy_error"]
+
+    async def execute(self, function: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta la función en el worker. Si es un generador retorna un
+        WorkerStream (el worker queda reservado hasta que el stream termina).
+        'timeout' lo aplica el propio worker (no se mata el proceso: se
+        perdería el estado de la sesión).
+        """
+        await self._lock.acquire()
+        payload = None
+        try:
+            payload = encode_value(params)
+            reply = await self._send(("execute", function, payload, timeout))
+        except BaseException:
+            self._lock.release()
+            raise
+        finally:
+            # Normalmente el worker ya lo liberó; si no llegó a leerlo (función
+            # inexistente, worker muerto...) se libera aquí.
+            if payload is not None:
+                discard_value(payload)
+
+        if reply[0] == "stream":
+            return WorkerStream(self._worker, lambda worker: self._lock.release(), decode=decode_value)
+        self._lock.release()
+        if reply[0] == "error":
+            raise ScriptWorkerError(reply[1], reply[2])
+        return decode_value(reply[1])
+
+    async def destroy(self) -> Dict[str, str]:
+        """
+        Ejecuta onDestroy en todos los módulos y termina el proceso.
+        Retorna los errores de onDestroy por módulo.
+        """
+        async with self._lock:
+            if self._worker.broken or not self._worker.is_alive():
+                # No se arranca otro proceso sólo para destruirlo.
+                errors = {"*": "El worker de la sesión terminó inesperadamente."} if self._modules else {}
+            else:
+                try:
+                    reply = await self._worker.request(("destroy",))
+                    errors = reply[1] if reply[0] == "ok" else {"*": reply[2]}
+                except ScriptWorkerError as e:
+                    errors = {"*": e.message}
+            await self._stop_worker(timeout=1.0)
+        return errors
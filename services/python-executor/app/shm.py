@@ -0,0 +1,113 @@
+# shm.py
+import os
+import pickle
+import secrets
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Set, Tuple
+
+# A partir de este tamaño (bytes serializados) el valor viaja por memoria
+# compartida y por el pipe sólo pasa el nombre del segmento.
+SHM_THRESHOLD = int(os.environ.get("SHM_THRESHOLD", str(256 * 1024)))
+
+# Donde Linux expone los segmentos como archivos (ver release_process_segments).
+_SHM_DIR = "/dev/shm"
+
+# Segmentos creados por este proceso que el receptor todavía puede no haber
+# liberado (ver forget_outstanding / release_outstanding).
+_outstanding: Set[str] = set()
+
+
+def _segment_prefix(pid: int) -> str:
+    # El pid del creador en el nombre permite limpiar lo que deja un proceso que murió.
+    return f"codecms_{pid}_"
+
+
+def _unlink(name: str) -> None:
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    segment.close()
+    segment.unlink()
+
+
+def encode_value(value: Any) -> Tuple:
+    """
+    Serializa 'value' para enviarlo a otro proceso. Los valores grandes se
+    copian a un segmento de memoria compartida que el receptor libera.
+    """
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) < SHM_THRESHOLD:
+        return ("raw", data)
+
+    name = _segment_prefix(os.getpid()) + secrets.token_hex(8)
+    segment = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    try:
+        segment.buf[: len(data)] = data
+    finally:
+        segment.close()
+    # El receptor hace unlink(); evitamos que el resource_tracker de este
+    # proceso lo considere una fuga e intente borrarlo de nuevo. El segmento
+    # queda en _outstanding por si el receptor nunca lo decodifica.
+    resource_tracker.unregister(segment._name, "shared_memory")
+    _outstanding.add(name)
+    return ("shm", name, len(data))
+
+
+def decode_value(payload: Tuple) -> Any:
+    """
+    Reconstruye un valor producido por encode_value y libera su segmento.
+    """
+    if payload[0] == "raw":
+        return pickle.loads(payload[1])
+
+    _, name, size = payload
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        return pickle.loads(segment.buf[:size])
+    finally:
+        segment.close()
+        segment.unlink()
+
+
+def discard_value(payload: Any) -> None:
+    """
+    Libera el segmento de un valor que no se va a decodificar (respuesta
+    descartada, o argumentos que el receptor pudo no llegar a leer). Si el
+    receptor ya lo liberó no hace nada.
+    """
+    if isinstance(payload, tuple) and payload and payload[0] == "shm":
+        _outstanding.discard(payload[1])
+        _unlink(payload[1])
+
+
+def forget_outstanding() -> None:
+    """
+    El receptor ya tiene los valores enviados hasta ahora (los decodificó o
+    los liberó con discard_value): dejan de ser responsabilidad de este proceso.
+    """
+    _outstanding.clear()
+
+
+def release_outstanding() -> None:
+    """
+    Libera los segmentos enviados que el receptor no llegó a liberar (al
+    terminar el proceso, o si el receptor desapareció).
+    """
+    for name in list(_outstanding):
+        _unlink(name)
+    _outstanding.clear()
+
+
+def release_process_segments(pid: int) -> None:
+    """
+    Libera los segmentos que dejó el proceso 'pid' al terminar (p.ej. un
+    worker que murió con un resultado en tránsito). Sólo donde los segmentos
+    son archivos de /dev/shm (Linux); en otros sistemas no hace nada.
+    """
+    if not os.path.isdir(_SHM_DIR):
+        return
+    prefix = _segment_prefix(pid)
+    for name in os.listdir(_SHM_DIR):
+        if name.startswith(prefix):
+            _unlink(name)
@@ -0,0 +1,315 @@
+# signatures.py
+import inspect
+import json
+import threading
+import types
+import typing
+import warnings
+import weakref
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from pydantic import ConfigDict, Field, TypeAdapter, ValidationError, create_model
+
+from .blob_store import BlobRef
+
+_EMPTY = inspect.Parameter.empty
+
+
+class InvalidParameters(ValueError):
+    """
+    Los parámetros no cumplen la firma de la función. 'errors' es la lista
+    de errores de pydantic (loc, msg, type).
+    """
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        self.errors = errors
+        super().__init__("; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'params'}: {error['msg']}" for error in errors
+        ))
+
+
+def _type_hints(func: Callable) -> Dict[str, Any]:
+    try:
+        return typing.get_type_hints(func)
+    except Exception:
+        # Anotaciones en string que no se pueden resolver: se ignoran.
+        return {}
+
+
+def _schema_of(annotation: Any) -> Optional[Dict[str, Any]]:
+    """
+    JSON Schema de la anotación, o None si pydantic no sabe validarla
+    (clases arbitrarias, strings sin resolver...): esos parámetros no se validan.
+    """
+    if isinstance(annotation, str):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return TypeAdapter(annotation).json_schema()
+    except Exception:
+        return None
+
+
+def schema_to_ts(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None, depth: int = 0) -> str:
+    """
+    Tipo TypeScript equivalente a un JSON Schema (el que genera pydantic).
+    """
+    if defs is None:
+        defs = schema.get("$defs", {})
+    if depth > 8:
+        return "any"
+    if "$ref" in schema:
+        return schema_to_ts(defs.get(schema["$ref"].rsplit("/", 1)[-1], {}), defs, depth + 1)
+    for union_key in ("anyOf", "oneOf"):
+        if union_key in schema:
+            members = []
+            for option in schema[union_key]:
+                ts = schema_to_ts(option, defs, depth + 1)
+                if ts not in members:
+                    members.append(ts)
+            return " | ".join(members)
+    if "const" in schema:
+        return json.dumps(schema["const"])
+    if "enum" in schema:
+        return " | ".join(json.dumps(value) for value in schema["enum"])
+
+    kind = schema.get("type")
+    if kind == "string":
+        return "string"
+    if kind in ("integer", "number"):
+        return "number"
+    if kind == "boolean":
+        return "boolean"
+    if kind == "null":
+        return "null"
+    if kind == "array":
+        if "prefixItems" in schema:
+            return f"[{', '.join(schema_to_ts(item, defs, depth + 1) for item in schema['prefixItems'])}]"
+        items = schema.get("items") or {}
+        inner = schema_to_ts(items, defs, depth + 1) if items else "any"
+        return f"({inner})[]" if "|" in inner else f"{inner}[]"
+    if kind == "object":
+        properties = schema.get("properties")
+        if properties:
+            required = set(schema.get("required", ()))
+            fields = [
+                f"{name}{'' if name in required else '?'}: {schema_to_ts(value, defs, depth + 1)}"
+                for name, value in properties.items()
+            ]
+            return f"{{ {'; '.join(fields)} }}"
+        additional = schema.get("additionalProperties")
+        value_ts = schema_to_ts(additional, defs, depth + 1) if isinstance(additional, dict) and additional else "any"
+        return f"{{ [key: string]: {value_ts} }}"
+    return "any"
+
+
+def _annotation_ts(annotation: Any, schema: Optional[Dict[str, Any]]) -> str:
+    if annotation is _EMPTY:
+        return "any"
+    if annotation is Any:
+        return "unknown"
+    if schema is None:
+        return "any"
+    return schema_to_ts(schema)
+
+
+class FunctionSignature:
+    """
+    Firma de una función precompilada: un modelo pydantic que valida y
+    convierte los parámetros (p.ej. "3" -> 3 si se anotó int), su JSON
+    Schema y los tipos TypeScript de parámetros y retorno. Se construye una
+    vez por función (ver signature_for).
+
+    Los parámetros sin anotación, o con tipos que pydantic no sabe validar,
+    aceptan cualquier valor; los que faltan o sobran (sin **kwargs) se
+    rechazan igualmente.
+    """
+
+    __slots__ = (
+        "name", "_model", "_blob_models", "_definitions", "_config", "_fields",
+        "accepts_extra", "ts_params", "ts_returns", "returns", "_schema",
+    )
+
+    def __init__(self, name: str, func: Callable, bound: bool):
+        self.name = name
+        signature = inspect.signature(func)
+        hints = _type_hints(func)
+        parameters = list(signature.parameters.values())
+        if bound and parameters:
+            parameters = parameters[1:]
+
+        self.accepts_extra = False
+        # (nombre del campo en el modelo, nombre del parámetro)
+        self._fields: List[Tuple[str, str]] = []
+        self.ts_params: List[Tuple[str, str, bool]] = []
+        definitions: Dict[str, Any] = {}
+        for parameter in parameters:
+            if parameter.kind == inspect.Parameter.VAR_KEYWORD:
+                self.accepts_extra = True
+                continue
+            if parameter.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.POSITIONAL_ONLY):
+                # No se pueden pasar por nombre.
+                continue
+            annotation = hints.get(parameter.name, parameter.annotation)
+            schema = None if annotation is _EMPTY or annotation is Any else _schema_of(annotation)
+            required = parameter.default is _EMPTY
+            # Campos con nombre neutro y alias: el parámetro puede llamarse
+            # como un atributo de BaseModel o empezar por "_".
+            field_name = f"p{len(self._fields)}"
+            definitions[field_name] = (
+                annotation if schema is not None else Any,
+                Field(... if required else parameter.default, alias=parameter.name),
+            )
+            self._fields.append((field_name, parameter.name))
+            self.ts_params.append((parameter.name, _annotation_ts(annotation, schema), required))
+
+        return_annotation = hints.get("return", signature.return_annotation)
+        untyped_return = return_annotation is _EMPTY or return_annotation is Any
+        self.returns = None if untyped_return else _schema_of(return_annotation)
+        self.ts_returns = _annotation_ts(return_annotation, self.returns)
+
+        self._config = ConfigDict(
+            extra="allow" if self.accepts_extra else "forbid",
+            arbitrary_types_allowed=True,
+            title=name,
+        )
+        self._definitions = definitions
+        self._model = create_model(f"{name}_params", __config__=self._config, **definitions)
+        # nombres de los parámetros que llegan como BlobRef -> modelo (ver _blob_model)
+        self._blob_models: Dict[FrozenSet[str], Any] = {}
+        self._schema: Optional[Dict[str, Any]] = None
+
+    def _blob_model(self, blob_names: FrozenSet[str]) -> Any:
+        # Variante para las llamadas con blobs: los parámetros que llegan como
+        # BlobRef no se validan aquí (se abren en el punto de ejecución); el
+        # resto se valida igual, obligatorios incluidos.
+        model = self._blob_models.get(blob_names)
+        if model is None:
+            definitions = {
+                field: (Any, Field(None, alias=info.alias)) if info.alias in blob_names else (annotation, info)
+                for field, (annotation, info) in self._definitions.items()
+            }
+            model = create_model(f"{self.name}_blob_params", __config__=self._config, **definitions)
+            self._blob_models[blob_names] = model
+        return model
+
+    def validate(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Valida y convierte los parámetros. Retorna los kwargs para llamar a
+        la función (sólo los recibidos: los omitidos usan el default de la
+        función). Lanza InvalidParameters. Las referencias a blobs (BlobRef)
+        no se validan, pero cuentan como parámetros recibidos.
+        """
+        blobs = frozenset(name for name, value in params.items() if isinstance(value, BlobRef))
+        model = self._blob_model(blobs) if blobs else self._model
+        try:
+            validated = model.model_validate(params)
+        except ValidationError as e:
+            errors = e.errors(include_url=False, include_context=False, include_input=False)
+            raise InvalidParameters(errors) from None
+
+        provided = validated.model_fields_set
+        kwargs = {alias: getattr(validated, field) for field, alias in self._fields if field in provided}
+        if validated.model_extra:
+            kwargs.update(validated.model_extra)
+        return kwargs
+
+    def json_schema(self) -> Dict[str, Any]:
+        """
+        JSON Schema de los parámetros (objeto con una propiedad por parámetro).
+        """
+        if self._schema is None:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    self._schema = self._model.model_json_schema(by_alias=True)
+            except Exception:
+                self._schema = {"type": "object", "title": self.name}
+        return self._schema
+
+    def describe(self) -> Dict[str, Any]:
+        return {"parameters": self.json_schema(), "returns": self.returns or {}}
+
+    def dts(self, name: Optional[str] = None) -> str:
+        """
+        Declaración TypeScript del método: nombre(args: { ... }): retorno;
+        """
+        args = ", ".join(f"{name}: {ts}" if required else f"{name}?: {ts}" for name, ts, required in self.ts_params)
+        return f"{name or self.name}(args: {{ {args} }}): {self.ts_returns};"
+
+
+# función -> {ligada: FunctionSignature}. Débil: se libera con el módulo.
+_signatures: "weakref.WeakKeyDictionary[Any, Dict[bool, Optional[FunctionSignature]]]" = weakref.WeakKeyDictionary()
+_signatures_lock = threading.Lock()
+
+
+def signature_for(fn: Callable, bound: Optional[bool] = None) -> Optional[FunctionSignature]:
+    """
+    FunctionSignature cacheada de fn, o None si no se puede introspectar.
+    Para métodos ligados se cachea sobre la función de la clase (la misma
+    entrada que usa generate_dts_string); 'bound' indica si la función se
+    llamará ligada (se omite el primer parámetro).
+    """
+    target = fn
+    if inspect.ismethod(fn):
+        target, bound = fn.__func__, True
+    bound = bool(bound)
+    try:
+        cached = _signatures.get(target)
+    except TypeError:
+        # No admite weakref (builtins): sin cache.
+        cached = None
+    if cached is not None and bound in cached:
+        return cached[bound]
+
+    name = getattr(target, "__name__", type(target).__name__)
+    try:
+        signature = FunctionSignature(name, target, bound)
+    except Exception:
+        signature = None
+    with _signatures_lock:
+        try:
+            _signatures.setdefault(target, {})[bound] = signature
+        except TypeError:
+            pass
+    return signature
+
+
+def validate_params(fn: Callable, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida los parámetros de una llamada a fn (ver FunctionSignature.validate).
+    Sin firma introspectable se retornan tal cual.
+    """
+    signature = signature_for(fn)
+    return params if signature is None else signature.validate(params)
+
+
+def module_signatures(module: types.ModuleType) -> Dict[str, FunctionSignature]:
+    """
+    Firmas de las funciones públicas definidas en un script (no las importadas).
+    Llamarla al cargar el módulo deja los validadores precompilados.
+    """
+    signatures = {}
+    for name, value in vars(module).items():
+        if name.startswith("_") or not inspect.isfunction(value) or value.__module__ != module.__name__:
+            continue
+        signature = signature_for(value)
+        if signature is not None:
+            signatures[name] = signature
+    return signatures
+
+
+def describe_module(module: types.ModuleType, module_name: str) -> Dict[str, Any]:
+    """
+    JSON Schema por función y `.d.ts` de un script.
+    """
+    signatures = module_signatures(module)
+    lines = [f'declare module "{module_name}" {{']
+    for name, signature in signatures.items():
+        lines.append(f"  export function {signature.dts(name)}")
+    lines.append("}")
+    return {
+        "functions": {name: signature.describe() for name, signature in signatures.items()},
+        "dts": "\n".join(lines),
+    }
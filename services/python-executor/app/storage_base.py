@@ -55,3 +55,52 @@ class ScriptStorage(ABC):
         Elimina el script del almacenamiento si existe.
         """
         pass
+
+    @abstractmethod
+    def set_alias(self, alias: str, script_hash: str) -> None:
+        """
+        Asocia un alias de importación a un script (ver script_imports.py).
+        Los alias se guardan junto a los scripts: sobreviven a un reinicio si
+        el backend es persistente y los comparten los workers que usan el
+        mismo almacenamiento.
+        """
+        pass
+
+    @abstractmethod
+    def get_alias(self, alias: str) -> Optional[str]:
+        """
+        Retorna el ID del script al que apunta el alias, o None.
+        """
+        pass
+
+    @abstractmethod
+    def list_aliases(self) -> Dict[str, str]:
+        """
+        Devuelve todos los alias (alias -> ID del script).
+        """
+        pass
+
+    def version(self) -> Any:
+        """
+        Valor que cambia cuando otro proceso modifica el almacenamiento
+        compartido, o None si el backend no se comparte entre procesos.
+        """
+        return None
+
+    def flush(self) -> None:
+        """
+        Persiste las escrituras pendientes (sólo backends que agrupan escrituras).
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Libera los recursos del backend (conexiones, archivos...).
+        """
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Contadores del backend (aciertos/fallos del cache de módulos, tamaño...).
+        """
+        return {}
@@ -0,0 +1,23 @@
+# storage_factory.py
+import os
+from typing import Any, Callable, Optional
+from .storage_base import ScriptStorage
+from .storage_inmemory import InMemoryScriptStorage
+from .storage_sqlite import SQLiteScriptStorage
+
+# Backend de almacenamiento de scripts: "memory" o "sqlite".
+SCRIPT_STORAGE_BACKEND = os.environ.get("SCRIPT_STORAGE_BACKEND", "memory")
+
+
+def create_script_storage(
+    backend: str = SCRIPT_STORAGE_BACKEND,
+    loader: Optional[Callable[..., Any]] = None,
+) -> ScriptStorage:
+    """
+    Crea el backend de almacenamiento indicado.
+    """
+    if backend == "memory":
+        return InMemoryScriptStorage(loader=loader)
+    if backend == "sqlite":
+        return SQLiteScriptStorage(loader=loader)
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
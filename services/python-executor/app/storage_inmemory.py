@@ -1,48 +1,202 @@
 # storage_inmemory.py
-from typing import Optional, List, Any
-from storage_base import ScriptStorage
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Any, Callable, Dict
+from .storage_base import ScriptStorage
+
+# Límites por defecto (0 = sin límite).
+SCRIPT_STORAGE_MAX_ENTRIES = int(os.environ.get("SCRIPT_STORAGE_MAX_ENTRIES", "0"))
+SCRIPT_STORAGE_MAX_MODULES = int(os.environ.get("SCRIPT_STORAGE_MAX_MODULES", "0"))
+SCRIPT_STORAGE_MAX_BYTES = int(os.environ.get("SCRIPT_STORAGE_MAX_BYTES", "0"))
+
+
+def estimate_module_size(module: Any) -> int:
+    """
+    Estimación (superficial) de la memoria que ocupa un módulo cargado.
+    """
+    namespace = getattr(module, "__dict__", None)
+    if namespace is None:
+        return sys.getsizeof(module)
+    size = sys.getsizeof(module) + sys.getsizeof(namespace)
+    for name, value in namespace.items():
+        if name == "__builtins__":
+            continue
+        size += sys.getsizeof(value)
+    return size
+
 
 class InMemoryScriptStorage(ScriptStorage):
     """
-    Implementación en memoria.
-    Almacena un diccionario con la forma:
+    Implementación en memoria con desalojo LRU.
+    Almacena un diccionario ordenado (más antiguo primero) con la forma:
       data[script_hash] = {
         "content": str,
-        "module": Any
+        "module": Any,
+        "content_size": int,
+        "module_size": int
       }
+    Al superar los límites se descargan primero los módulos menos usados
+    (el fuente se conserva) y, si no alcanza, se eliminan los scripts.
+    Si se indica 'loader', get_script_module recarga el módulo de forma
+    transparente cuando fue desalojado.
     """
 
-    def __init__(self):
-        self.data = {}
+    def __init__(
+        self,
+        max_entries: int = SCRIPT_STORAGE_MAX_ENTRIES,
+        max_modules: int = SCRIPT_STORAGE_MAX_MODULES,
+        max_bytes: int = SCRIPT_STORAGE_MAX_BYTES,
+        loader: Optional[Callable[[str, str], Any]] = None,
+    ):
+        self.data = OrderedDict()
+        self.max_entries = max_entries
+        self.max_modules = max_modules
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.total_bytes = 0
+        # Hashes con módulo cargado, en orden LRU.
+        self._modules_lru = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        # Aciertos/fallos de get_script_module (un fallo implica recargar el módulo)
+        self.module_hits = 0
+        self.module_misses = 0
+
+    # ---------- Desalojo ----------
+
+    def _drop_module(self, script_hash: str) -> None:
+        entry = self.data[script_hash]
+        if entry["module"] is not None:
+            self.total_bytes -= entry["module_size"]
+            entry["module"] = None
+            entry["module_size"] = 0
+        self._modules_lru.pop(script_hash, None)
+
+    def _drop_entry(self, script_hash: str) -> None:
+        self._drop_module(script_hash)
+        entry = self.data.pop(script_hash)
+        self.total_bytes -= entry["content_size"]
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> None:
+        # 1) Módulos: por cantidad y por bytes, LRU primero.
+        while self._modules_lru and (
+            (self.max_modules and len(self._modules_lru) > self.max_modules)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._modules_lru))
+            if oldest == keep and len(self._modules_lru) == 1:
+                break
+            if oldest == keep:
+                self._modules_lru.move_to_end(oldest)
+                continue
+            self._drop_module(oldest)
+
+        # 2) Fuentes: por cantidad de scripts y por bytes.
+        while self.data and (
+            (self.max_entries and len(self.data) > self.max_entries)
+            or (self.max_bytes and self.total_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self.data))
+            if oldest == keep:
+                if len(self.data) == 1:
+                    break
+                self.data.move_to_end(oldest)
+                continue
+            self._drop_entry(oldest)
+
+    # ---------- Interfaz ScriptStorage ----------
 
     def store_script(self, script_hash: str, content: str) -> None:
-        self.data[script_hash] = {
-            "content": content,
-            "module": None
-        }
+        with self._lock:
+            if script_hash in self.data:
+                self._drop_entry(script_hash)
+            content_size = sys.getsizeof(content)
+            self.data[script_hash] = {
+                "content": content,
+                "module": None,
+                "content_size": content_size,
+                "module_size": 0
+            }
+            self.total_bytes += content_size
+            self._enforce_limits(keep=script_hash)
 
     def get_script_content(self, script_hash: str) -> Optional[str]:
-        entry = self.data.get(script_hash)
-        if entry is None:
-            return None
-        return entry["content"]
+        with self._lock:
+            entry = self.data.get(script_hash)
+            if entry is None:
+                return None
+            self.data.move_to_end(script_hash)
+            return entry["content"]
 
     def get_script_module(self, script_hash: str) -> Optional[Any]:
-        entry = self.data.get(script_hash)
-        if entry is None:
-            return None
-        return entry["module"]
+        with self._lock:
+            entry = self.data.get(script_hash)
+            if entry is None:
+                return None
+            self.data.move_to_end(script_hash)
+            if entry["module"] is not None:
+                self._modules_lru.move_to_end(script_hash)
+                self.module_hits += 1
+                return entry["module"]
+            self.module_misses += 1
+            if self.loader is None:
+                return None
+            content = entry["content"]
+
+        # Recarga transparente tras un desalojo (fuera del lock).
+        module = self.loader(script_hash, content)
+        with self._lock:
+            entry = self.data.get(script_hash)
+            if entry is not None and entry["content"] is content:
+                self.set_script_module(script_hash, module)
+        return module
 
     def set_script_module(self, script_hash: str, module: Any) -> None:
-        if script_hash in self.data:
-            self.data[script_hash]["module"] = module
+        with self._lock:
+            entry = self.data.get(script_hash)
+            if entry is None:
+                return
+            self._drop_module(script_hash)
+            if module is None:
+                return
+            entry["module"] = module
+            entry["module_size"] = estimate_module_size(module)
+            self.total_bytes += entry["module_size"]
+            self._modules_lru[script_hash] = True
+            self._enforce_limits(keep=script_hash)
 
     def list_scripts(self) -> List[str]:
-        return list(self.data.keys())
+        with self._lock:
+            return list(self.data.keys())
 
     def script_exists(self, script_hash: str) -> bool:
         return script_hash in self.data
 
     def delete_script(self, script_hash: str) -> None:
-        if script_hash in self.data:
-            del self.data[script_hash]
+        with self._lock:
+            if script_hash in self.data:
+                self._drop_entry(script_hash)
+
+    def set_alias(self, alias: str, script_hash: str) -> None:
+        with self._lock:
+            self._aliases[alias] = script_hash
+
+    def get_alias(self, alias: str) -> Optional[str]:
+        with self._lock:
+            return self._aliases.get(alias)
+
+    def list_aliases(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._aliases)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "scripts": len(self.data),
+                "modules_loaded": len(self._modules_lru),
+                "bytes": self.total_bytes,
+                "module_hits": self.module_hits,
+                "module_misses": self.module_misses,
+            }
@@ -0,0 +1,246 @@
+# storage_sqlite.py
+import importlib.util
+import marshal
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Any, Callable, Dict, Tuple
+from .storage_base import ScriptStorage
+from .storage_inmemory import SCRIPT_STORAGE_MAX_MODULES
+from .script_loader import compile_script
+
+SQLITE_STORAGE_PATH = os.environ.get("SQLITE_STORAGE_PATH", "scripts.db")
+# Escrituras agrupadas: se confirman al llegar a N pendientes o tras X segundos.
+SQLITE_WRITE_BATCH_SIZE = int(os.environ.get("SQLITE_WRITE_BATCH_SIZE", "64"))
+SQLITE_FLUSH_INTERVAL = float(os.environ.get("SQLITE_FLUSH_INTERVAL", "1.0"))
+
+# Sentencias constantes: el módulo sqlite3 las mantiene preparadas en su cache.
+_SQL_CREATE = """
+CREATE TABLE IF NOT EXISTS scripts (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    bytecode BLOB,
+    magic BLOB,
+    updated_at REAL NOT NULL
+)
+"""
+_SQL_UPSERT = """
+INSERT INTO scripts (hash, content, bytecode, magic, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(hash) DO UPDATE SET
+    content = excluded.content,
+    bytecode = excluded.bytecode,
+    magic = excluded.magic,
+    updated_at = excluded.updated_at
+"""
+_SQL_DELETE = "DELETE FROM scripts WHERE hash = ?"
+_SQL_SELECT_CONTENT = "SELECT content FROM scripts WHERE hash = ?"
+_SQL_SELECT_CODE = "SELECT content, bytecode, magic FROM scripts WHERE hash = ?"
+_SQL_EXISTS = "SELECT 1 FROM scripts WHERE hash = ?"
+_SQL_LIST = "SELECT hash FROM scripts"
+_SQL_CREATE_ALIASES = """
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    hash TEXT NOT NULL
+)
+"""
+_SQL_UPSERT_ALIAS = """
+INSERT INTO aliases (alias, hash) VALUES (?, ?)
+ON CONFLICT(alias) DO UPDATE SET hash = excluded.hash
+"""
+_SQL_SELECT_ALIAS = "SELECT hash FROM aliases WHERE alias = ?"
+_SQL_LIST_ALIASES = "SELECT alias, hash FROM aliases"
+
+# Bytecode válido sólo para la misma versión de Python.
+_MAGIC = importlib.util.MAGIC_NUMBER
+
+
+def _serialize_code(content: str) -> Tuple[Optional[bytes], Optional[bytes]]:
+    try:
+        return marshal.dumps(compile_script(content)), _MAGIC
+    except (SyntaxError, ValueError):
+        # Se guarda igual; el error aparecerá al cargarlo (ValueError: bytes nulos en el fuente).
+        return None, None
+
+
+class SQLiteScriptStorage(ScriptStorage):
+    """
+    Implementación persistente sobre SQLite en modo WAL.
+    Guarda el fuente y el bytecode serializado (marshal) de cada script, de
+    modo que tras un reinicio no hace falta volver a subir ni a compilar.
+    Las escrituras se agrupan en lotes; las lecturas consultan primero las
+    escrituras pendientes. Los módulos cargados se cachean en memoria (LRU).
+    """
+
+    def __init__(
+        self,
+        path: str = SQLITE_STORAGE_PATH,
+        batch_size: int = SQLITE_WRITE_BATCH_SIZE,
+        flush_interval: float = SQLITE_FLUSH_INTERVAL,
+        max_modules: int = SCRIPT_STORAGE_MAX_MODULES,
+        loader: Optional[Callable[..., Any]] = None,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_modules = max_modules
+        self.loader = loader
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SQL_CREATE)
+        self._conn.execute(_SQL_CREATE_ALIASES)
+
+        # hash -> (content, bytecode, magic, updated_at) o None si es un borrado
+        self._pending: Dict[str, Optional[tuple]] = {}
+        self._pending_since: Optional[float] = None
+        self._modules: "OrderedDict[str, Any]" = OrderedDict()
+        self.module_hits = 0
+        self.module_misses = 0
+
+    # ---------- Escrituras agrupadas ----------
+
+    def _queue_write(self, script_hash: str, row: Optional[tuple]) -> None:
+        self._pending[script_hash] = row
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if (
+            len(self._pending) >= self.batch_size
+            or time.monotonic() - self._pending_since >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            upserts = [(h,) + row for h, row in self._pending.items() if row is not None]
+            deletes = [(h,) for h, row in self._pending.items() if row is None]
+            self._conn.execute("BEGIN")
+            try:
+                if upserts:
+                    self._conn.executemany(_SQL_UPSERT, upserts)
+                if deletes:
+                    self._conn.executemany(_SQL_DELETE, deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self._pending_since = None
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    # ---------- Lecturas ----------
+
+    def _read_row(self, script_hash: str) -> Optional[tuple]:
+        if script_hash in self._pending:
+            row = self._pending[script_hash]
+            return None if row is None else row[:3]
+        return self._conn.execute(_SQL_SELECT_CODE, (script_hash,)).fetchone()
+
+    # ---------- Interfaz ScriptStorage ----------
+
+    def store_script(self, script_hash: str, content: str) -> None:
+        bytecode, magic = _serialize_code(content)
+        with self._lock:
+            self._modules.pop(script_hash, None)
+            self._queue_write(script_hash, (content, bytecode, magic, time.time()))
+
+    def get_script_content(self, script_hash: str) -> Optional[str]:
+        with self._lock:
+            if script_hash in self._pending:
+                row = self._pending[script_hash]
+                return None if row is None else row[0]
+            row = self._conn.execute(_SQL_SELECT_CONTENT, (script_hash,)).fetchone()
+        return None if row is None else row[0]
+
+    def get_script_module(self, script_hash: str) -> Optional[Any]:
+        with self._lock:
+            module = self._modules.get(script_hash)
+            if module is not None:
+                self._modules.move_to_end(script_hash)
+                self.module_hits += 1
+                return module
+            self.module_misses += 1
+            if self.loader is None:
+                return None
+            row = self._read_row(script_hash)
+        if row is None:
+            return None
+
+        content, bytecode, magic = row
+        code = marshal.loads(bytecode) if bytecode is not None and magic == _MAGIC else None
+        module = self.loader(script_hash, content, code)
+        with self._lock:
+            if self.get_script_content(script_hash) == content:
+                self.set_script_module(script_hash, module)
+        return module
+
+    def set_script_module(self, script_hash: str, module: Any) -> None:
+        with self._lock:
+            if module is None:
+                self._modules.pop(script_hash, None)
+                return
+            self._modules[script_hash] = module
+            self._modules.move_to_end(script_hash)
+            while self.max_modules and len(self._modules) > self.max_modules:
+                self._modules.popitem(last=False)
+
+    def list_scripts(self) -> List[str]:
+        with self._lock:
+            hashes = [row[0] for row in self._conn.execute(_SQL_LIST)]
+            result = [h for h in hashes if self._pending.get(h, True) is not None]
+            known = set(hashes)
+            result.extend(
+                h for h, row in self._pending.items() if row is not None and h not in known
+            )
+        return result
+
+    def script_exists(self, script_hash: str) -> bool:
+        with self._lock:
+            if script_hash in self._pending:
+                return self._pending[script_hash] is not None
+            return self._conn.execute(_SQL_EXISTS, (script_hash,)).fetchone() is not None
+
+    def delete_script(self, script_hash: str) -> None:
+        with self._lock:
+            self._modules.pop(script_hash, None)
+            self._queue_write(script_hash, None)
+
+    def set_alias(self, alias: str, script_hash: str) -> None:
+        # Sin agrupar: el alias (y el script al que apunta) deben ser visibles
+        # de inmediato para los demás workers.
+        with self._lock:
+            self.flush()
+            self._conn.execute(_SQL_UPSERT_ALIAS, (alias, script_hash))
+
+    def get_alias(self, alias: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(_SQL_SELECT_ALIAS, (alias,)).fetchone()
+        return None if row is None else row[0]
+
+    def list_aliases(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._conn.execute(_SQL_LIST_ALIASES).fetchall())
+
+    def version(self) -> Any:
+        # data_version cambia cuando otra conexión confirma una escritura.
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "modules_loaded": len(self._modules),
+                "pending_writes": len(self._pending),
+                "module_hits": self.module_hits,
+                "module_misses": self.module_misses,
+            }
@@ -0,0 +1,95 @@
+# streaming.py
+import inspect
+from typing import Any, AsyncIterator, List, Optional
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from .dispatcher import dispatcher
+from .serialization import dumps_json
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+_END = object()
+
+
+def is_stream(value: Any) -> bool:
+    """
+    True si el resultado de una función es un generador (sync o async).
+    """
+    return inspect.isgenerator(value) or inspect.isasyncgen(value) or hasattr(value, "__anext__")
+
+
+async def iterate_stream(source: Any, key: str, limit: Optional[int] = None) -> AsyncIterator[Any]:
+    """
+    Itera un generador sync (cada next() va al pool de hilos del dispatcher,
+    con la misma clave y límite que la llamada que lo creó) o async
+    (directamente en el event loop). Cierra el generador al terminar
+    o si el consumidor deja de iterar.
+    """
+    if hasattr(source, "__anext__"):
+        try:
+            async for item in source:
+                yield item
+        finally:
+            await source.aclose()
+        return
+
+    try:
+        while True:
+            item = await dispatcher.dispatch(key, lambda: next(source, _END), {}, limit=limit)
+            if item is _END:
+                break
+            yield item
+    finally:
+        try:
+            source.close()
+        except ValueError:
+            # El generador sigue ejecutándose en un hilo; se cerrará al terminar.
+            pass
+
+
+async def collect_stream(source: Any, key: str, limit: Optional[int] = None) -> List[Any]:
+    """
+    Materializa un stream completo (para endpoints que no pueden hacer streaming).
+    """
+    return [item async for item in iterate_stream(source, key, limit)]
+
+
+def _encode_ndjson(item: Any) -> bytes:
+    return dumps_json(item) + b"\n"
+
+
+def _encode_sse(item: Any, event: Optional[str] = None) -> bytes:
+    data = dumps_json(item).decode("utf-8")
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n".encode("utf-8")
+
+
+def stream_response(request: Request, source: Any, key: str, limit: Optional[int] = None) -> StreamingResponse:
+    """
+    Devuelve el generador chunk a chunk como NDJSON (por defecto) o como
+    Server-Sent Events si el cliente envía 'Accept: text/event-stream'.
+    El siguiente chunk sólo se pide cuando el anterior se envió
+    (backpressure); si el cliente se desconecta, el generador se cierra.
+    """
+    use_sse = SSE_MEDIA_TYPE in request.headers.get("accept", "")
+    items = iterate_stream(source, key, limit)
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for item in items:
+                if await request.is_disconnected():
+                    break
+                yield _encode_sse(item) if use_sse else _encode_ndjson(item)
+            else:
+                if use_sse:
+                    yield _encode_sse(None, event="end")
+        except Exception as e:
+            error = {"error": f"Error en la ejecución de la función: {e}"}
+            yield _encode_sse(error, event="error") if use_sse else _encode_ndjson(error)
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(body(), media_type=SSE_MEDIA_TYPE if use_sse else NDJSON_MEDIA_TYPE)
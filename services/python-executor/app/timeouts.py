@@ -0,0 +1,150 @@
+# timeouts.py
+import contextlib
+import ctypes
+import os
+import signal
+import threading
+from typing import Any, Callable, Iterator, Optional
+
+# Tiempo máximo (segundos de pared) de una llamada si ni la petición ni el
+# script indican otro (0 = sin límite).
+SCRIPT_CALL_TIMEOUT = float(os.environ.get("SCRIPT_CALL_TIMEOUT", "30"))
+# Tope para los timeouts pedidos por la petición o declarados por el script (0 = sin tope).
+SCRIPT_CALL_MAX_TIMEOUT = float(os.environ.get("SCRIPT_CALL_MAX_TIMEOUT", "300"))
+# Tiempo de CPU máximo de una llamada (0 = sin límite). Sólo en procesos
+# worker (SCRIPT_EXECUTION_MODE=process y sesiones aisladas).
+SCRIPT_CPU_TIMEOUT = float(os.environ.get("SCRIPT_CPU_TIMEOUT", "0"))
+# Margen para que una llamada interrumpida termine antes de abandonarla
+# (hilos) o de matar el proceso worker.
+SCRIPT_TIMEOUT_GRACE = float(os.environ.get("SCRIPT_TIMEOUT_GRACE", "2"))
+
+
+class CallTimeout(Exception):
+    """
+    La llamada superó su tiempo máximo. 'kind' es "wall" o "cpu".
+    """
+
+    def __init__(self, seconds: Optional[float] = None, kind: str = "wall"):
+        self.seconds = seconds
+        self.kind = kind
+        if seconds is None:
+            message = "La llamada superó su tiempo máximo."
+        elif kind == "cpu":
+            message = f"La llamada superó su tiempo máximo de CPU ({seconds:g}s)."
+        else:
+            message = f"La llamada superó su tiempo máximo ({seconds:g}s)."
+        super().__init__(message)
+
+
+def timeout(seconds: float) -> Callable[[Callable], Callable]:
+    """
+    Declara el tiempo máximo de una función de script. Uso dentro de un script:
+
+        from app.timeouts import timeout
+
+        @timeout(120)
+        def procesar(datos): ...
+
+    Alternativa sin importar nada: declarar en el módulo (o en la clase de
+    un módulo de sesión)
+        __timeouts__ = {"procesar": 120}
+    """
+    def decorate(func: Callable) -> Callable:
+        func.__timeout__ = seconds
+        return func
+    return decorate
+
+
+def declared_timeout(owner: Any, fn_name: str) -> Optional[float]:
+    """
+    Timeout declarado por el script para owner.fn_name (owner es el módulo
+    o la instancia del módulo de sesión), o None.
+    """
+    value = getattr(getattr(owner, fn_name, None), "__timeout__", None)
+    if value is None:
+        declared = getattr(owner, "__timeouts__", None)
+        if isinstance(declared, dict):
+            value = declared.get(fn_name)
+    return float(value) if value is not None else None
+
+
+def resolve_timeout(requested: Optional[float] = None, declared: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout efectivo: el de la petición, si no el del script, si no
+    SCRIPT_CALL_TIMEOUT; acotado por SCRIPT_CALL_MAX_TIMEOUT. None = sin límite.
+    Un 0 de la petición o del script también cuenta: pide no tener límite
+    (salvo el tope SCRIPT_CALL_MAX_TIMEOUT).
+    """
+    value = requested if requested is not None else declared
+    if value is None:
+        return SCRIPT_CALL_TIMEOUT if SCRIPT_CALL_TIMEOUT > 0 else None
+    if value <= 0:
+        return SCRIPT_CALL_MAX_TIMEOUT or None
+    if SCRIPT_CALL_MAX_TIMEOUT:
+        value = min(value, SCRIPT_CALL_MAX_TIMEOUT)
+    return value
+
+
+def worker_deadline(requested: Optional[float] = None) -> Optional[float]:
+    """
+    Límite de pared con el que el padre espera a un proceso worker. El worker
+    aplica el timeout efectivo por su cuenta (conoce el declarado por el
+    script); éste sólo salta si el worker no logra interrumpirse (p.ej. código
+    nativo que no cede) y entonces el worker se mata y se reemplaza.
+    """
+    limit = resolve_timeout(requested) if requested is not None else (SCRIPT_CALL_MAX_TIMEOUT or None)
+    return None if limit is None else limit + SCRIPT_TIMEOUT_GRACE
+
+
+def interrupt_thread(thread_id: int) -> bool:
+    """
+    Lanza CallTimeout en el hilo indicado. Es cooperativo: el hilo la recibe
+    al ejecutar la siguiente instrucción Python (no interrumpe código nativo
+    ni un sleep en curso).
+    """
+    affected = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), ctypes.py_object(CallTimeout))
+    return affected == 1
+
+
+def clear_interrupt(thread_id: int) -> None:
+    """
+    Descarta un CallTimeout pendiente de interrupt_thread que el hilo aún no recibió.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+
+
+@contextlib.contextmanager
+def preempt_after(wall: Optional[float], cpu: Optional[float] = None) -> Iterator[None]:
+    """
+    Interrumpe con CallTimeout el bloque si supera 'wall' segundos de pared
+    o 'cpu' segundos de CPU (SIGALRM/SIGPROF). Sólo en el hilo principal de
+    un proceso worker; en otro caso no hace nada.
+    """
+    if (not wall and not cpu) or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise CallTimeout(wall, "wall")
+
+    def on_cpu(signum, frame):
+        raise CallTimeout(cpu, "cpu")
+
+    # El script podría bloquear las señales; al salir se restaura la máscara.
+    previous_mask = signal.pthread_sigmask(signal.SIG_BLOCK, [])
+    previous_alarm = signal.signal(signal.SIGALRM, on_alarm) if wall else None
+    previous_cpu = signal.signal(signal.SIGPROF, on_cpu) if cpu else None
+    if wall:
+        signal.setitimer(signal.ITIMER_REAL, wall)
+    if cpu:
+        signal.setitimer(signal.ITIMER_PROF, cpu)
+    try:
+        yield
+    finally:
+        signal.pthread_sigmask(signal.SIG_SETMASK, previous_mask)
+        if wall:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_alarm)
+        if cpu:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous_cpu)
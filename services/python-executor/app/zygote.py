@@ -0,0 +1,7 @@
+# zygote.py
+# Se importa en el proceso forkserver (multiprocessing.set_forkserver_preload):
+# los paquetes pesados quedan cargados allí y cada worker se crea con fork()
+# desde ese proceso, compartiendo la memoria por copy-on-write.
+from .preload import PRELOAD_PACKAGES, preload_packages
+
+preload_packages(PRELOAD_PACKAGES)
@@ -0,0 +1,3 @@
+"""
+Benchmarks de los endpoints del executor (ver run.py).
+"""
@@ -0,0 +1,76 @@
+# compare.py
+"""
+Compara dos archivos de resultados de benchmarks.run:
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+
+Termina con código 1 si algún escenario empeora más que el umbral (en %)
+en throughput o en p95/p99.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+Key = Tuple[str, str, int]
+
+
+def _index(report: Dict[str, Any]) -> Dict[Key, Dict[str, Any]]:
+    return {(r["target"], r["scenario"], r["concurrency"]): r for r in report["results"]}
+
+
+def _change(old: float, new: float) -> float:
+    return (new - old) / old * 100.0 if old else 0.0
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold: float) -> Tuple[List[str], bool]:
+    """
+    Retorna las líneas de la tabla comparativa y si hubo regresiones.
+    """
+    old_results = _index(baseline)
+    new_results = _index(candidate)
+    lines = [
+        f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')}",
+        f"{'target':9} {'scenario':26} {'c':>4} {'rps':>17} {'p95 ms':>17} {'p99 ms':>17}",
+    ]
+    regressed = False
+    for key in sorted(old_results.keys() & new_results.keys()):
+        old, new = old_results[key], new_results[key]
+        rps = _change(old["throughput_rps"], new["throughput_rps"])
+        p95 = _change(old["p95_ms"], new["p95_ms"])
+        p99 = _change(old["p99_ms"], new["p99_ms"])
+        worse = rps < -threshold or p95 > threshold or p99 > threshold
+        regressed = regressed or worse
+        lines.append(
+            f"{key[0]:9} {key[1]:26} {key[2]:>4} "
+            f"{new['throughput_rps']:>9.1f} ({rps:+6.1f}%) "
+            f"{new['p95_ms']:>8.2f} ({p95:+6.1f}%) "
+            f"{new['p99_ms']:>8.2f} ({p99:+6.1f}%)"
+            + ("  <-- regresión" if worse else "")
+        )
+    for key in sorted(old_results.keys() - new_results.keys()):
+        lines.append(f"{key[0]:9} {key[1]:26} {key[2]:>4} (sólo en la línea base)")
+    for key in sorted(new_results.keys() - old_results.keys()):
+        lines.append(f"{key[0]:9} {key[1]:26} {key[2]:>4} (nuevo)")
+    return lines, regressed
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compara resultados de benchmarks")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regresión tolerada en %%")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    lines, regressed = compare(baseline, candidate, args.threshold)
+    print("\n".join(lines))
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
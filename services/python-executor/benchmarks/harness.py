@@ -0,0 +1,141 @@
+# harness.py
+import asyncio
+import contextlib
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+import httpx
+
+# Directorio del servicio (donde viven app/ y requirements.txt).
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Percentil p (0..100) por interpolación lineal sobre valores ya ordenados.
+    """
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lower = math.floor(k)
+    upper = math.ceil(k)
+    if lower == upper:
+        return sorted_values[int(k)]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """
+    Throughput y percentiles (en ms) de una ejecución.
+    """
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+async def run_load(
+    send: Callable[[int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """
+    Lanza 'total' peticiones send(i) manteniendo 'concurrency' en vuelo.
+    Una respuesta con código >= 400 o una excepción cuentan como error.
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def client_loop() -> None:
+        nonlocal next_index, errors
+        while next_index < total:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await send(index)
+                if response.status_code >= 400:
+                    errors += 1
+                # Los streams se consumen completos antes de medir.
+                await response.aread()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(max(1, concurrency))))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+@contextlib.asynccontextmanager
+async def in_process_client(app: Any) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Cliente httpx que llama a la app ASGI directamente (sin red), con los
+    eventos de startup/shutdown de la app.
+    """
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+            yield client
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.asynccontextmanager
+async def uvicorn_client(
+    app_path: str, env: Dict[str, str], startup_timeout: float = 60.0
+) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Arranca 'uvicorn <app_path>' en un puerto libre y retorna un cliente
+    httpx contra él. El servidor se detiene al salir.
+    """
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SERVICE_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=512, max_keepalive_connections=512)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+            deadline = time.monotonic() + startup_timeout
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn {app_path} terminó al arrancar (código {process.returncode})")
+                try:
+                    await client.get("/dispatcher-stats/")
+                    break
+                except httpx.TransportError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"uvicorn {app_path} no respondió en {startup_timeout}s")
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
@@ -0,0 +1,124 @@
+# run.py
+"""
+Benchmarks de los endpoints del executor.
+
+Uso (desde services/python-executor):
+
+    python -m benchmarks.run --target inprocess --concurrency 1,8,32 --requests 500
+    python -m benchmarks.run --target uvicorn --scenarios call_script execute -o results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from .harness import SERVICE_DIR, in_process_client, run_load, uvicorn_client
+from .scenarios import SCENARIOS, select
+
+APP_PATHS = {"func": "app.main_func:app", "session": "app.main:app"}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def _load_app(kind: str) -> Any:
+    if SERVICE_DIR not in sys.path:
+        sys.path.insert(0, SERVICE_DIR)
+    if kind == "func":
+        from app.main_func import app
+    else:
+        from app.main import app
+    return app
+
+
+async def run_target(
+    target: str, scenario_names: List[str], concurrencies: List[int], requests: int, warmup: int
+) -> List[Dict[str, Any]]:
+    results = []
+    for kind in ("func", "session"):
+        names = [name for name in scenario_names if SCENARIOS[name][0] == kind]
+        if not names:
+            continue
+        if target == "inprocess":
+            client_cm = in_process_client(_load_app(kind))
+        else:
+            client_cm = uvicorn_client(APP_PATHS[kind], env={})
+        async with client_cm as client:
+            for name in names:
+                setup = SCENARIOS[name][1]
+                for concurrency in concurrencies:
+                    send = await setup(client)
+                    if warmup:
+                        await run_load(send, warmup, concurrency)
+                    summary = await run_load(send, requests, concurrency)
+                    result = {"scenario": name, "target": target, "concurrency": concurrency, **summary}
+                    results.append(result)
+                    print(
+                        f"{target:9} {name:26} c={concurrency:<4} "
+                        f"{summary['throughput_rps']:>9.1f} req/s  p50={summary['p50_ms']:.2f}ms "
+                        f"p95={summary['p95_ms']:.2f}ms p99={summary['p99_ms']:.2f}ms errors={summary['errors']}",
+                        flush=True,
+                    )
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de app.main y app.main_func")
+    parser.add_argument("--target", choices=["inprocess", "uvicorn", "both"], default="inprocess")
+    parser.add_argument("--scenarios", nargs="*", default=[], help="Filtra escenarios por subcadena")
+    parser.add_argument("--concurrency", default="1,8,32", help="Niveles de concurrencia separados por comas")
+    parser.add_argument("--requests", type=int, default=300, help="Peticiones medidas por escenario y nivel")
+    parser.add_argument("--warmup", type=int, default=20, help="Peticiones previas no medidas")
+    parser.add_argument("-o", "--output", default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--list", action="store_true", help="Lista los escenarios y sale")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (kind, _) in SCENARIOS.items():
+            print(f"{name:26} {APP_PATHS[kind]}")
+        return 0
+
+    scenario_names = select(args.scenarios)
+    concurrencies = [int(c) for c in args.concurrency.split(",") if c]
+    targets = ["inprocess", "uvicorn"] if args.target == "both" else [args.target]
+
+    # Las apps escriben logs y módulos relativos al directorio del servicio.
+    os.chdir(SERVICE_DIR)
+    results: List[Dict[str, Any]] = []
+    for target in targets:
+        results.extend(asyncio.run(run_target(target, scenario_names, concurrencies, args.requests, args.warmup)))
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("SCRIPT_", "DISPATCH_", "PROCESS_", "SESSION_"))},
+        },
+        "results": results,
+    }
+    output = args.output or f"benchmarks/results-{report['meta']['commit']}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# scenarios.py
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+# Cada escenario prepara su estado con setup(client) y retorna send(i), la
+# función que emite la petición i-ésima. 'app' indica qué aplicación usa:
+#   "func"    -> app.main_func:app (scripts: /upload-script/, /call-script/)
+#   "session" -> app.main:app      (sesiones y /run-script/)
+
+SMALL_SCRIPT = '''
+def echo(value):
+    return value
+
+async def aecho(value):
+    return value
+
+def work(n: int):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+'''
+
+MODULE_TEMPLATE = '''
+class Bench{index}:
+    def echo(self, value):
+        return value
+
+    async def aecho(self, value):
+        return value
+'''
+
+SMALL_PAYLOAD = {"value": "x" * 64}
+LARGE_PAYLOAD = {"value": ["x" * 1024] * 512}  # ~0.5 MB en JSON
+
+_unique = itertools.count()
+
+
+def unique_script(base: str = SMALL_SCRIPT) -> str:
+    """
+    Script distinto en cada llamada (otro hash): fuerza una carga en frío.
+    """
+    return f"{base}\n# bench-{next(_unique)}\n"
+
+
+Send = Callable[[int], Awaitable[httpx.Response]]
+
+
+# ---------- app.main_func ----------
+
+async def upload_cold(client: httpx.AsyncClient) -> Send:
+    async def send(i: int) -> httpx.Response:
+        return await client.post("/upload-script/", json={"script": unique_script()})
+    return send
+
+
+async def upload_warm(client: httpx.AsyncClient) -> Send:
+    script = unique_script()
+
+    async def send(i: int) -> httpx.Response:
+        return await client.post("/upload-script/", json={"script": script})
+    return send
+
+
+async def _uploaded(client: httpx.AsyncClient) -> str:
+    response = await client.post("/upload-script/", json={"script": unique_script()})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def call_cold(client: httpx.AsyncClient) -> Send:
+    # Cada petición sube un script nuevo y lo llama por primera vez
+    # (subida + compilación + carga + ejecución).
+    async def send(i: int) -> httpx.Response:
+        script_id = await _uploaded(client)
+        return await client.post(
+            "/call-script/", json={"id": script_id, "function_name": "echo", "params": SMALL_PAYLOAD}
+        )
+    return send
+
+
+def _call(function_name: str, params: Dict[str, Any]) -> Callable[[httpx.AsyncClient], Awaitable[Send]]:
+    async def setup(client: httpx.AsyncClient) -> Send:
+        script_id = await _uploaded(client)
+        body = {"id": script_id, "function_name": function_name, "params": params}
+
+        async def send(i: int) -> httpx.Response:
+            return await client.post("/call-script/", json=body)
+        return send
+    return setup
+
+
+# ---------- app.main ----------
+
+async def run_script(client: httpx.AsyncClient) -> Send:
+    script = "def main(value):\n    return value\n"
+
+    async def send(i: int) -> httpx.Response:
+        return await client.post("/run-script/", json={"script": script, "payload": SMALL_PAYLOAD})
+    return send
+
+
+async def _session(client: httpx.AsyncClient, modules: int = 4) -> str:
+    session_id = (await client.post("/start-session/", json={})).json()["session_id"]
+    files = [{"name": f"bench{i}", "files": {"main.py": MODULE_TEMPLATE.format(index=i)}} for i in range(modules)]
+    response = await client.post(f"/upload-modules/{session_id}/", json={"modules": files})
+    response.raise_for_status()
+    return session_id
+
+
+async def upload_modules_cold(client: httpx.AsyncClient) -> Send:
+    async def send(i: int) -> httpx.Response:
+        session_id = (await client.post("/start-session/", json={})).json()["session_id"]
+        files = [{"name": "bench", "files": {"main.py": MODULE_TEMPLATE.format(index=i)}}]
+        return await client.post(f"/upload-modules/{session_id}/", json={"modules": files})
+    return send
+
+
+async def upload_modules_warm(client: httpx.AsyncClient) -> Send:
+    # Misma subida repetida sobre la misma sesión (sin cambios).
+    session_id = await _session(client)
+    files = [{"name": f"bench{i}", "files": {"main.py": MODULE_TEMPLATE.format(index=i)}} for i in range(4)]
+
+    async def send(i: int) -> httpx.Response:
+        return await client.post(f"/upload-modules/{session_id}/", json={"modules": files})
+    return send
+
+
+def _execute(function: str, params: Dict[str, Any]) -> Callable[[httpx.AsyncClient], Awaitable[Send]]:
+    async def setup(client: httpx.AsyncClient) -> Send:
+        session_id = await _session(client)
+        body = {"function": function, "params": params}
+
+        async def send(i: int) -> httpx.Response:
+            return await client.post(f"/execute/{session_id}/", json=body)
+        return send
+    return setup
+
+
+# nombre -> (app, setup)
+SCENARIOS: Dict[str, Any] = {
+    "upload_script_cold": ("func", upload_cold),
+    "upload_script_warm": ("func", upload_warm),
+    "call_script_cold": ("func", call_cold),
+    "call_script_sync_small": ("func", _call("echo", SMALL_PAYLOAD)),
+    "call_script_async_small": ("func", _call("aecho", SMALL_PAYLOAD)),
+    "call_script_sync_large": ("func", _call("echo", LARGE_PAYLOAD)),
+    "call_script_cpu": ("func", _call("work", {"n": 20000})),
+    "run_script": ("session", run_script),
+    "upload_modules_cold": ("session", upload_modules_cold),
+    "upload_modules_warm": ("session", upload_modules_warm),
+    "execute_sync_small": ("session", _execute("echo", SMALL_PAYLOAD)),
+    "execute_async_small": ("session", _execute("aecho", SMALL_PAYLOAD)),
+    "execute_sync_large": ("session", _execute("echo", LARGE_PAYLOAD)),
+}
+
+
+def select(patterns: List[str]) -> List[str]:
+    """
+    Escenarios cuyo nombre contiene alguno de los patrones (todos si no hay).
+    """
+    if not patterns:
+        return list(SCENARIOS)
+    return [name for name in SCENARIOS if any(p in name for p in patterns)]
@@ -0,0 +1,69 @@
+# conftest.py
+import os
+import sys
+import tempfile
+from typing import AsyncIterator
+
+import httpx
+import pytest
+
+# Directorio del servicio (donde viven app/ y requirements.txt).
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+# Los módulos de app leen su configuración al importarse: los blobs y el
+# estado de las sesiones de los tests van a un directorio temporal.
+_STATE_DIR = tempfile.mkdtemp(prefix="python-executor-tests-")
+os.environ.setdefault("BLOB_STORE_DIR", os.path.join(_STATE_DIR, "blobs"))
+os.environ.setdefault("SESSION_SPILL_DIR", os.path.join(_STATE_DIR, "session_state"))
+
+
+@pytest.fixture(scope="session")
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+async def _client_for(app) -> AsyncIterator[httpx.AsyncClient]:
+    # Cliente ASGI en el mismo event loop que los tests (las llamadas
+    # concurrentes comparten el dispatcher, como en el servidor). El lifespan
+    # de cada app corre una vez por sesión de tests, como en un proceso real.
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            yield client
+
+
+@pytest.fixture(scope="session")
+async def session_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Cliente de app.main (sesiones).
+    """
+    from app.main import app
+
+    async for client in _client_for(app):
+        yield client
+
+
+@pytest.fixture(scope="session")
+async def script_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Cliente de app.main_func (scripts).
+    """
+    from app.main_func import app
+
+    async for client in _client_for(app):
+        yield client
+
+
+async def start_session(client: httpx.AsyncClient, modules: dict) -> str:
+    """
+    Abre una sesión y sube los módulos {nombre: contenido de main.py}.
+    """
+    response = await client.post("/start-session/", json={})
+    assert response.status_code == 200, response.text
+    session_id = response.json()["session_id"]
+    payload = {"modules": [{"name": name, "files": {"main.py": source}} for name, source in modules.items()]}
+    response = await client.post(f"/upload-modules/{session_id}/", json=payload)
+    assert response.status_code == 200, response.text
+    return session_id
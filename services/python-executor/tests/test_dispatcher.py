@@ -0,0 +1,110 @@
+# test_dispatcher.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.dispatcher import CallDispatcher
+from conftest import start_session
+
+pytestmark = pytest.mark.anyio
+
+# Módulo de sesión que mide cuántas de sus llamadas se solapan.
+CONCURRENCY_MODULE = '''
+import threading
+import time
+
+
+class Probe:
+    def onLoad(self):
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def _enter(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def _leave(self):
+        with self.lock:
+            self.current -= 1
+
+    def work(self):
+        self._enter()
+        time.sleep(0.02)
+        self._leave()
+        return 1
+
+    def chunks(self, n: int):
+        for i in range(n):
+            self._enter()
+            time.sleep(0.02)
+            self._leave()
+            yield i
+
+    def peak_seen(self):
+        return self.peak
+'''
+
+
+class _Peak:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, seconds: float) -> None:
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(seconds)
+        with self.lock:
+            self.current -= 1
+
+
+async def test_limit_per_key():
+    dispatcher = CallDispatcher(max_workers=8)
+    probe = _Peak()
+    await asyncio.gather(*(dispatcher.dispatch("k", probe, {"seconds": 0.02}, limit=2) for _ in range(6)))
+    assert probe.peak == 2
+    # La clave se olvida al terminar su última llamada.
+    assert dispatcher._semaphores == {}
+
+
+async def test_keys_do_not_share_limit():
+    dispatcher = CallDispatcher(max_workers=8)
+    probe = _Peak()
+    await asyncio.gather(*(dispatcher.dispatch(f"k{i}", probe, {"seconds": 0.05}, limit=1) for i in range(3)))
+    assert probe.peak == 3
+
+
+async def test_mismatched_limit_is_rejected():
+    dispatcher = CallDispatcher(max_workers=4)
+    running = asyncio.ensure_future(dispatcher.dispatch("k", _Peak(), {"seconds": 0.1}, limit=1))
+    await asyncio.sleep(0.01)
+    with pytest.raises(ValueError):
+        await dispatcher.dispatch("k", _Peak(), {"seconds": 0}, limit=2)
+    await running
+    assert dispatcher.queued == 0
+    # Sin llamadas en curso, la clave admite otro límite.
+    await dispatcher.dispatch("k", _Peak(), {"seconds": 0}, limit=2)
+
+
+async def test_session_calls_and_streams_share_module_limit(session_client):
+    # SESSION_CALL_CONCURRENCY=1: ni las llamadas ni los next() de los
+    # generadores de un mismo módulo se solapan.
+    session_id = await start_session(session_client, {"probe": CONCURRENCY_MODULE})
+
+    def execute(function, params):
+        return session_client.post(f"/execute/{session_id}/", json={"function": function, "params": params})
+
+    responses = await asyncio.gather(
+        *(execute("chunks", {"n": 4}) for _ in range(3)),
+        *(execute("work", {}) for _ in range(3)),
+    )
+    assert [r.status_code for r in responses] == [200] * 6
+    assert responses[0].text.split() == ["0", "1", "2", "3"]
+    assert (await execute("peak_seen", {})).json() == {"result": 1}
+    await session_client.post(f"/close-session/{session_id}/", json={})
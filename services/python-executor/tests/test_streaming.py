@@ -0,0 +1,97 @@
+# test_streaming.py
+import json
+
+import pytest
+
+from conftest import start_session
+
+pytestmark = pytest.mark.anyio
+
+STREAM_MODULE = '''
+class Counter:
+    def count(self, n: int):
+        for i in range(n):
+            yield {"i": i}
+
+    async def acount(self, n: int):
+        for i in range(n):
+            yield i
+
+    def broken(self):
+        yield 1
+        raise RuntimeError("boom")
+'''
+
+STREAM_SCRIPT = '''
+def count(n: int):
+    for i in range(n):
+        yield i
+
+
+def main(n: int):
+    for i in range(n):
+        yield i * 10
+'''
+
+
+def _ndjson(text: str):
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+async def test_session_generator_streams_ndjson(session_client):
+    session_id = await start_session(session_client, {"counter": STREAM_MODULE})
+    for function in ("count", "acount"):
+        response = await session_client.post(
+            f"/execute/{session_id}/", json={"function": function, "params": {"n": 3}}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        expected = [{"i": 0}, {"i": 1}, {"i": 2}] if function == "count" else [0, 1, 2]
+        assert _ndjson(response.text) == expected
+    await session_client.post(f"/close-session/{session_id}/", json={})
+
+
+async def test_session_generator_streams_sse(session_client):
+    session_id = await start_session(session_client, {"counter": STREAM_MODULE})
+    response = await session_client.post(
+        f"/execute/{session_id}/",
+        json={"function": "count", "params": {"n": 2}},
+        headers={"Accept": "text/event-stream"},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events == ['data: {"i":0}', 'data: {"i":1}', "event: end\ndata: null"]
+    await session_client.post(f"/close-session/{session_id}/", json={})
+
+
+async def test_stream_error_is_the_last_chunk(session_client):
+    session_id = await start_session(session_client, {"counter": STREAM_MODULE})
+    response = await session_client.post(f"/execute/{session_id}/", json={"function": "broken", "params": {}})
+    chunks = _ndjson(response.text)
+    assert chunks[0] == 1
+    assert "boom" in chunks[-1]["error"]
+    await session_client.post(f"/close-session/{session_id}/", json={})
+
+
+async def test_batch_collects_generators(session_client):
+    session_id = await start_session(session_client, {"counter": STREAM_MODULE})
+    response = await session_client.post(
+        f"/execute-batch/{session_id}/",
+        json=[{"function": "count", "params": {"n": 2}}, {"function": "acount", "params": {"n": 2}}],
+    )
+    assert response.json() == [{"result": [{"i": 0}, {"i": 1}]}, {"result": [0, 1]}]
+    await session_client.post(f"/close-session/{session_id}/", json={})
+
+
+async def test_run_script_collects_generator(session_client):
+    response = await session_client.post("/run-script/", json={"script": STREAM_SCRIPT, "payload": {"n": 3}})
+    assert response.status_code == 200
+    assert response.json()["result"] == [0, 10, 20]
+
+
+async def test_call_script_streams(script_client):
+    script_id = (await script_client.post("/upload-script/", json={"script": STREAM_SCRIPT})).json()["id"]
+    response = await script_client.post(
+        "/call-script/", json={"id": script_id, "function_name": "count", "params": {"n": 3}}
+    )
+    assert _ndjson(response.text) == [0, 1, 2]
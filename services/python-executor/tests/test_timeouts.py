@@ -0,0 +1,96 @@
+# test_timeouts.py
+import pytest
+
+from app import timeouts
+from app.timeouts import resolve_timeout
+from conftest import start_session
+
+pytestmark = pytest.mark.anyio
+
+SLOW_MODULE = '''
+import time
+
+
+class Slow:
+    def spin(self, seconds: float):
+        # Bucle Python: la interrupción del dispatcher lo corta.
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            pass
+        return "done"
+
+    async def nap(self, seconds: float):
+        import asyncio
+        await asyncio.sleep(seconds)
+        return "done"
+'''
+
+SLOW_SCRIPT = '''
+import time
+
+
+def spin(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return "done"
+
+
+def main(seconds: float):
+    return spin(seconds)
+'''
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(timeouts, "SCRIPT_CALL_TIMEOUT", 30.0)
+    monkeypatch.setattr(timeouts, "SCRIPT_CALL_MAX_TIMEOUT", 300.0)
+
+
+def test_resolve_timeout_precedence(limits):
+    assert resolve_timeout() == 30.0
+    assert resolve_timeout(None, 5) == 5
+    assert resolve_timeout(2, 5) == 2
+    assert resolve_timeout(1000) == 300.0
+
+
+def test_resolve_timeout_zero_means_no_limit(limits, monkeypatch):
+    # Un 0 explícito no cae al declarado ni al de por defecto: sin límite (hasta el tope).
+    assert resolve_timeout(0, 5) == 300.0
+    assert resolve_timeout(None, 0) == 300.0
+    monkeypatch.setattr(timeouts, "SCRIPT_CALL_MAX_TIMEOUT", 0.0)
+    assert resolve_timeout(0) is None
+    monkeypatch.setattr(timeouts, "SCRIPT_CALL_TIMEOUT", 0.0)
+    assert resolve_timeout() is None
+
+
+async def test_session_call_timeout(session_client):
+    session_id = await start_session(session_client, {"slow": SLOW_MODULE})
+    for function in ("spin", "nap"):
+        response = await session_client.post(
+            f"/execute/{session_id}/", json={"function": function, "params": {"seconds": 5}, "timeout": 0.2}
+        )
+        body = response.json()
+        assert body["error_code"] == "timeout", body
+    # La instancia sigue atendiendo llamadas tras el timeout.
+    response = await session_client.post(
+        f"/execute/{session_id}/", json={"function": "spin", "params": {"seconds": 0}, "timeout": 1}
+    )
+    assert response.json() == {"result": "done"}
+    await session_client.post(f"/close-session/{session_id}/", json={})
+
+
+async def test_call_script_timeout(script_client):
+    script_id = (await script_client.post("/upload-script/", json={"script": SLOW_SCRIPT})).json()["id"]
+    response = await script_client.post(
+        "/call-script/",
+        json={"id": script_id, "function_name": "spin", "params": {"seconds": 5}, "timeout": 0.2},
+    )
+    assert response.status_code == 504
+
+
+async def test_run_script_timeout(session_client):
+    response = await session_client.post(
+        "/run-script/", json={"script": SLOW_SCRIPT, "payload": {"seconds": 5}, "timeout": 0.2}
+    )
+    assert response.status_code == 504